@@ -1,10 +1,27 @@
 from functools import wraps
+from inspect import iscoroutinefunction
 from django.shortcuts import redirect
 from django.contrib.auth.decorators import login_required
 
 
 def role_required(allowed_roles):
     def decorator(view_func):
+
+        if iscoroutinefunction(view_func):
+
+            @wraps(view_func)
+            @login_required(login_url='login')
+            async def _async_view(request, *args, **kwargs):
+                user = await request.auser()
+                user_role = getattr(user, "role", None)
+
+                if user_role in allowed_roles:
+                    return await view_func(request, *args, **kwargs)
+
+                return redirect('dashboard')
+
+            return _async_view
+
         @wraps(view_func)
         @login_required(login_url='login')
         def _wrapped_view(request, *args, **kwargs):
@@ -16,4 +33,4 @@ def role_required(allowed_roles):
             return redirect('dashboard')
 
         return _wrapped_view
-    return decorator
\ No newline at end of file
+    return decorator
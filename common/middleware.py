@@ -0,0 +1,193 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+
+logger = logging.getLogger("common.queries")
+
+# queries a view may run when QUERY_BUDGETS names no budget for it
+DEFAULT_BUDGET = 50
+
+# one SQL shape run this many times in a request is reported as an N+1
+DEFAULT_REPEAT_LIMIT = 10
+
+_IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+_SPACE = re.compile(r"\s+")
+
+
+def sql_shape(sql):
+    """
+    The SQL with IN lists of any length folded, so the same query for
+    different rows counts as one shape.
+    """
+
+    return _IN_LIST.sub("IN (...)", _SPACE.sub(" ", sql)).strip()
+
+
+class QueryRecorder:
+    """
+    Queries of one request: how many, their time and how often each SQL
+    shape ran.
+    """
+
+    def __init__(self):
+
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def add(self, sql, seconds):
+
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[sql_shape(sql)] += 1
+
+    def repeated(self, limit):
+        """
+        ``[(shape, times), ...]`` of the shapes run at least ``limit`` times.
+        """
+
+        return [
+            (shape, times) for shape, times in self.shapes.most_common()
+            if times >= limit
+        ]
+
+
+# recorder of the request being served; context variables follow the
+# request into the threads async views run their ORM calls on
+_recorder = ContextVar("query_recorder", default=None)
+
+
+def _record(execute, sql, params, many, context):
+
+    recorder = _recorder.get()
+
+    if recorder is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.add(sql, time.perf_counter() - started)
+
+
+def _install(connection, **kwargs):
+
+    # first, so execute_wrapper() blocks, which pop the last one, keep it
+    if _record not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record)
+
+
+connection_created.connect(_install)
+
+
+class QueryBudgetMiddleware:
+    """
+    Count the queries and database time of every request, log the views
+    over their budget or repeating one SQL shape, and with DEBUG on add
+    the numbers as ``X-Query-*`` response headers.
+
+    Budgets: ``QUERY_BUDGETS`` maps URL names or dotted view paths to a
+    query count, ``QUERY_BUDGET_DEFAULT`` covers the rest and
+    ``QUERY_REPEAT_LIMIT`` is the N+1 threshold.
+
+    Queries made while a streamed response is sent, such as the rows of
+    an export, come after the response is returned and are not counted.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+
+        self.get_response = get_response
+        self.budgets = getattr(settings, "QUERY_BUDGETS", {})
+        self.default_budget = getattr(settings, "QUERY_BUDGET_DEFAULT", DEFAULT_BUDGET)
+        self.repeat_limit = getattr(settings, "QUERY_REPEAT_LIMIT", DEFAULT_REPEAT_LIMIT)
+
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        for connection in connections.all(initialized_only=True):
+            _install(connection)
+
+        recorder = QueryRecorder()
+        token = _recorder.set(recorder)
+
+        try:
+            response = self.get_response(request)
+        finally:
+            _recorder.reset(token)
+
+        self.report(request, response, recorder)
+
+        return response
+
+    async def __acall__(self, request):
+
+        recorder = QueryRecorder()
+        token = _recorder.set(recorder)
+
+        try:
+            response = await self.get_response(request)
+        finally:
+            _recorder.reset(token)
+
+        self.report(request, response, recorder)
+
+        return response
+
+    # ================= BUDGET =================
+    def budget_for(self, match):
+
+        if match is None:
+            return self.default_budget
+
+        for key in (match.view_name, match._func_path):
+
+            if key in self.budgets:
+                return self.budgets[key]
+
+        return self.default_budget
+
+    def report(self, request, response, recorder):
+
+        match = request.resolver_match
+        view = match.view_name if match else request.path
+        budget = self.budget_for(match)
+        repeated = recorder.repeated(self.repeat_limit)
+
+        if recorder.count > budget:
+            logger.warning(
+                "%s ran %d queries (budget %d) in %.1f ms: %s",
+                view, recorder.count, budget, recorder.seconds * 1000,
+                request.get_full_path(),
+            )
+
+        for shape, times in repeated:
+            logger.warning(
+                "%s ran the same query %d times, likely an N+1: %s",
+                view, times, shape[:300],
+            )
+
+        if settings.DEBUG:
+            response["X-Query-Count"] = str(recorder.count)
+            response["X-Query-Time"] = f"{recorder.seconds * 1000:.1f}"
+            response["X-Query-Budget"] = str(budget)
+            response["X-Query-Repeats"] = str(
+                recorder.shapes.most_common(1)[0][1] if recorder.shapes else 0
+            )
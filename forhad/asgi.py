@@ -2,6 +2,9 @@
 ASGI config for forhad project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+The live row events of the list pages (installation/live.py) hold their
+connection open and are only served through this application, with
+SERVED_OVER_ASGI set.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
@@ -14,3 +17,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'forhad.settings')
 
 application = get_asgi_application()
+
+
+# build the per-worker typeahead indexes before the first keystroke
+from installation.autocomplete import warm_up  # noqa: E402
+
+warm_up()
@@ -43,12 +43,15 @@ INSTALLED_APPS = [
     'entry',
     'ITCD',
     'ittask',
-    'camera_app'
+    'camera_app',
+    'installation',
     
 
 ]
 
 MIDDLEWARE = [
+    # first, so the session and auth queries of a request count too
+    'common.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,6 +61,18 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Query budgets (common/middleware.py): views running more queries, or
+# one query QUERY_REPEAT_LIMIT times (an N+1 loop), are logged. Keys are
+# URL names or dotted view paths.
+QUERY_BUDGET_DEFAULT = 50
+QUERY_REPEAT_LIMIT = 10
+QUERY_BUDGETS = {
+    'installation_list': 15,
+    'p4_display_list': 15,
+    'p8_display_list': 15,
+    'p9_display_list': 15,
+}
+
 ROOT_URLCONF = 'forhad.urls'
 
 TEMPLATES = [
@@ -77,6 +92,11 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'forhad.wsgi.application'
 
+# Set to True when the site runs under an ASGI server (forhad/asgi.py).
+# Only then do the list pages open the live row events, a stream that
+# stays open per tab; under WSGI each one would hold a worker thread.
+SERVED_OVER_ASGI = False
+
 
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
@@ -93,6 +113,28 @@ DATABASES = {
 }
 
 
+# Installation search needs the pg_trgm extension (installation migration
+# 0012 fails without it). Set to True to migrate anyway and live with
+# sequential scans; the installation.W001 check then reports it.
+SEARCH_TRIGRAM_OPTIONAL = False
+
+
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+#
+# Shared by every worker: the typeahead indexes and the cached dashboard
+# fragments are invalidated through version keys kept here, which a
+# per-process cache would hide from the other workers. Create the table
+# with ``python manage.py createcachetable``.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'installation_cache',
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
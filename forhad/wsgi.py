@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'forhad.settings')
 
 application = get_wsgi_application()
+
+
+# build the per-worker typeahead indexes before the first keystroke
+from installation.autocomplete import warm_up  # noqa: E402
+
+warm_up()
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class InstallationConfig(AppConfig):
     name = 'installation'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
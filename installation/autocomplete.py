@@ -0,0 +1,404 @@
+import bisect
+import heapq
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.db import DatabaseError
+from django.db.models import Max
+
+from .caching import append_log, bump_version, get_version, log_head, read_log, shared_cache
+from .models import Installation, P4ID, P8ID
+from .search import suggest_codes
+
+
+logger = logging.getLogger(__name__)
+
+GRAM_SIZE = 3
+
+# seconds a lookup trusts the index without asking the cache whether
+# another worker changed it; writes of this worker are immediate
+VERSION_RECHECK = 1.0
+
+# seconds the index trusts its version before also comparing the table's
+# newest updated_at with the one it has seen; this catches writes whose
+# row change never arrived (an evicted key, a worker killed between
+# commit and append). With a per-process cache the versions say nothing
+# about the other workers, so every lookup checks.
+INDEX_RECHECK = 30.0
+
+# row changes replayed from the log before a rebuild is cheaper
+DELTA_LIMIT = 200
+
+# seconds a lookup waits for the index lock; a rebuild takes longer, and
+# the lookup is answered from the database instead
+LOCK_WAIT = 0.1
+
+
+def _grams(text):
+
+    return {
+        text[i:i + GRAM_SIZE]
+        for i in range(len(text) - GRAM_SIZE + 1)
+    }
+
+
+class AutocompleteIndex:
+    """
+    Per-worker typeahead index over one code column.
+
+    Keeps a sorted ``(key, id)`` array for prefix lookups and a trigram
+    map for substring lookups, with the JSON payload of every row. The
+    index is built lazily and patched in place by the model signals;
+    each patch is also appended to a change log in the cache, which the
+    other workers replay. They rebuild only when the cache version moves
+    (bulk writes), the log has gaps, or the table no longer matches the
+    index. Lookups the index cannot vouch for are answered from the
+    database.
+    """
+
+    def __init__(self, name, model, key_field, fields):
+
+        self.name = name
+        self.model = model
+        self.key_field = key_field
+        self.fields = fields
+
+        self._lock = threading.RLock()
+        self._version = None
+        self._seq = 0
+        self._checked = 0.0
+        self._stamp = None
+        self._stamped = 0.0
+
+        self._entries = {}
+        self._sorted = []
+        self._grams = {}
+
+    @property
+    def namespace(self):
+
+        return f"autocomplete:{self.name}"
+
+    # ================= BUILD =================
+    def _row(self, values):
+
+        key = (values[self.key_field] or "").lower()
+        payload = {field: values[field] for field in self.fields}
+
+        return key, payload
+
+    def _table_stamp(self):
+
+        return self.model.objects.aggregate(newest=Max("updated_at"))["newest"]
+
+    def build(self):
+
+        with self._lock:
+
+            # read before the rows, so a write landing in between is
+            # replayed from the log rather than missed
+            version = get_version(self.namespace)
+            seq = log_head(self.namespace, version) if shared_cache() else 0
+            stamp = self._table_stamp()
+            now = time.monotonic()
+
+            # a build that fails half way must not pass for current
+            self._version = None
+            self._entries = {}
+            self._grams = {}
+
+            for values in self.model.objects.values(*self.fields).iterator():
+                self._add(values["id"], *self._row(values))
+
+            self._sorted = sorted(
+                (key, pk) for pk, (key, payload) in self._entries.items()
+            )
+
+            self._version = version
+            self._seq = seq
+            self._stamp = stamp
+            self._stamped = now
+            self._checked = now
+
+    def _catch_up(self):
+
+        entries = read_log(self.namespace, self._version, self._seq, DELTA_LIMIT)
+
+        if entries is None:
+            return False
+
+        for entry in entries:
+            self._apply(entry)
+
+        self._seq += len(entries)
+
+        return True
+
+    def _is_current(self):
+
+        if self._version is None:
+            return False
+
+        now = time.monotonic()
+
+        if shared_cache() and now - self._checked >= VERSION_RECHECK:
+
+            if not self._catch_up():
+                return False
+
+            self._checked = now
+
+        if not shared_cache() or now - self._stamped >= INDEX_RECHECK:
+
+            if self._table_stamp() != self._stamp:
+                return False
+
+            self._stamped = now
+
+        return True
+
+    # ================= PATCH =================
+    def _add(self, pk, key, payload):
+
+        self._entries[pk] = (key, payload)
+
+        for gram in _grams(key):
+            self._grams.setdefault(gram, set()).add(pk)
+
+    def _discard(self, pk):
+
+        entry = self._entries.pop(pk, None)
+
+        if entry is None:
+            return
+
+        key = entry[0]
+
+        for gram in _grams(key):
+
+            ids = self._grams.get(gram)
+
+            if ids is not None:
+                ids.discard(pk)
+
+                if not ids:
+                    del self._grams[gram]
+
+        i = bisect.bisect_left(self._sorted, (key, pk))
+
+        if i < len(self._sorted) and self._sorted[i] == (key, pk):
+            del self._sorted[i]
+
+    def _apply(self, delta):
+
+        # (pk, key, payload, updated_at); a removed row has no key
+        pk, key, payload, stamp = delta
+
+        self._discard(pk)
+
+        if key is not None:
+            self._add(pk, key, payload)
+            bisect.insort(self._sorted, (key, pk))
+
+        if stamp is not None and (self._stamp is None or stamp > self._stamp):
+            self._stamp = stamp
+
+    def _publish(self, delta):
+
+        if not shared_cache():
+
+            if self._version is not None:
+                self._apply(delta)
+
+            return
+
+        if self._version is not None and time.monotonic() - self._checked < VERSION_RECHECK:
+            version = self._version
+        else:
+            version = get_version(self.namespace)
+
+        after = self._seq if version == self._version else 0
+        seq = append_log(self.namespace, version, delta, after)
+
+        if seq is None:
+            # the other workers cannot replay what is not logged
+            bump_version(self.namespace)
+            self._version = None
+
+        elif version == self._version and seq == self._seq + 1:
+            self._apply(delta)
+            self._seq = seq
+
+        else:
+            # changes of other workers came first; the next lookup
+            # replays them and this one in order
+            self._checked = 0.0
+
+    def _send(self, delta):
+
+        with self._lock:
+
+            try:
+                self._publish(delta)
+
+            except DatabaseError:
+                # runs after the commit, so the write itself stands; the
+                # other workers notice the table moving
+                self._version = None
+                logger.warning(
+                    "Could not log a change of the %s autocomplete index", self.name,
+                    exc_info=True
+                )
+
+    def update(self, instance):
+
+        values = {field: getattr(instance, field) for field in self.fields}
+
+        self._send((instance.pk, *self._row(values), instance.updated_at))
+
+    def remove(self, pk):
+
+        self._send((pk, None, None, None))
+
+    # ================= LOOKUP =================
+    def _candidates(self, term, limit):
+
+        if not term:
+            return self._entries.keys()
+
+        if len(term) >= GRAM_SIZE:
+
+            sets = [self._grams.get(gram, set()) for gram in _grams(term)]
+            ids = set.intersection(*sorted(sets, key=len))
+
+            return [pk for pk in ids if term in self._entries[pk][0]]
+
+        # short terms: prefix matches outrank everything else, so the
+        # full scan is only needed when they cannot fill the page
+        start = bisect.bisect_left(self._sorted, (term,))
+        prefixed = []
+
+        for key, pk in self._sorted[start:]:
+
+            if not key.startswith(term):
+                break
+
+            prefixed.append(pk)
+
+        if len(prefixed) >= limit:
+            return prefixed
+
+        return [
+            pk for pk, (key, payload) in self._entries.items()
+            if term in key
+        ]
+
+    def _lookup(self, term, limit):
+
+        term = term.strip().lower()
+
+        def rank(pk):
+
+            key = self._entries[pk][0]
+
+            if key == term:
+                match = 0
+            elif key.startswith(term):
+                match = 1
+            else:
+                match = 2
+
+            return match, len(key), -pk
+
+        best = heapq.nsmallest(
+            limit,
+            self._candidates(term, limit),
+            key=rank
+        )
+
+        return [self._entries[pk][1] for pk in best]
+
+    def query(self, term, limit):
+        """
+        ``search`` straight from the database.
+        """
+
+        return suggest_codes(
+            self.model, self.key_field, term.strip(), self.fields, limit
+        )
+
+    def search(self, term, limit):
+        """
+        Payloads of the rows whose key contains ``term``; exact matches
+        first, then prefix matches, then the shortest keys.
+        """
+
+        if not self._lock.acquire(timeout=LOCK_WAIT):
+            # another thread is rebuilding the index
+            return self.query(term, limit)
+
+        try:
+
+            if not self._is_current():
+                self.build()
+
+            return self._lookup(term, limit)
+
+        except DatabaseError:
+            logger.warning(
+                "Could not check the %s autocomplete index", self.name,
+                exc_info=True
+            )
+
+        finally:
+            self._lock.release()
+
+        return self.query(term, limit)
+
+    async def asearch(self, term, limit):
+        """
+        ``search`` for async views. An index checked within the last
+        ``VERSION_RECHECK`` seconds answers on the event loop without a
+        thread; any other, or one being rebuilt, is left to ``search`` in
+        a worker thread.
+        """
+
+        now = time.monotonic()
+        current = (
+            self._version is not None
+            and shared_cache()
+            and now - self._checked < VERSION_RECHECK
+            and now - self._stamped < INDEX_RECHECK
+        )
+
+        if current and self._lock.acquire(blocking=False):
+            try:
+                return self._lookup(term, limit)
+            finally:
+                self._lock.release()
+
+        return await sync_to_async(self.search)(term, limit)
+
+INDEXES = {
+    "ms": AutocompleteIndex("ms", Installation, "ms_id", ("id", "ms_id", "system")),
+    "p4": AutocompleteIndex("p4", P4ID, "p4_id", ("id", "p4_id")),
+    "p8": AutocompleteIndex("p8", P8ID, "p8_id", ("id", "p8_id")),
+}
+
+
+def warm_up():
+    """
+    Build every index up front; called once per worker at start-up.
+    """
+
+    for index in INDEXES.values():
+
+        try:
+            index.build()
+        except DatabaseError:
+            logger.warning(
+                "Could not warm up the %s autocomplete index", index.name,
+                exc_info=True
+            )
@@ -0,0 +1,216 @@
+import hashlib
+import secrets
+import time
+from functools import partial
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+
+# safety net for deployments where each worker has its own cache
+CACHE_TIMEOUT = 300
+
+
+def shared_cache():
+    """
+    Whether the default cache is seen by every worker, so a version one
+    of them bumps reaches the others.
+    """
+
+    return not isinstance(caches["default"], (LocMemCache, DummyCache))
+
+
+# ================= VERSION KEYS =================
+def _version_key(namespace):
+
+    return f"installation:version:{namespace}"
+
+
+def _fresh_version():
+
+    # unique per bump, so two workers bumping at once never end up on
+    # the same version, and never one an evicted key may have had
+    return f"{time.time_ns():x}{secrets.token_hex(4)}"
+
+
+def get_version(namespace):
+
+    return cache.get_or_set(_version_key(namespace), _fresh_version, None)
+
+
+def bump_version(namespace):
+    """
+    Invalidate everything cached under ``namespace``; returns the new
+    version.
+    """
+
+    version = _fresh_version()
+    cache.set(_version_key(namespace), version, None)
+
+    return version
+
+
+def bump_on_commit(namespace):
+    """
+    ``bump_version(namespace)`` once the current transaction commits, or
+    right away outside one. Bumping earlier would let a reader cache the
+    data it still sees from before the commit under the new version; a
+    rolled back write bumps nothing.
+    """
+
+    transaction.on_commit(partial(bump_version, namespace))
+
+
+# ================= CHANGE LOGS =================
+# numbered entries appended under the current version of a namespace, so
+# workers holding a copy of its data replay the changes rather than
+# rebuilding it; bumping the version starts a new, empty log
+LOG_TIMEOUT = 3600
+
+# an append gives up after this many numbers are taken
+LOG_ATTEMPTS = 20
+
+# entries past the head read along with the pending ones, for appends
+# whose head update was overtaken by a concurrent one
+LOG_PROBE = 4
+
+
+def _log_key(namespace, version, number):
+
+    return f"installation:log:{namespace}:{version}:{number}"
+
+
+def log_head(namespace, version):
+
+    return cache.get(_log_key(namespace, version, "head"), 0)
+
+
+def append_log(namespace, version, entry, after=0):
+    """
+    Append ``entry`` to the log of ``namespace`` at ``version``; returns
+    its number, or ``None`` when no number could be taken. ``after`` is
+    the last number the caller knows of.
+    """
+
+    number = after + 1
+
+    if not cache.add(_log_key(namespace, version, number), entry, LOG_TIMEOUT):
+
+        number = max(number, log_head(namespace, version)) + 1
+
+        for number in range(number, number + LOG_ATTEMPTS):
+            if cache.add(_log_key(namespace, version, number), entry, LOG_TIMEOUT):
+                break
+        else:
+            return None
+
+    cache.set(_log_key(namespace, version, "head"), number, None)
+
+    return number
+
+
+def read_log(namespace, version, after, limit):
+    """
+    Entries of the log of ``namespace`` at ``version`` numbered above
+    ``after``, oldest first; ``None`` when they cannot be replayed
+    because the namespace moved to another version, more than ``limit``
+    are pending or some of them are gone from the cache.
+    """
+
+    version_key = _version_key(namespace)
+    head_key = _log_key(namespace, version, "head")
+
+    found = cache.get_many([version_key, head_key])
+
+    if found.get(version_key) != version:
+        return None
+
+    head = found.get(head_key, 0)
+
+    if head <= after:
+        return []
+
+    if head - after > limit:
+        return None
+
+    keys = [
+        _log_key(namespace, version, number)
+        for number in range(after + 1, head + LOG_PROBE + 1)
+    ]
+    found = cache.get_many(keys)
+
+    entries = []
+
+    for key in keys:
+
+        if key not in found:
+            break
+
+        entries.append(found[key])
+
+    if after + len(entries) < head:
+        return None
+
+    return entries
+
+
+# ================= FACILITY VERSIONS =================
+# every facility has its own version so cached dashboard cards of the
+# other facilities survive a write; "facilities" invalidates them all
+def facility_namespace(facility):
+
+    return "facility:" + hashlib.md5(facility.encode()).hexdigest()
+
+
+def bump_facilities(facilities):
+
+    for facility in set(facilities):
+        bump_on_commit(facility_namespace(facility))
+
+
+def facility_versions(facilities):
+    """
+    ``{facility: version}`` with one cache round trip for the known ones.
+    Read them before the data a fragment is rendered from; the facility
+    bumps land after the commit, so that data is at least as new as the
+    versions.
+    """
+
+    keys = {
+        facility: _version_key(facility_namespace(facility))
+        for facility in set(facilities)
+    }
+
+    found = cache.get_many(keys.values())
+    everything = get_version("facilities")
+
+    versions = {}
+
+    for facility, key in keys.items():
+
+        if key not in found:
+            found[key] = cache.get_or_set(key, _fresh_version, None)
+
+        versions[facility] = f"{everything}.{found[key]}"
+
+    return versions
+
+
+# ================= CACHED VALUES =================
+def cached(namespace, name, builder, timeout=CACHE_TIMEOUT):
+    """
+    Return ``builder()`` cached under the current version of
+    ``namespace``; any ``bump_version(namespace)`` makes it stale.
+    """
+
+    key = f"installation:{namespace}:{get_version(namespace)}:{name}"
+
+    value = cache.get(key)
+
+    if value is None:
+        value = builder()
+        cache.set(key, value, timeout)
+
+    return value
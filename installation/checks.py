@@ -0,0 +1,56 @@
+from django.core import checks
+from django.db import DatabaseError, connections
+
+from .search import FTS_TABLE, TRIGRAM_INDEXES
+
+
+@checks.register(checks.Tags.database)
+def check_search_index(app_configs=None, databases=None, **kwargs):
+    """
+    The installation searches need the index migration 0012 creates;
+    without it every keystroke scans the whole table.
+    """
+
+    errors = []
+
+    for alias in databases or ():
+
+        connection = connections[alias]
+
+        try:
+
+            if connection.vendor == "postgresql":
+
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT indexname FROM pg_indexes WHERE indexname = ANY(%s)",
+                        [list(TRIGRAM_INDEXES)]
+                    )
+                    found = {row[0] for row in cursor.fetchall()}
+
+                missing = [name for name in TRIGRAM_INDEXES if name not in found]
+
+                if missing:
+                    errors.append(checks.Warning(
+                        f"Trigram index(es) {', '.join(missing)} missing on {alias!r}.",
+                        hint="Install the pg_trgm extension and re-run migration "
+                             "installation 0012; until then searches are "
+                             "sequential scans.",
+                        id="installation.W001",
+                    ))
+
+            elif connection.vendor == "sqlite":
+
+                if FTS_TABLE not in connection.introspection.table_names():
+                    errors.append(checks.Warning(
+                        f"Search table {FTS_TABLE} missing on {alias!r}.",
+                        hint="SQLite needs FTS5 with the trigram tokenizer; "
+                             "until then searches are full scans.",
+                        id="installation.W002",
+                    ))
+
+        except DatabaseError:
+            # not migrated yet; migrate reports that itself
+            continue
+
+    return errors
@@ -0,0 +1,214 @@
+from collections import defaultdict
+
+from django.db import transaction
+
+from .models import Installation, MilestoneClosure, P4ID, P8ID, P9ID
+
+
+CHUNK_SIZE = 2000
+
+
+# ================= BUILD =================
+def walk_paths(installations):
+    """
+    Every P4 -> P8 -> P9 path above the ``installations``, with three
+    queries, one per M2M table.
+
+    Returns ``{installation_id: [(p4, p8, p9), ...]}`` of primary keys;
+    the path up to each P4 and each P8 is listed on its own, with the
+    levels above it ``None``.
+    """
+
+    ms_through = P4ID.ms_ids.through.objects.filter(
+        installation_id__in=installations.values('id')
+    )
+
+    p8_through = P8ID.p4_ids.through.objects.filter(
+        p4id_id__in=ms_through.values('p4id_id')
+    )
+
+    p9_through = P9ID.p8_ids.through.objects.filter(
+        p8id_id__in=p8_through.values('p8id_id')
+    )
+
+    p8_by_p4 = defaultdict(list)
+
+    for p4_pk, p8_pk in p8_through.values_list('p4id_id', 'p8id_id'):
+        p8_by_p4[p4_pk].append(p8_pk)
+
+    p9_by_p8 = defaultdict(list)
+
+    for p8_pk, p9_pk in p9_through.values_list('p8id_id', 'p9id_id'):
+        p9_by_p8[p8_pk].append(p9_pk)
+
+    paths = defaultdict(list)
+
+    for installation_id, p4_pk in ms_through.values_list('installation_id', 'p4id_id'):
+
+        found = paths[installation_id]
+        found.append((p4_pk, None, None))
+
+        for p8_pk in p8_by_p4.get(p4_pk, ()):
+
+            found.append((p4_pk, p8_pk, None))
+
+            for p9_pk in p9_by_p8.get(p8_pk, ()):
+                found.append((p4_pk, p8_pk, p9_pk))
+
+    return paths
+
+
+def build_closure(installations):
+    """
+    Unsaved ``MilestoneClosure`` rows for ``installations``: one per
+    path, at the level of its top record.
+    """
+
+    rows = []
+
+    for installation_id, paths in walk_paths(installations).items():
+
+        for p4_pk, p8_pk, p9_pk in sorted(paths, key=lambda path: [pk or 0 for pk in path]):
+
+            rows.append(MilestoneClosure(
+                installation_id=installation_id,
+                level='p9' if p9_pk else 'p8' if p8_pk else 'p4',
+                p4_id=p4_pk,
+                p8_id=p8_pk,
+                p9_id=p9_pk,
+            ))
+
+    return rows
+
+
+def refresh_closure(installation_ids):
+    """
+    Replace the closure rows of the given installations.
+    """
+
+    ids = sorted(set(installation_ids))
+
+    if not ids:
+        return
+
+    with transaction.atomic():
+
+        for start in range(0, len(ids), CHUNK_SIZE):
+
+            chunk = ids[start:start + CHUNK_SIZE]
+
+            MilestoneClosure.objects.filter(
+                installation_id__in=chunk
+            ).delete()
+
+            MilestoneClosure.objects.bulk_create(
+                build_closure(Installation.objects.filter(id__in=chunk)),
+                batch_size=1000
+            )
+
+
+def rebuild_closure():
+    """
+    Drop the whole table and rebuild it from the M2M tables.
+    Returns the number of rows written.
+    """
+
+    ids = list(
+        Installation.objects.order_by('id').values_list('id', flat=True)
+    )
+
+    with transaction.atomic():
+
+        MilestoneClosure.objects.all().delete()
+
+        refresh_closure(ids)
+
+    return MilestoneClosure.objects.count()
+
+
+def _closure_key(row):
+
+    return (row.installation_id, row.level, row.p4_id, row.p8_id, row.p9_id)
+
+
+def verify_closure():
+    """
+    Ids of installations whose closure rows differ from the M2M tables.
+    """
+
+    ids = list(
+        Installation.objects.order_by('id').values_list('id', flat=True)
+    )
+
+    stale = set()
+
+    for start in range(0, len(ids), CHUNK_SIZE):
+
+        chunk = ids[start:start + CHUNK_SIZE]
+
+        stored = set(
+            _closure_key(row)
+            for row in MilestoneClosure.objects.filter(
+                installation_id__in=chunk
+            )
+        )
+
+        live = set(
+            _closure_key(row)
+            for row in build_closure(
+                Installation.objects.filter(id__in=chunk)
+            )
+        )
+
+        stale |= {key[0] for key in stored ^ live}
+
+    return sorted(stale)
+
+
+# ================= LOOKUPS =================
+def ancestors_of(installation_id):
+    """
+    ``{'p4': [...], 'p8': [...], 'p9': [...]}`` of every milestone above
+    one installation, as ``{'id', 'code', 'completed'}`` dicts.
+    """
+
+    ancestors = {'p4': [], 'p8': [], 'p9': []}
+    seen = set()
+
+    rows = MilestoneClosure.objects.filter(
+        installation_id=installation_id
+    ).values(
+        'level',
+        'p4_id', 'p4__p4_id', 'p4__completed',
+        'p8_id', 'p8__p8_id', 'p8__completed',
+        'p9_id', 'p9__p9_id', 'p9__completed',
+    ).order_by('level', 'id')
+
+    for row in rows:
+
+        level = row['level']
+
+        # a record reached along several paths is listed once
+        if (level, row[f'{level}_id']) in seen:
+            continue
+
+        seen.add((level, row[f'{level}_id']))
+
+        ancestors[level].append({
+            'id': row[f'{level}_id'],
+            'code': row[f'{level}__{level}_id'],
+            'completed': row[f'{level}__completed'],
+        })
+
+    return ancestors
+
+
+def installations_under(level, pk):
+    """
+    Installations below one P4/P8/P9 record.
+    """
+
+    return Installation.objects.filter(
+        closure__level=level,
+        **{f"closure__{level}_id": pk}
+    ).distinct()
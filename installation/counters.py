@@ -0,0 +1,241 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, IntegerField, Value, When
+from django.db.models.functions import Coalesce, ExtractYear
+
+from .models import DashboardCounter, Installation, P4ID, P8ID, P9ID
+
+
+KINDS = {
+    "installation": Installation,
+    "p4": P4ID,
+    "p8": P8ID,
+    "p9": P9ID,
+}
+
+MODEL_KINDS = {model: kind for kind, model in KINDS.items()}
+
+# columns a counter bucket is computed from
+COUNTED_FIELDS = {
+    "installation": ("facility", "status", "end_date"),
+    "p4": ("completed", "end_date"),
+    "p8": ("completed", "end_date"),
+    "p9": ("completed", "end_date"),
+}
+
+COMPLETED = "Completed"
+PENDING = "Pending"
+
+
+# ================= BUCKETS =================
+def bucket(kind, obj):
+    """
+    ``(facility, status, year)`` counter key of a record, or of a dict of
+    its counted fields.
+    """
+
+    get = obj.get if isinstance(obj, dict) else lambda field: getattr(obj, field)
+
+    end_date = get("end_date")
+    year = end_date.year if end_date else 0
+
+    if kind == "installation":
+        return (get("facility"), get("status"), year)
+
+    return ("", COMPLETED if get("completed") else PENDING, year)
+
+
+def stored_bucket(kind, pk):
+    """
+    Bucket of the stored row, locked until the end of the transaction so
+    concurrent saves of the same row move it one after the other.
+    """
+
+    values = KINDS[kind].objects.select_for_update().filter(
+        pk=pk
+    ).values(*COUNTED_FIELDS[kind]).first()
+
+    return None if values is None else bucket(kind, values)
+
+
+# ================= WRITING =================
+def _add(kind, key, delta):
+
+    facility, status, year = key
+
+    lookup = {
+        "kind": kind,
+        "facility": facility,
+        "status": status,
+        "year": year,
+    }
+
+    if DashboardCounter.objects.filter(**lookup).update(total=F("total") + delta):
+        return
+
+    try:
+        with transaction.atomic():
+            DashboardCounter.objects.create(total=delta, **lookup)
+    except IntegrityError:
+        # created by a concurrent write in the meantime
+        DashboardCounter.objects.filter(**lookup).update(total=F("total") + delta)
+
+
+def count_changes(kind, changes):
+    """
+    Apply ``[(old_bucket, new_bucket), ...]`` moves, ``None`` standing
+    for a record that did not exist before or no longer exists.
+    """
+
+    deltas = Counter()
+
+    for old, new in changes:
+
+        if old == new:
+            continue
+
+        if old is not None:
+            deltas[old] -= 1
+
+        if new is not None:
+            deltas[new] += 1
+
+    with transaction.atomic():
+
+        for key, delta in sorted(deltas.items()):
+
+            if delta:
+                _add(kind, key, delta)
+
+
+# ================= LIVE COUNTS =================
+def live_counts(kind):
+    """
+    ``{bucket: total}`` counted from the table itself.
+    """
+
+    rows = KINDS[kind].objects.annotate(
+        year=Coalesce(ExtractYear("end_date"), Value(0), output_field=IntegerField())
+    )
+
+    if kind == "installation":
+        rows = rows.values("facility", "status", "year")
+    else:
+        rows = rows.annotate(
+            bucket_status=Case(
+                When(completed=True, then=Value(COMPLETED)),
+                default=Value(PENDING),
+            )
+        ).values("bucket_status", "year")
+
+    counts = {}
+
+    for row in rows.annotate(total=Count("id")).order_by():
+
+        if kind == "installation":
+            key = (row["facility"], row["status"], row["year"])
+        else:
+            key = ("", row["bucket_status"], row["year"])
+
+        counts[key] = row["total"]
+
+    return counts
+
+
+def stored_counts(kind):
+
+    return {
+        (facility, status, year): total
+        for facility, status, year, total in DashboardCounter.objects.filter(
+            kind=kind
+        ).exclude(total=0).values_list("facility", "status", "year", "total")
+    }
+
+
+def _drift(live, stored):
+
+    return sorted(
+        key for key in live.keys() | stored.keys()
+        if live.get(key, 0) != stored.get(key, 0)
+    )
+
+
+def reconcile_counters(kind):
+    """
+    Rewrite the buckets of ``kind`` that drifted from the table and drop
+    empty ones. Returns the number of buckets fixed.
+
+    A write committed while this runs can be counted twice or not at
+    all; the next run corrects it.
+    """
+
+    with transaction.atomic():
+
+        live = live_counts(kind)
+        stale = _drift(live, stored_counts(kind))
+
+        for key in stale:
+
+            facility, status, year = key
+            lookup = {
+                "kind": kind,
+                "facility": facility,
+                "status": status,
+                "year": year,
+            }
+
+            if live.get(key):
+                DashboardCounter.objects.update_or_create(
+                    **lookup,
+                    defaults={"total": live[key]}
+                )
+            else:
+                DashboardCounter.objects.filter(**lookup).delete()
+
+        DashboardCounter.objects.filter(kind=kind, total=0).delete()
+
+    return len(stale)
+
+
+def verify_counters(kind):
+    """
+    Buckets of ``kind`` whose stored total differs from the table.
+    """
+
+    return _drift(live_counts(kind), stored_counts(kind))
+
+
+# ================= READING =================
+def counter_summary(kind):
+    """
+    Totals of ``kind`` folded from its counter rows: ``total``,
+    ``completed``, ``pending``, ``status`` and ``yearly`` completions as
+    sorted ``(key, n)`` pairs, and ``facilities`` ``{facility: total}``.
+    """
+
+    status = Counter()
+    yearly = Counter()
+    facilities = Counter()
+
+    for facility, state, year, total in DashboardCounter.objects.filter(
+        kind=kind
+    ).exclude(total=0).values_list("facility", "status", "year", "total"):
+
+        status[state] += total
+        facilities[facility] += total
+
+        if state == COMPLETED and year:
+            yearly[year] += total
+
+    total = sum(status.values())
+
+    return {
+        "total": total,
+        "completed": status[COMPLETED],
+        "pending": total - status[COMPLETED],
+        "status": sorted(status.items()),
+        "yearly": sorted(yearly.items()),
+        "facilities": dict(facilities),
+    }
+
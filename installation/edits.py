@@ -0,0 +1,271 @@
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .counters import COUNTED_FIELDS, bucket, count_changes
+from .models import Installation
+from .signals import after_bulk_write
+
+
+# columns the list pages may edit inline
+EDITABLE_FIELDS = ("status", "abd_number", "start_date", "end_date")
+
+# largest batch one request may carry
+MAX_EDITS = 1000
+
+CONFLICT = "Changed by someone else, reload to see the new value"
+
+
+def _clean(field, value):
+
+    model_field = Installation._meta.get_field(field)
+
+    if value in ("", None):
+        return None if model_field.null else ""
+
+    value = model_field.to_python(value)
+    model_field.run_validators(value)
+
+    return value
+
+
+def _version(value):
+    """
+    The version token a client sent, ``None`` when it sent none.
+    """
+
+    if value in ("", None):
+        return None
+
+    return int(value)
+
+
+def _display(value):
+
+    return "" if value is None else str(value)
+
+
+# ================= SINGLE ROW =================
+def save_installation(pk, values, version=None):
+    """
+    Write the ``values`` (field -> submitted value) that differ from the
+    stored row, only if the row is still at ``version``.
+
+    Only changed columns are written, together with the new version, in
+    one conditional UPDATE. Returns a dict with ``success``, the current
+    ``version`` and either the ``changed`` fields or an ``error``
+    (``conflict`` is set for stale versions).
+    """
+
+    fields = [field for field in values if field in EDITABLE_FIELDS]
+
+    if len(fields) != len(values):
+        return {"success": False, "error": "Invalid field"}
+
+    try:
+        pk = int(pk)
+        version = _version(version)
+        cleaned = {field: _clean(field, values[field]) for field in fields}
+    except (TypeError, ValueError):
+        return {"success": False, "error": "Invalid id or version"}
+    except ValidationError as e:
+        return {"success": False, "error": "; ".join(e.messages)}
+
+    current = Installation.objects.filter(pk=pk).only(
+        "version",
+        *fields,
+        *COUNTED_FIELDS["installation"]
+    ).first()
+
+    if current is None:
+        return {"success": False, "error": "Record not found"}
+
+    if version is not None and current.version != version:
+        return {
+            "success": False,
+            "conflict": True,
+            "error": CONFLICT,
+            "version": current.version,
+        }
+
+    changed = {
+        field: value for field, value in cleaned.items()
+        if getattr(current, field) != value
+    }
+
+    if not changed:
+        return {"success": True, "version": current.version, "changed": []}
+
+    with transaction.atomic():
+
+        written = Installation.objects.filter(
+            pk=pk,
+            version=current.version
+        ).update(
+            **changed,
+            version=F("version") + 1,
+            updated_at=timezone.now()
+        )
+
+        if written:
+
+            old = bucket("installation", current)
+
+            for field, value in changed.items():
+                setattr(current, field, value)
+
+            count_changes("installation", [(old, bucket("installation", current))])
+
+    if not written:
+        # another write landed between the read and the update
+        return {
+            "success": False,
+            "conflict": True,
+            "error": CONFLICT,
+            "version": Installation.objects.filter(pk=pk).values_list(
+                "version", flat=True
+            ).first(),
+        }
+
+    after_bulk_write([pk], changed)
+
+    return {
+        "success": True,
+        "version": current.version + 1,
+        "changed": sorted(changed),
+    }
+
+
+# ================= BATCH =================
+def _result(edit, success, **extra):
+
+    return {
+        "id": edit.get("id"),
+        "field": edit.get("field"),
+        "success": success,
+        **extra,
+    }
+
+
+def apply_edits(edits):
+    """
+    Apply ``[{id, field, value, version}, ...]`` inline edits inside one
+    transaction.
+
+    Later edits of the same cell win. Rows are locked, and a row whose
+    ``version`` no longer matches refuses all its edits. Changed rows are
+    written with one ``bulk_update`` per set of changed columns. Returns
+    one result per edit, in order, with the stored value and the row's
+    new version, or the reason it was refused.
+    """
+
+    results = [None] * len(edits)
+    accepted = {}
+    versions = {}
+
+    for i, edit in enumerate(edits):
+
+        if not isinstance(edit, dict):
+            results[i] = _result({}, False, error="Invalid edit")
+            continue
+
+        field = edit.get("field")
+
+        if field not in EDITABLE_FIELDS:
+            results[i] = _result(edit, False, error="Invalid field")
+            continue
+
+        try:
+            pk = int(edit.get("id"))
+            version = _version(edit.get("version"))
+            value = _clean(field, edit.get("value"))
+        except (TypeError, ValueError):
+            results[i] = _result(edit, False, error="Invalid id or version")
+            continue
+        except ValidationError as e:
+            results[i] = _result(edit, False, error="; ".join(e.messages))
+            continue
+
+        accepted[(pk, field)] = (i, value)
+
+        if version is not None:
+            versions.setdefault(pk, version)
+
+    changed = {}
+    moved = {}
+
+    with transaction.atomic():
+
+        objects = Installation.objects.select_for_update().in_bulk(
+            {pk for pk, field in accepted}
+        )
+
+        for (pk, field), (i, value) in accepted.items():
+
+            obj = objects.get(pk)
+
+            if obj is None:
+                results[i] = _result(edits[i], False, error="Record not found")
+                continue
+
+            if pk in versions and versions[pk] != obj.version:
+                results[i] = _result(
+                    edits[i], False,
+                    conflict=True,
+                    error=CONFLICT,
+                    version=obj.version
+                )
+                continue
+
+            if getattr(obj, field) != value:
+
+                if pk not in changed:
+                    moved[pk] = bucket("installation", obj)
+
+                setattr(obj, field, value)
+                changed.setdefault(pk, set()).add(field)
+
+            results[i] = _result(edits[i], True, value=_display(value))
+
+        now = timezone.now()
+        groups = {}
+
+        for pk, fields in changed.items():
+
+            obj = objects[pk]
+            obj.version += 1
+            obj.updated_at = now
+
+            groups.setdefault(frozenset(fields), []).append(obj)
+
+        for fields, objs in groups.items():
+            Installation.objects.bulk_update(
+                objs,
+                sorted(fields) + ["version", "updated_at"]
+            )
+
+        count_changes("installation", [
+            (old, bucket("installation", objects[pk]))
+            for pk, old in moved.items()
+        ])
+
+    for i, result in enumerate(results):
+
+        if result is not None and result["success"]:
+            result["version"] = objects[int(edits[i]["id"])].version
+
+    # superseded edits of a cell report the outcome of the edit that won
+    for i, edit in enumerate(edits):
+
+        if results[i] is None:
+            pk = int(edit["id"])
+            results[i] = {**results[accepted[(pk, edit["field"])][0]]}
+
+    if changed:
+        after_bulk_write(
+            changed.keys(),
+            set().union(*changed.values())
+        )
+
+    return results
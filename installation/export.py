@@ -0,0 +1,222 @@
+import csv
+import datetime
+import tempfile
+
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .models import Installation, P4ID, P8ID, P9ID
+
+
+# rows fetched per server-side cursor round trip
+EXPORT_CHUNK_SIZE = 2000
+
+# CSV lines joined into one response chunk
+CSV_LINES_PER_CHUNK = 500
+
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+def _codes(relation, field):
+
+    def codes(obj):
+        return ", ".join(getattr(child, field) for child in getattr(obj, relation).all())
+
+    return codes
+
+
+def _yes_no(field):
+
+    def yes_no(obj):
+        return "Yes" if getattr(obj, field) else "No"
+
+    return yes_no
+
+
+# ================= DATASETS =================
+# (header, attribute or callable) per column; the installation headers
+# match the importer so an export can be loaded back
+EXPORTS = {
+    "installations": {
+        "model": Installation,
+        "title": "Installations",
+        "columns": [
+            ("MS ID Full", "ms_id_full"),
+            ("MS_ID", "ms_id"),
+            ("Status", "status"),
+            ("ABD Number", "abd_number"),
+            ("Start Date", "start_date"),
+            ("End Date", "end_date"),
+            ("System", "system"),
+            ("Facility", "facility"),
+            ("SAW Program", "saw_program"),
+            ("Unit", "unit"),
+            ("Stage", "stage"),
+            ("Type", "type"),
+        ],
+    },
+    "p4": {
+        "model": P4ID,
+        "title": "P4",
+        "children": ("ms_ids", Installation, "ms_id"),
+        "columns": [
+            ("P4 ID", "p4_id"),
+            ("MS IDs", _codes("ms_ids", "ms_id")),
+            ("SAW Programs", "saw_programs"),
+            ("Associate MS", "associate_ms"),
+            ("Completed", _yes_no("completed")),
+            ("Start Date", "start_date"),
+            ("End Date", "end_date"),
+        ],
+    },
+    "p8": {
+        "model": P8ID,
+        "title": "P8",
+        "children": ("p4_ids", P4ID, "p4_id"),
+        "columns": [
+            ("P8 ID", "p8_id"),
+            ("P4 IDs", _codes("p4_ids", "p4_id")),
+            ("P2 ID", "p2_id"),
+            ("Completed", _yes_no("completed")),
+            ("Start Date", "start_date"),
+            ("End Date", "end_date"),
+        ],
+    },
+    "p9": {
+        "model": P9ID,
+        "title": "P9",
+        "children": ("p8_ids", P8ID, "p8_id"),
+        "columns": [
+            ("P9 ID", "p9_id"),
+            ("P8 IDs", _codes("p8_ids", "p8_id")),
+            ("Completed", _yes_no("completed")),
+            ("Start Date", "start_date"),
+            ("End Date", "end_date"),
+        ],
+    },
+}
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def export_rows(dataset, queryset=None):
+    """
+    Yield the header, then one list of cell values per record, reading
+    ``queryset`` (default: the whole table, newest first) through a
+    server-side cursor.
+    """
+
+    spec = EXPORTS[dataset]
+
+    if queryset is None:
+        queryset = spec["model"].objects.order_by("-id")
+
+    if "children" in spec:
+
+        relation, model, field = spec["children"]
+
+        # only the code column of every linked record
+        queryset = queryset.prefetch_related(
+            Prefetch(relation, queryset=model.objects.only(field))
+        )
+
+    yield [header for header, value in spec["columns"]]
+
+    for obj in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+
+        row = []
+
+        for header, value in spec["columns"]:
+            row.append(value(obj) if callable(value) else getattr(obj, value))
+
+        yield row
+
+
+# ================= CSV =================
+class _Echo:
+    """
+    File-like object whose ``write`` hands the line back to csv.writer.
+    """
+
+    def write(self, value):
+        return value
+
+
+def _csv_cell(value):
+
+    if value is None:
+        return ""
+
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+
+    return value
+
+
+def stream_csv(rows):
+
+    writer = csv.writer(_Echo())
+
+    # BOM so Excel opens the file as UTF-8
+    lines = ["\ufeff"]
+
+    for row in rows:
+
+        lines.append(writer.writerow([_csv_cell(value) for value in row]))
+
+        if len(lines) >= CSV_LINES_PER_CHUNK:
+            yield "".join(lines)
+            lines = []
+
+    if lines:
+        yield "".join(lines)
+
+
+# ================= XLSX =================
+def stream_xlsx(rows, title):
+    """
+    Write the rows to a write-only workbook, which keeps them in a temp
+    file rather than in memory, then stream the finished file.
+    """
+
+    from openpyxl import Workbook
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(title)
+
+    for row in rows:
+        worksheet.append([
+            ILLEGAL_CHARACTERS_RE.sub("", value) if isinstance(value, str) else value
+            for value in row
+        ])
+
+    with tempfile.TemporaryFile() as handle:
+
+        workbook.save(handle)
+        handle.seek(0)
+
+        while chunk := handle.read(FILE_CHUNK_SIZE):
+            yield chunk
+
+
+# ================= RESPONSE =================
+def export_response(dataset, fmt, queryset=None):
+
+    rows = export_rows(dataset, queryset)
+
+    if fmt == "xlsx":
+        content = stream_xlsx(rows, EXPORTS[dataset]["title"])
+    else:
+        content = stream_csv(rows)
+
+    filename = f"{dataset}-{timezone.localdate():%Y-%m-%d}.{fmt}"
+
+    response = StreamingHttpResponse(content, content_type=FORMATS[fmt])
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+
+    return response
@@ -0,0 +1,268 @@
+"""
+Dictionary encoding of the repeated Installation text columns.
+
+A ``LabelField`` stores the integer code of an ``InstallationLabel``
+row. Python code, forms and templates see the text; the database
+compares, groups and indexes the codes.
+"""
+import threading
+from functools import partial
+
+from django import forms
+from django.apps import apps
+from django.core import validators
+from django.db import IntegrityError, connection as default_connection, models, transaction
+from django.db.models import Lookup
+
+
+# ================= LABEL CODES =================
+# committed labels, shared by every thread of the process; labels are
+# never renamed or deleted, so an entry stays valid
+_codes = {}
+_names = {}
+_lock = threading.Lock()
+_loaded = False
+
+# code of a name that is not stored; matches no row
+MISSING = 0
+
+
+def _label_model():
+
+    return apps.get_model("installation", "InstallationLabel")
+
+
+def _load():
+
+    global _loaded
+
+    with _lock:
+
+        if _loaded:
+            return
+
+        rows = _label_model()._default_manager.values_list("id", "column", "name")
+
+        for code, column, name in rows:
+            _codes[(column, name)] = code
+            _names[code] = name
+
+        _loaded = True
+
+
+def _confirm(codes, names, connection=None):
+
+    # callbacks run early by a test still sit in a transaction that can
+    # roll back; the labels stay pending there
+    if connection is not None and connection.in_atomic_block:
+        return
+
+    with _lock:
+        _codes.update(codes)
+        _names.update(names)
+
+
+def _pending(connection):
+    """
+    ``(codes, names)`` of the labels the open transaction of
+    ``connection`` created or read, or ``None`` outside a transaction.
+    They are shared once it commits; a rollback, or a rolled back
+    savepoint, replaces ``run_on_commit`` and drops them with it.
+    """
+
+    if not connection.in_atomic_block:
+        return None
+
+    pending = getattr(connection, "_installation_labels", None)
+
+    if pending is None or pending[0] is not connection.run_on_commit:
+
+        pending = (connection.run_on_commit, {}, {})
+        connection._installation_labels = pending
+
+        transaction.on_commit(
+            partial(_confirm, pending[1], pending[2], connection),
+            using=connection.alias
+        )
+
+    return pending[1], pending[2]
+
+
+def _remember(connection, column, name, code):
+
+    pending = _pending(connection)
+
+    if pending is None:
+        _confirm({(column, name): code}, {code: name})
+    else:
+        pending[0][(column, name)] = code
+        pending[1][code] = name
+
+
+def label_code(column, name, connection=None, create=False):
+    """
+    Code of ``name`` in ``column``. Unknown names are stored when
+    ``create`` is set and give ``MISSING`` otherwise.
+    """
+
+    if not _loaded:
+        _load()
+
+    code = _codes.get((column, name))
+
+    if code is not None:
+        return code
+
+    connection = connection or default_connection
+    pending = _pending(connection)
+
+    if pending is not None and (column, name) in pending[0]:
+        return pending[0][(column, name)]
+
+    labels = _label_model()._default_manager.db_manager(connection.alias)
+
+    code = labels.filter(column=column, name=name).values_list("id", flat=True).first()
+
+    if code is None:
+
+        if not create:
+            return MISSING
+
+        try:
+            with transaction.atomic(using=connection.alias):
+                code = labels.create(column=column, name=name).pk
+        except IntegrityError:
+            # another worker stored it first
+            code = labels.get(column=column, name=name).pk
+
+    _remember(connection, column, name, code)
+
+    return code
+
+
+def label_name(code, connection=None):
+    """
+    Text of the label ``code``.
+    """
+
+    name = _names.get(code)
+
+    if name is not None:
+        return name
+
+    if not _loaded:
+        _load()
+        return label_name(code, connection)
+
+    connection = connection or default_connection
+    pending = _pending(connection)
+
+    if pending is not None and code in pending[1]:
+        return pending[1][code]
+
+    row = _label_model()._default_manager.db_manager(connection.alias).filter(
+        pk=code
+    ).values_list("column", "name").first()
+
+    if row is None:
+        return ""
+
+    _remember(connection, *row, code)
+
+    return row[1]
+
+
+# ================= FIELD =================
+class LabelField(models.Field):
+    """
+    Text column stored as the code of an ``InstallationLabel``; saving a
+    new text stores its label. Exact, ``in`` and ordering lookups run on
+    the codes, so orderings follow the codes, not the alphabet. Text
+    lookups (``iexact``, ``icontains`` ...) match the label names.
+    """
+
+    description = "Text stored as a lookup table code"
+
+    def __init__(self, *args, **kwargs):
+
+        super().__init__(*args, **kwargs)
+
+        if self.max_length is not None:
+            self.validators.append(validators.MaxLengthValidator(self.max_length))
+
+    def get_internal_type(self):
+
+        return "IntegerField"
+
+    def to_python(self, value):
+
+        if value is None or isinstance(value, str):
+            return value
+
+        return str(value)
+
+    def from_db_value(self, value, expression, connection):
+
+        if value is None:
+            return value
+
+        return label_name(value, connection)
+
+    def get_prep_value(self, value):
+
+        value = super().get_prep_value(value)
+
+        if value is None:
+            return value
+
+        return label_code(self.name, self.to_python(value))
+
+    def get_db_prep_save(self, value, connection):
+
+        if value is None or hasattr(value, "as_sql"):
+            return value
+
+        return label_code(self.name, self.to_python(value), connection, create=True)
+
+    def formfield(self, **kwargs):
+
+        return super().formfield(**{
+            "form_class": forms.CharField,
+            "max_length": self.max_length,
+            **kwargs,
+        })
+
+
+class LabelTextLookup(Lookup):
+    """
+    Text lookup of a label column: its codes whose label names match.
+    """
+
+    prepare_rhs = False
+
+    def as_sql(self, compiler, connection):
+
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+
+        codes = _label_model()._default_manager.filter(**{
+            "column": self.lhs.output_field.name,
+            f"name__{self.lookup_name}": self.rhs,
+        }).values("id")
+
+        sql, params = codes.query.get_compiler(connection=connection).as_sql()
+
+        return f"{lhs} IN ({sql})", (*lhs_params, *params)
+
+
+for _lookup in (
+    "iexact",
+    "contains",
+    "icontains",
+    "startswith",
+    "istartswith",
+    "endswith",
+    "iendswith",
+):
+    LabelField.register_lookup(
+        type(f"Label{_lookup.title()}", (LabelTextLookup,), {"lookup_name": _lookup})
+    )
@@ -0,0 +1,105 @@
+import hashlib
+
+from django.contrib.messages import get_messages
+from django.db.models import Max, Sum
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from .counters import KINDS
+from .models import DashboardCounter
+
+
+# ================= FRESHNESS =================
+def table_state(kinds):
+    """
+    ``(rows, latest)`` over the ``kinds`` tables: the counted rows, which
+    drop on a delete, and the newest ``updated_at``, which moves on any
+    other write. One index lookup per table plus one over the counters.
+    """
+
+    latest = [
+        KINDS[kind].objects.aggregate(latest=Max("updated_at"))["latest"]
+        for kind in kinds
+    ]
+
+    rows = DashboardCounter.objects.filter(
+        kind__in=kinds
+    ).aggregate(rows=Sum("total"))["rows"]
+
+    return rows or 0, latest
+
+
+def _freshness(request, kinds):
+    """
+    ``(etag, last_modified)`` of a page built from the ``kinds`` tables,
+    computed once per request. ``(None, None)`` while flash messages are
+    waiting, so they are never swallowed by a 304.
+    """
+
+    memo = request.__dict__.setdefault("_freshness", {})
+
+    if kinds not in memo:
+
+        storage = get_messages(request)
+        waiting = bool(list(storage))
+
+        # looking is not showing; keep them for the page that renders them
+        if waiting:
+            storage.used = False
+
+        if waiting:
+            memo[kinds] = (None, None)
+
+        else:
+            rows, latest = table_state(kinds)
+            user = request.user
+
+            digest = hashlib.md5(repr((
+                user.pk,
+                getattr(user, "role", None),
+                # list pages answer their filter script with a fragment
+                request.headers.get("X-Requested-With"),
+                kinds,
+                rows,
+                [value.isoformat() if value else None for value in latest],
+            )).encode()).hexdigest()
+
+            memo[kinds] = (
+                digest,
+                max((value for value in latest if value), default=None),
+            )
+
+    return memo[kinds]
+
+
+def conditional_page(kinds):
+    """
+    Answer GET/HEAD with 304 Not Modified while none of the ``kinds``
+    tables (see ``counters.KINDS``) changed. ``kinds`` is a tuple, or a
+    callable taking the view arguments for pages that depend on them.
+
+    Goes below the login and role checks so a 304 is never sent to
+    someone who may not see the page.
+    """
+
+    def kinds_for(request, *args, **kwargs):
+
+        if callable(kinds):
+            return tuple(kinds(request, *args, **kwargs))
+
+        return tuple(kinds)
+
+    def etag(request, *args, **kwargs):
+        return _freshness(request, kinds_for(request, *args, **kwargs))[0]
+
+    def last_modified(request, *args, **kwargs):
+        return _freshness(request, kinds_for(request, *args, **kwargs))[1]
+
+    def decorator(view):
+
+        view = condition(etag_func=etag, last_modified_func=last_modified)(view)
+
+        # browsers revalidate every poll instead of guessing a lifetime
+        return cache_control(private=True, no_cache=True)(view)
+
+    return decorator
@@ -0,0 +1,117 @@
+from django.db.models import Count
+
+from .models import MilestoneClosure
+
+
+# ================= TB CHAIN PER LEVEL =================
+# label fields carried on every row, and the closure columns that order
+# the paths below one record
+LEVELS = {
+
+    "p4": {
+        "labels": {
+            "p4_id": "p4__p4_id",
+        },
+        "path": ("installation_id",),
+    },
+
+    "p8": {
+        "labels": {
+            "p8_id": "p8__p8_id",
+            "p4_id": "p4__p4_id",
+        },
+        "path": ("p4_id", "installation_id"),
+    },
+
+    "p9": {
+        "labels": {
+            "p9_id": "p9__p9_id",
+            "p8_id": "p8__p8_id",
+            "p4_id": "p4__p4_id",
+        },
+        "path": ("p8_id", "p4_id", "installation_id"),
+    },
+}
+
+
+def _tb_paths(level, facility=None):
+    """
+    Closure rows of ``level``, one per P4/P8/P9 -> ... -> TB installation
+    path.
+    """
+
+    paths = MilestoneClosure.objects.filter(
+        level=level,
+        installation__type__iexact="TB"
+    )
+
+    if facility is not None:
+        paths = paths.filter(installation__facility=facility)
+
+    return paths
+
+
+def load_tb_chain(level, facility=None):
+    """
+    Every P4/P8/P9 -> ... -> TB installation path of ``level`` as flat
+    dict rows, read from the closure table in a single query,
+    optionally only those ending in one ``facility``.
+    """
+
+    spec = LEVELS[level]
+    labels = list(spec["labels"])
+
+    # the closure's own p4_id/p8_id columns would clash with the label
+    # names as annotations, so the rows are named here
+    names = labels + ["top_pk", "top_completed", "facility", "system", "ms_id"]
+
+    rows = _tb_paths(level, facility).values_list(
+        *spec["labels"].values(),
+        f"{level}_id",
+        f"{level}__completed",
+        "installation__facility",
+        "installation__system",
+        "installation__ms_id",
+    ).order_by(
+        f"{level}__{level}_id",
+        f"{level}_id",
+        *spec["path"]
+    )
+
+    return [dict(zip(names, row)) for row in rows]
+
+
+# ================= FACILITY GROUPING =================
+def facility_counts(level):
+    """
+    ``[(facility, cards), ...]`` of ``level`` in facility order, for the
+    headers of the P4/P8/P9 facility dashboards.
+    """
+
+    return sorted(
+        _tb_paths(level).values_list(
+            "installation__facility"
+        ).annotate(
+            total=Count("id")
+        ).order_by()
+    )
+
+
+def facility_hierarchy(level, facility=None):
+    """
+    ``{facility: [card, ...]}`` for the P4/P8/P9 facility dashboards.
+    """
+
+    facility_data = {}
+
+    for row in load_tb_chain(level, facility):
+
+        completed = row.pop("top_completed")
+
+        row["completed"] = completed
+        row["color"] = "success" if completed else "primary"
+        row[f"{level}_db_id"] = row.pop("top_pk")
+
+        facility_data.setdefault(row.pop("facility"), []).append(row)
+
+    return facility_data
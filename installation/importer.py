@@ -0,0 +1,267 @@
+import collections
+import csv
+from concurrent.futures import ProcessPoolExecutor
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Installation
+from .signals import after_bulk_write
+from .sheets import (
+    CHUNK_SIZE,
+    COLUMNS,
+    IMPORT_FIELDS,
+    TEXT_FIELDS,
+    as_row,
+    batched,
+    clean_text,
+    parse_batch,
+    parse_range,
+    read_rows,
+    row_hash,
+    row_ranges,
+)
+
+
+# ================= REJECTS =================
+class RejectWriter:
+    """
+    CSV side file of rejected rows, created on the first reject.
+    """
+
+    def __init__(self, path):
+
+        self.path = path
+        self.count = 0
+
+        self._handle = None
+        self._writer = None
+
+    def write(self, rejected):
+
+        for number, row, reason in rejected:
+
+            if self._writer is None:
+
+                self._handle = open(self.path, 'w', newline='', encoding='utf-8')
+                self._writer = csv.writer(self._handle)
+                self._writer.writerow(['Row', 'Reason', *COLUMNS])
+
+            self._writer.writerow([
+                number,
+                reason,
+                *(clean_text(row.get(header)) for header in COLUMNS)
+            ])
+
+            self.count += 1
+
+    def close(self):
+
+        if self._handle is not None:
+            self._handle.close()
+
+
+# ================= PARSING =================
+def max_lengths():
+
+    return {
+        field: Installation._meta.get_field(field).max_length
+        for field in TEXT_FIELDS
+    }
+
+
+def parsed_chunks(sources, chunk_size=CHUNK_SIZE, workers=1, sheet=None):
+    """
+    Yield ``(rejects, records, rejected)`` for every chunk of every
+    ``(path, rejects)`` source, in file order.
+
+    With ``workers > 1`` each file is split into line ranges, at least
+    one per worker, which the pool processes read and parse themselves;
+    at most two ranges per worker are in flight.
+    """
+
+    lengths = max_lengths()
+
+    if workers <= 1:
+
+        for path, rejects in sources:
+            for batch in batched(read_rows(path, sheet), chunk_size):
+                yield (rejects, *parse_batch(batch, lengths))
+
+        return
+
+    tasks = [
+        (rejects, path, start, stop)
+        for path, rejects in sources
+        for start, stop in row_ranges(path, sheet, workers)
+    ]
+
+    with ProcessPoolExecutor(workers) as pool:
+
+        pending = collections.deque()
+
+        def finished():
+
+            rejects, future = pending.popleft()
+
+            for records, rejected in future.result():
+                yield rejects, records, rejected
+
+        for rejects, path, start, stop in tasks:
+
+            pending.append((rejects, pool.submit(
+                parse_range, path, sheet, start, stop, chunk_size, lengths
+            )))
+
+            if len(pending) >= workers * 2:
+                yield from finished()
+
+        while pending:
+            yield from finished()
+
+
+# ================= WRITING =================
+def import_installations(sources, chunk_size=CHUNK_SIZE, workers=1, sheet=None):
+    """
+    Insert every valid row of each ``(path, rejects)`` source in one
+    transaction, in chunks of ``chunk_size``. Rejected rows go to that
+    source's ``RejectWriter``.
+
+    Returns ``{'inserted': n, 'rejected': n}``.
+    """
+
+    sources = list(sources)
+    inserted = []
+
+    with transaction.atomic():
+
+        for rejects, records, rejected in parsed_chunks(sources, chunk_size, workers, sheet):
+
+            rejects.write(rejected)
+
+            created = Installation.objects.bulk_create(
+                [Installation(**fields) for number, fields, digest in records],
+                batch_size=chunk_size
+            )
+
+            inserted.extend(item.pk for item in created)
+
+    after_bulk_write([pk for pk in inserted if pk is not None])
+
+    return {
+        'inserted': len(inserted),
+        'rejected': sum(rejects.count for path, rejects in sources),
+    }
+
+
+def stored_hashes():
+    """
+    ``{ms_id_full: (id, row_hash)}`` of the stored installations. Where
+    a key is stored more than once the oldest row is used.
+
+    Returns ``(hashes, duplicates)``.
+    """
+
+    hashes = {}
+    duplicates = 0
+
+    for values in Installation.objects.order_by('id').values('id', *IMPORT_FIELDS).iterator():
+
+        key = values['ms_id_full']
+
+        if key in hashes:
+            duplicates += 1
+            continue
+
+        hashes[key] = (values['id'], row_hash(values))
+
+    return hashes, duplicates
+
+
+def upsert_installations(sources, chunk_size=CHUNK_SIZE, workers=1, sheet=None):
+    """
+    Bring the stored installations in line with full sheets, keyed on
+    ``ms_id_full``: new keys are inserted, rows whose hash differs are
+    updated and identical rows are not written at all. Stored keys
+    missing from every sheet are only counted, so their P4 links
+    survive; keys whose sheet row was rejected are not missing.
+
+    Returns ``{'inserted', 'updated', 'unchanged', 'vanished',
+    'duplicates', 'rejected'}`` counts.
+    """
+
+    sources = list(sources)
+    existing, duplicates = stored_hashes()
+
+    now = timezone.now()
+
+    seen = {}
+    rejected_keys = set()
+    inserted = []
+    updated = []
+    unchanged = 0
+
+    with transaction.atomic():
+
+        for rejects, records, rejected in parsed_chunks(sources, chunk_size, workers, sheet):
+
+            new = []
+            changed = []
+
+            for number, fields, digest in records:
+
+                key = fields['ms_id_full']
+
+                if key in seen:
+                    rejected.append((
+                        number,
+                        as_row(fields),
+                        f'duplicate MS ID Full, first on row {seen[key]}'
+                    ))
+                    continue
+
+                seen[key] = number
+
+                if key not in existing:
+                    new.append(Installation(**fields))
+
+                elif existing[key][1] == digest:
+                    unchanged += 1
+
+                else:
+                    changed.append(Installation(
+                        id=existing[key][0],
+                        version=F('version') + 1,
+                        updated_at=now,
+                        **fields
+                    ))
+
+            rejects.write(rejected)
+
+            rejected_keys.update(
+                clean_text(row.get('MS ID Full')) for number, row, reason in rejected
+            )
+
+            created = Installation.objects.bulk_create(new, batch_size=chunk_size)
+
+            Installation.objects.bulk_update(
+                changed,
+                [*IMPORT_FIELDS, 'version', 'updated_at'],
+                batch_size=chunk_size
+            )
+
+            inserted.extend(item.pk for item in created)
+            updated.extend(item.pk for item in changed)
+
+    if inserted or updated:
+        after_bulk_write([pk for pk in inserted + updated if pk is not None])
+
+    return {
+        'inserted': len(inserted),
+        'updated': len(updated),
+        'unchanged': unchanged,
+        'vanished': len(existing.keys() - seen.keys() - rejected_keys),
+        'duplicates': duplicates,
+        'rejected': sum(rejects.count for path, rejects in sources),
+    }
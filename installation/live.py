@@ -0,0 +1,243 @@
+import asyncio
+import json
+import logging
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections, transaction
+
+from .counters import KINDS
+
+
+logger = logging.getLogger(__name__)
+
+# Postgres channel the row events travel on between workers
+CHANNEL = "installation_live"
+
+# NOTIFY payloads are capped at 8000 bytes; rows per payload stay well below
+ROWS_PER_EVENT = 25
+
+# comment line sent to idle streams so proxies keep them open and
+# closed tabs are noticed
+HEARTBEAT = 15
+
+# seconds before a dropped LISTEN connection is retried
+RECONNECT_DELAY = 5
+
+# events a stream may fall behind by before it is told to reload
+QUEUE_SIZE = 200
+
+# columns a row event carries, i.e. what the list pages edit inline
+LIVE_FIELDS = {
+    "installation": ("status", "abd_number", "start_date", "end_date", "version"),
+    "p4": ("completed", "start_date", "end_date"),
+    "p8": ("completed", "start_date", "end_date"),
+    "p9": ("completed", "start_date", "end_date"),
+}
+
+
+def live_enabled():
+    """
+    Whether the live row events are served; they need ASGI.
+    """
+
+    return getattr(settings, "SERVED_OVER_ASGI", False)
+
+
+# ================= EVENTS =================
+def row_values(kind, obj):
+    """
+    ``{field: value}`` of the live columns of a record, or of a dict of
+    them.
+    """
+
+    get = obj.get if isinstance(obj, dict) else lambda field: getattr(obj, field)
+
+    return {field: get(field) for field in LIVE_FIELDS[kind]}
+
+
+def _payloads(kind, action, rows):
+
+    rows = list(rows)
+
+    # a reload carries no rows but still needs its one event
+    for start in range(0, max(len(rows), 1), ROWS_PER_EVENT):
+        yield json.dumps({
+            "kind": kind,
+            "action": action,
+            "rows": rows[start:start + ROWS_PER_EVENT],
+        }, cls=DjangoJSONEncoder)
+
+
+def publish(kind, action, rows=()):
+    """
+    Announce ``rows`` (``[{"id": ..., "values": {...}}, ...]``) of
+    ``kind`` as ``"change"``, ``"create"`` or ``"delete"``, or a
+    ``"reload"`` of the whole table, once the current transaction
+    commits. Rolled back writes are never announced, and nothing is
+    sent unless ``live_enabled()``.
+    """
+
+    if not live_enabled():
+        return
+
+    payloads = list(_payloads(kind, action, rows))
+
+    if connection.vendor == "postgresql":
+
+        # NOTIFY is transactional: delivered on commit, dropped on rollback
+        with connection.cursor() as cursor:
+            for payload in payloads:
+                cursor.execute("SELECT pg_notify(%s, %s)", [CHANNEL, payload])
+
+        return
+
+    # other databases only reach the streams of this process
+    transaction.on_commit(lambda: [HUB.deliver(payload) for payload in payloads])
+
+
+def publish_rows(kind, pks, action="change"):
+    """
+    ``publish`` the current live columns of the ``pks`` records.
+    """
+
+    if not live_enabled():
+        return
+
+    values = KINDS[kind].objects.filter(
+        pk__in=pks
+    ).values("id", *LIVE_FIELDS[kind])
+
+    rows = [
+        {"id": row["id"], "values": row_values(kind, row)}
+        for row in values
+    ]
+
+    if rows:
+        publish(kind, action, rows)
+
+
+# ================= HUB =================
+class _Hub:
+    """
+    Fans the events out to the open streams of this worker.
+
+    On Postgres one LISTEN connection per worker feeds every stream; the
+    other databases deliver from ``publish`` directly. Each stream keeps
+    the event loop it runs on, so delivery works from any thread.
+    """
+
+    def __init__(self):
+
+        self._queues = {}
+        self._listener = None
+
+    def deliver(self, payload):
+
+        for queue, loop in list(self._queues.items()):
+
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(self._put, queue, payload)
+
+    @staticmethod
+    def _put(queue, payload):
+
+        try:
+            queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            # a stream this far behind reloads instead of catching up
+            queue.get_nowait()
+            queue.put_nowait(None)
+
+    def ensure_listener(self):
+
+        if connections["default"].vendor != "postgresql":
+            return
+
+        listener = self._listener
+
+        if listener is None or listener.done() or listener.get_loop().is_closed():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+
+    async def _listen(self):
+
+        import psycopg
+
+        params = connections["default"].get_connection_params()
+
+        # the async connection brings its own cursor class and adapters
+        params.pop("cursor_factory", None)
+        params.pop("context", None)
+
+        while self._queues:
+
+            try:
+                async with await psycopg.AsyncConnection.connect(
+                    autocommit=True, **params
+                ) as conn:
+
+                    await conn.execute(f"LISTEN {CHANNEL}")
+
+                    async for notify in conn.notifies():
+                        self.deliver(notify.payload)
+
+            except psycopg.Error:
+                logger.warning("Live events: LISTEN connection lost, retrying", exc_info=True)
+                await asyncio.sleep(RECONNECT_DELAY)
+
+    def subscribe(self):
+
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self._queues[queue] = asyncio.get_running_loop()
+
+        self.ensure_listener()
+
+        return queue
+
+    def unsubscribe(self, queue):
+
+        self._queues.pop(queue, None)
+
+        if not self._queues and self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+
+
+HUB = _Hub()
+
+
+# ================= STREAM =================
+def _sse(event, data):
+
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+async def event_stream(kinds):
+    """
+    Server-sent events of the ``kinds`` tables, for an ASGI response.
+    """
+
+    queue = HUB.subscribe()
+
+    try:
+        # subscribed first, so nothing written after this line is missed
+        yield f"retry: {RECONNECT_DELAY * 1000}\n\n"
+
+        while True:
+
+            try:
+                payload = await asyncio.wait_for(queue.get(), HEARTBEAT)
+            except asyncio.TimeoutError:
+                HUB.ensure_listener()
+                yield ": keep-alive\n\n"
+                continue
+
+            if payload is None:
+                yield _sse("reload", "{}")
+                continue
+
+            if json.loads(payload)["kind"] in kinds:
+                yield _sse("rows", payload)
+
+    finally:
+        HUB.unsubscribe(queue)
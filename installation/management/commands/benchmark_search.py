@@ -0,0 +1,213 @@
+import asyncio
+import json
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from installation.autocomplete import INDEXES
+from installation.models import Installation, P4ID, P8ID
+from installation.search import SUGGEST_LIMIT, asearch_installations, search_installations
+
+
+# endpoint -> (sync lookup, async lookup, model and column the terms
+# come from); only f2_tb_search queries the database on every request
+ENDPOINTS = {
+    "f2_tb_search": (
+        lambda term: list(search_installations(term, "ms_id_full", SUGGEST_LIMIT)),
+        lambda term: asearch_installations(term, "ms_id_full", SUGGEST_LIMIT),
+        Installation, "ms_id_full",
+    ),
+    "search_ms": (
+        lambda term: INDEXES["ms"].search(term, SUGGEST_LIMIT),
+        lambda term: INDEXES["ms"].asearch(term, SUGGEST_LIMIT),
+        Installation, "ms_id",
+    ),
+    "search_p4": (
+        lambda term: INDEXES["p4"].search(term, SUGGEST_LIMIT),
+        lambda term: INDEXES["p4"].asearch(term, SUGGEST_LIMIT),
+        P4ID, "p4_id",
+    ),
+    "search_p8": (
+        lambda term: INDEXES["p8"].search(term, SUGGEST_LIMIT),
+        lambda term: INDEXES["p8"].asearch(term, SUGGEST_LIMIT),
+        P8ID, "p8_id",
+    ),
+}
+
+
+def _terms(model, field, count):
+    """
+    Keystroke-like terms: growing prefixes and slices of stored codes.
+    """
+
+    codes = list(
+        model.objects.exclude(**{field: ""}).order_by("?").values_list(field, flat=True)[:200]
+    )
+
+    if not codes:
+        return []
+
+    terms = []
+
+    while len(terms) < count:
+
+        code = random.choice(codes)
+        start = random.randrange(max(len(code) - 3, 1))
+
+        terms.append(code[start:start + random.randint(2, 8)])
+
+    return terms
+
+
+def _summary(latencies, elapsed):
+
+    ordered = sorted(latencies)
+
+    return {
+        "requests": len(ordered),
+        "elapsed_s": round(elapsed, 3),
+        "per_second": round(len(ordered) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(statistics.median(ordered) * 1000, 2),
+        "p95_ms": round(ordered[int(len(ordered) * 0.95) - 1] * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+# ================= SYNC PATH =================
+def run_sync(lookup, terms, workers):
+    """
+    Every term as one request of a WSGI worker with ``workers`` threads;
+    latency counts from the burst start, so queueing is included.
+    """
+
+    started = time.perf_counter()
+
+    def request(term):
+
+        lookup(term)
+
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        latencies = list(pool.map(request, terms))
+        # worker threads keep their connection between requests
+        list(pool.map(lambda _: connections.close_all(), range(workers)))
+
+    return _summary(latencies, time.perf_counter() - started)
+
+
+# ================= ASYNC PATH =================
+async def run_async(lookup, terms, queries):
+    """
+    Every term as one concurrent request on a single event loop. Each gets
+    its own thread-sensitive context, as the ASGI handler gives it.
+    """
+
+    started = time.perf_counter()
+
+    async def request(term):
+
+        # ORM calls of a request share one thread, started on first use;
+        # its connection ends with the request, as under ASGI
+        async with ThreadSensitiveContext():
+            try:
+                await lookup(term)
+            finally:
+                if queries:
+                    await sync_to_async(connections.close_all)()
+
+        return time.perf_counter() - started
+
+    latencies = await asyncio.gather(*(request(term) for term in terms))
+
+    return _summary(latencies, time.perf_counter() - started)
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Fire bursts of concurrent typeahead lookups through the sync and "
+        "the async search endpoints and compare throughput and latency."
+    )
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            "endpoints",
+            nargs="*",
+            metavar="endpoint",
+            help=f"Endpoints to measure: {', '.join(ENDPOINTS)} (default all).",
+        )
+
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=500,
+            help="Lookups per burst (default 500).",
+        )
+
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Threads of the sync worker (default 4).",
+        )
+
+        parser.add_argument(
+            "--json",
+            action="store_true",
+            help="Print the results as JSON.",
+        )
+
+    def handle(self, *args, **options):
+
+        endpoints = options["endpoints"] or list(ENDPOINTS)
+        unknown = [name for name in endpoints if name not in ENDPOINTS]
+
+        if unknown:
+            raise CommandError(f"Unknown endpoint(s): {', '.join(unknown)}")
+
+        if options["requests"] < 1 or options["workers"] < 1:
+            raise CommandError("--requests and --workers must be positive")
+
+        results = {}
+
+        for name in endpoints:
+
+            sync_lookup, async_lookup, model, field = ENDPOINTS[name]
+            terms = _terms(model, field, options["requests"])
+
+            if not terms:
+                self.stderr.write(f"{name}: no {model.__name__} rows to search, skipped")
+                continue
+
+            # build the typeahead indexes outside the measurement
+            sync_lookup(terms[0])
+
+            results[name] = {
+                "sync": run_sync(sync_lookup, terms, options["workers"]),
+                "async": asyncio.run(
+                    run_async(async_lookup, terms, queries=name == "f2_tb_search")
+                ),
+            }
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for name, paths in results.items():
+
+            for path, result in paths.items():
+
+                self.stdout.write(
+                    f"{name:<14} {path:<5} "
+                    f"{result['per_second']:>9} req/s  "
+                    f"p50 {result['p50_ms']:>8} ms  "
+                    f"p95 {result['p95_ms']:>8} ms  "
+                    f"max {result['max_ms']:>8} ms"
+                )
@@ -0,0 +1,395 @@
+import contextlib
+import io
+import json
+import logging
+import statistics
+import string
+import time
+import tracemalloc
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from common.middleware import QueryRecorder
+from entry.models import EquipmentEntry, Facility, System
+from installation.models import Installation, P4ID, P8ID, P9ID
+from ittask.models import Ticket
+
+
+# (app, label, path); {placeholders} are filled from samples() and views
+# whose sample is missing are skipped. Only pages that read: nothing here
+# writes, deletes or streams forever.
+VIEWS = [
+    # ================= INSTALLATION =================
+    ("installation", "installation_list", "/installation/"),
+    ("installation", "installation_list_search", "/installation/?search={term}"),
+    ("installation", "edit_installation", "/installation/edit/{installation}/"),
+    ("installation", "export_installations_csv", "/installation/export/installations/csv/"),
+    ("installation", "export_p4_csv", "/installation/export/p4/csv/"),
+    ("installation", "f2_tb", "/installation/f2-tb/"),
+    ("installation", "f2_tb_search", "/installation/f2-tb/search/?ms_id_full={term}"),
+    ("installation", "dashboard", "/installation/dashboard/"),
+    ("installation", "dashboard_filter", "/installation/dashboard/filter/?chart=status&value=Completed"),
+    ("installation", "facility_dashboard", "/installation/facility_dashboard/"),
+    ("installation", "facility_dashboard_all", "/installation/facility_dashboard_all/"),
+    ("installation", "facility_dashboard_all_json", "/installation/facility_dashboard_all/json/"),
+    ("installation", "facility_card", "/installation/facility_card/systems/?facility={facility}"),
+    ("installation", "installation_ancestors", "/installation/ms/{installation}/ancestors/"),
+    ("installation", "search_ms", "/installation/search-ms/?q={term}"),
+    ("installation", "p4_display_list", "/installation/p4/list/"),
+    ("installation", "p4_edit", "/installation/p4/edit/{p4}/"),
+    ("installation", "p4_dashboard", "/installation/p4/dashboard/"),
+    ("installation", "p4_dashboard_filter", "/installation/p4/dashboard/filter/?chart=status&value=Completed"),
+    ("installation", "p4_facility_dashboard", "/installation/p4_facility_dashboard/"),
+    ("installation", "p4_installations", "/installation/p4/{p4}/installations/"),
+    ("installation", "search_p4", "/installation/search-p4/?q=P4"),
+    ("installation", "p8_display_list", "/installation/p8/list/"),
+    ("installation", "p8_edit", "/installation/p8/edit/{p8}/"),
+    ("installation", "p8_dashboard", "/installation/p8/dashboard/"),
+    ("installation", "p8_facility_dashboard", "/installation/p8_facility_dashboard/"),
+    ("installation", "p8_installations", "/installation/p8/{p8}/installations/"),
+    ("installation", "search_p8", "/installation/search-p8/?q=P8"),
+    ("installation", "p9_display_list", "/installation/p9/list/"),
+    ("installation", "p9_edit", "/installation/p9/edit/{p9}/"),
+    ("installation", "p9_dashboard", "/installation/p9/dashboard/"),
+    ("installation", "p9_facility_dashboard", "/installation/p9_facility_dashboard/"),
+    ("installation", "p9_installations", "/installation/p9/{p9}/installations/"),
+
+    # ================= ENTRY =================
+    ("entry", "facility_grid", "/entry/facility_grid/"),
+    ("entry", "facility_list", "/entry/facilities/"),
+    ("entry", "systems_by_facility", "/entry/facilities/{entry_facility}/systems/"),
+    ("entry", "system_grid", "/entry/system_grid"),
+    ("entry", "equipment_entry", "/entry/equipment-entry/{system}/"),
+    ("entry", "equipment_detail", "/entry/equipment/{equipment}/"),
+    ("entry", "system_equipment_quantity", "/entry/system/{system}/facility/{entry_facility}/equipments/"),
+    ("entry", "facility_equipment_report", "/entry/report/facility-equipment/"),
+    ("entry", "export_facility_equipment_report", "/entry/export/facility-equipment-report/"),
+    ("entry", "ms_inco_act_entry", "/entry/ms-inco-act/"),
+    ("entry", "system_dashboard", "/entry/system_dashboard/"),
+    ("entry", "system_facility_cards", "/entry/system-facility-cards/"),
+    ("entry", "facility_system_summary", "/entry/facility-system-summary/"),
+    ("entry", "document_list", "/entry/documents/"),
+    ("entry", "abd_entry", "/entry/abd-entry/"),
+
+    # ================= ROOMWISE =================
+    ("roomwise", "roomwise_facility_list", "/roomwise/facility/list/"),
+    ("roomwise", "system_list", "/roomwise/system/list/"),
+    ("roomwise", "room_list", "/roomwise/room/list/"),
+    ("roomwise", "facility_rooms", "/roomwise/facility/{room_facility}/rooms/"),
+    ("roomwise", "facility_system_setup", "/roomwise/facility/{room_facility}/systems/"),
+    ("roomwise", "device_list", "/roomwise/device/list/"),
+    ("roomwise", "device_view", "/roomwise/facility/{room_facility}/devices/view/"),
+
+    # ================= TICKETS / IMAGES =================
+    ("ittask", "admin_dashboard", "/admin-dashboard/"),
+    ("ittask", "ticket_list", "/tickets/"),
+    ("ittask", "ticket_detail", "/tickets/{ticket}/"),
+    ("ittask", "user_list", "/users/"),
+    ("camera_app", "recent_image", "/camera_app/"),
+    ("camera_app", "image_list", "/camera_app/gallery/"),
+]
+
+# apps whose table sizes are recorded next to the timings
+COUNTED_APPS = ["installation", "entry", "ittask", "camera_app", "roomwise"]
+
+
+def _largest(queryset, children):
+    """
+    pk of the record with the most ``children``: the worst case a page
+    showing one record meets.
+    """
+
+    return queryset.annotate(n=Count(children)).order_by("-n", "pk").values_list("pk", flat=True).first()
+
+
+def samples():
+    """
+    Values for the placeholders of ``VIEWS``, taken from the data present.
+    """
+
+    facility = (
+        Installation.objects.values_list("facility", flat=True)
+        .annotate(n=Count("id")).order_by("-n").first()
+    )
+    installation = (
+        Installation.objects.filter(p4_entries__isnull=False)
+        .order_by("id").values("id", "ms_id").first()
+    )
+
+    values = {
+        "facility": facility,
+        "installation": installation and installation["id"],
+        "term": installation and installation["ms_id"][:5],
+        "p4": _largest(P4ID.objects, "ms_ids"),
+        "p8": _largest(P8ID.objects, "p4_ids"),
+        "p9": _largest(P9ID.objects, "p8_ids"),
+        "entry_facility": (
+            Facility.objects.filter(code=facility).values_list("pk", flat=True).first()
+            or Facility.objects.values_list("pk", flat=True).first()
+        ),
+        "system": _largest(System.objects, "equipmententry"),
+        "equipment": EquipmentEntry.objects.values_list("pk", flat=True).first(),
+        "ticket": Ticket.objects.values_list("pk", flat=True).first(),
+        "room_facility": None,
+    }
+
+    if apps.is_installed("roomwise"):
+        from roomwise.models import Facility as RoomFacility
+
+        values["room_facility"] = _largest(RoomFacility.objects, "rooms__devices")
+
+    return values
+
+
+def table_sizes():
+
+    return {
+        model._meta.label: model.objects.count()
+        for app in COUNTED_APPS if apps.is_installed(app)
+        for model in apps.get_app_config(app).get_models()
+    }
+
+
+def _fetch(client, path):
+    """
+    ``(response, bytes)``, with a streamed body read to the end so its
+    queries and time count.
+    """
+
+    response = client.get(path)
+
+    if response.streaming:
+        return response, sum(len(chunk) for chunk in response.streaming_content)
+
+    return response, len(response.content)
+
+
+def _recording(recorder):
+    """
+    A ``connection.execute_wrapper`` adding every query to ``recorder``.
+    """
+
+    def wrapper(execute, sql, params, many, context):
+
+        started = time.perf_counter()
+
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            recorder.add(sql, time.perf_counter() - started)
+
+    return wrapper
+
+
+def measure(client, path, repeat):
+    """
+    One cold request after a cache flush, ``repeat`` warm ones, and one
+    more under tracemalloc for the peak memory, kept out of the timings.
+    """
+
+    cache.clear()
+
+    runs = []
+
+    for run in range(repeat + 1):
+
+        recorder = QueryRecorder()
+
+        with connection.execute_wrapper(_recording(recorder)):
+
+            started = time.perf_counter()
+            response, size = _fetch(client, path)
+            elapsed = time.perf_counter() - started
+
+        runs.append((elapsed, recorder))
+
+    tracemalloc.start()
+
+    try:
+        _fetch(client, path)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    (cold, cold_queries), warm = runs[0], runs[1:]
+    queries = warm[-1][1]
+
+    return {
+        "path": path,
+        "status": response.status_code,
+        "bytes": size,
+        "cold_ms": round(cold * 1000, 2),
+        "cold_queries": cold_queries.count,
+        "warm_ms": round(statistics.median(elapsed for elapsed, recorder in warm) * 1000, 2),
+        "warm_min_ms": round(min(elapsed for elapsed, recorder in warm) * 1000, 2),
+        "queries": queries.count,
+        "query_ms": round(queries.seconds * 1000, 2),
+        # runs of the most repeated SQL shape; high counts mean an N+1
+        "repeats": queries.shapes.most_common(1)[0][1] if queries.shapes else 0,
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Request every major page as a logged-in user and record its cold "
+        "and warm response time, query count and peak Python memory. The "
+        "results, with the table sizes they were measured at, can be "
+        "written as JSON and compared against an earlier run."
+    )
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            "views",
+            nargs="*",
+            metavar="view",
+            help="Labels of the views to measure (default all).",
+        )
+
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=3,
+            help="Warm requests per view after the cold one (default 3).",
+        )
+
+        parser.add_argument(
+            "--user",
+            help="Username to request the pages as (default the first admin).",
+        )
+
+        parser.add_argument(
+            "--output",
+            help="Write the results as JSON to this file.",
+        )
+
+        parser.add_argument(
+            "--compare",
+            help="JSON file of an earlier run to show the changes against.",
+        )
+
+    def handle(self, *args, **options):
+
+        labels = {label for app, label, path in VIEWS}
+        unknown = [label for label in options["views"] if label not in labels]
+
+        if unknown:
+            raise CommandError(f"Unknown view(s): {', '.join(unknown)}")
+
+        if options["repeat"] < 1:
+            raise CommandError("--repeat must be at least 1")
+
+        baseline = {}
+
+        if options["compare"]:
+            try:
+                with open(options["compare"], encoding="utf-8") as handle:
+                    baseline = json.load(handle)["views"]
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f"Cannot read {options['compare']}: {e}")
+
+        User = get_user_model()
+
+        if options["user"]:
+            user = User.objects.filter(username=options["user"]).first()
+        else:
+            user = User.objects.filter(role="admin").order_by("id").first()
+
+        if user is None:
+            raise CommandError(
+                "No such user; pass --user or create an admin, e.g. with "
+                "generate_synthetic_data"
+            )
+
+        client = Client(raise_request_exception=False)
+        client.force_login(user)
+
+        # the budget warnings would repeat what the results say, per request
+        budget_log = logging.getLogger("common.queries")
+        budget_log.disabled = True
+
+        try:
+            # the test client's host name is not in ALLOWED_HOSTS
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+                results = self.run(client, options["views"], options["repeat"], baseline)
+        finally:
+            budget_log.disabled = False
+
+        if options["output"]:
+
+            with open(options["output"], "w", encoding="utf-8") as handle:
+                json.dump({
+                    "measured_at": timezone.now().isoformat(),
+                    "django": django.get_version(),
+                    "database": connection.vendor,
+                    "user": user.username,
+                    "repeat": options["repeat"],
+                    "tables": table_sizes(),
+                    "views": results,
+                }, handle, indent=2)
+
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def run(self, client, selected, repeat, baseline):
+
+        values = samples()
+        results = {}
+
+        for app, label, path in VIEWS:
+
+            if selected and label not in selected:
+                continue
+
+            if not apps.is_installed(app):
+                continue
+
+            missing = [
+                name for text, name, spec, conversion in string.Formatter().parse(path)
+                if name and values.get(name) is None
+            ]
+
+            if missing:
+                self.stderr.write(f"{label}: no {missing[0]} to request, skipped")
+                continue
+
+            # some views print debug output; keep it out of the report
+            with contextlib.redirect_stdout(io.StringIO()):
+                results[label] = result = measure(client, path.format(**values), repeat)
+
+            self.stdout.write(self.row(label, result, baseline.get(label)))
+
+        return results
+
+    def row(self, label, result, before=None):
+
+        line = (
+            f"{label:<34} {result['status']:>3}  "
+            f"cold {result['cold_ms']:>9} ms  "
+            f"warm {result['warm_ms']:>9} ms  "
+            f"{result['queries']:>5} queries ({result['repeats']:>4} repeats)  "
+            f"{result['peak_kib']:>9} KiB"
+        )
+
+        if before:
+            change = (
+                (result["warm_ms"] - before["warm_ms"]) / before["warm_ms"] * 100
+                if before["warm_ms"] else 0
+            )
+            line += f"  warm {change:+.0f}%  queries {result['queries'] - before['queries']:+d}"
+
+        if result["status"] >= 400:
+            return self.style.ERROR(line)
+
+        return line
@@ -0,0 +1,114 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from installation.models import Installation
+from installation.synthetic import BATCH_SIZE, generate
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Fill the database with a reproducible synthetic data set at "
+        "production-like volume: facilities and systems, installations, "
+        "P4/P8/P9 chains, rooms and devices, equipment quantities, "
+        "tickets and images. Meant for an empty benchmark database; "
+        "the derived tables and caches are refreshed afterwards."
+    )
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            "--installations",
+            type=int,
+            default=100_000,
+            help="Installation rows (default 100000); P4/P8/P9 records, "
+                 "rooms, devices and acts scale with it.",
+        )
+
+        parser.add_argument(
+            "--facilities",
+            type=int,
+            default=130,
+            help="Facilities the installations are spread over (default 130).",
+        )
+
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=25,
+            help="Users, one of them an admin (default 25).",
+        )
+
+        parser.add_argument(
+            "--tickets",
+            type=int,
+            help="Tickets (default one per 20 installations).",
+        )
+
+        parser.add_argument(
+            "--images",
+            type=int,
+            default=200,
+            help="Generated images stored under MEDIA_ROOT (default 200).",
+        )
+
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="Random seed; the same seed gives the same data (default 0).",
+        )
+
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help=f"Rows per INSERT (default {BATCH_SIZE}).",
+        )
+
+        parser.add_argument(
+            "--append",
+            action="store_true",
+            help="Add the data set even though installations already exist.",
+        )
+
+    def handle(self, *args, **options):
+
+        installations = options["installations"]
+        tickets = options["tickets"]
+
+        if tickets is None:
+            tickets = installations // 20
+
+        if installations < 1 or options["facilities"] < 1 or options["users"] < 1:
+            raise CommandError("--installations, --facilities and --users must be positive")
+
+        if tickets < 0 or options["images"] < 0:
+            raise CommandError("--tickets and --images cannot be negative")
+
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        if Installation.objects.exists() and not options["append"]:
+            raise CommandError(
+                "The database already has installations; use --append to "
+                "add the synthetic data next to them"
+            )
+
+        try:
+            counts = generate(
+                installations=installations,
+                facilities=options["facilities"],
+                users=options["users"],
+                tickets=tickets,
+                images=options["images"],
+                seed=options["seed"],
+                batch_size=options["batch_size"],
+                log=self.stdout.write,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for label, count in sorted(counts.items()):
+            self.stdout.write(f"{label:<40} {count:>9}")
+
+        self.stdout.write(self.style.SUCCESS("Synthetic data generated"))
@@ -0,0 +1,155 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from installation.importer import (
+    RejectWriter,
+    import_installations,
+    upsert_installations,
+)
+from installation.sheets import CHUNK_SIZE, COLUMNS, read_header
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Import installations from Excel or CSV sheets. Rows are "
+        "streamed and parsed in chunks (optionally by a pool of worker "
+        "processes, each reading its own range of a sheet) and written "
+        "in one transaction; rows that cannot be imported are written to "
+        "a rejects file per sheet. With "
+        "--upsert the sheets are diffed against the stored rows by MS ID "
+        "Full and only new or changed rows are written."
+    )
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            "paths",
+            nargs="+",
+            metavar="path",
+            help="Path to an .xlsx or .csv file.",
+        )
+
+        parser.add_argument(
+            "--sheet",
+            help="Worksheet name (defaults to the active sheet).",
+        )
+
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=CHUNK_SIZE,
+            help=f"Rows per batch (default {CHUNK_SIZE}).",
+        )
+
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Processes reading and parsing sheets in parallel "
+                 "(default 1, read in this process).",
+        )
+
+        parser.add_argument(
+            "--upsert",
+            action="store_true",
+            help="Insert new rows and update changed ones, keyed on "
+                 "MS ID Full, instead of inserting every row.",
+        )
+
+        parser.add_argument(
+            "--rejects",
+            help="Where to write rejected rows when importing a single "
+                 "file (default <path>.rejected.csv).",
+        )
+
+    def handle(self, *args, **options):
+
+        paths = options["paths"]
+
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be at least 1")
+
+        if options["workers"] < 1:
+            raise CommandError("--workers must be at least 1")
+
+        if options["rejects"] and len(paths) > 1:
+            raise CommandError("--rejects only works with a single file")
+
+        for path in paths:
+
+            if not os.path.exists(path):
+                raise CommandError(f"{path} does not exist")
+
+            header = read_header(path, options["sheet"])
+            missing = [column for column in COLUMNS if column not in header]
+
+            if len(missing) == len(COLUMNS):
+                raise CommandError(
+                    f"None of the expected columns found in {path}: "
+                    f"{', '.join(COLUMNS)}"
+                )
+
+            if missing:
+                self.stderr.write(self.style.WARNING(
+                    f"{path}: missing column(s), left blank: {', '.join(missing)}"
+                ))
+
+        sources = [
+            (
+                path,
+                RejectWriter(
+                    options["rejects"]
+                    or f"{os.path.splitext(path)[0]}.rejected.csv"
+                ),
+            )
+            for path in paths
+        ]
+
+        if options["upsert"]:
+            run = upsert_installations
+        else:
+            run = import_installations
+
+        try:
+            result = run(
+                sources,
+                options["chunk_size"],
+                options["workers"],
+                options["sheet"]
+            )
+        finally:
+            for path, rejects in sources:
+                rejects.close()
+
+        if options["upsert"]:
+
+            self.stdout.write(self.style.SUCCESS(
+                f"Inserted {result['inserted']}, updated {result['updated']}, "
+                f"unchanged {result['unchanged']} row(s)"
+            ))
+
+            if result["vanished"]:
+                self.stdout.write(self.style.WARNING(
+                    f"{result['vanished']} stored MS ID Full value(s) are "
+                    f"not in the sheet and were left in place"
+                ))
+
+            if result["duplicates"]:
+                self.stdout.write(self.style.WARNING(
+                    f"{result['duplicates']} stored row(s) repeat an MS ID "
+                    f"Full and were skipped"
+                ))
+
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(f"Imported {result['inserted']} row(s)")
+            )
+
+        for path, rejects in sources:
+
+            if rejects.count:
+                self.stdout.write(self.style.WARNING(
+                    f"Rejected {rejects.count} row(s), see {rejects.path}"
+                ))
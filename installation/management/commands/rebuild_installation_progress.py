@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from installation.progress import rebuild_progress, verify_progress
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Rebuild the InstallationProgress table from the live "
+        "P4/P8/P9 data and verify it afterwards."
+    )
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            "--verify-only",
+            action="store_true",
+            help="Only compare the table against the live data.",
+        )
+
+    def handle(self, *args, **options):
+
+        if not options["verify_only"]:
+
+            count = rebuild_progress()
+
+            self.stdout.write(f"Rebuilt progress for {count} installation(s)")
+
+        stale = verify_progress()
+
+        if stale:
+            raise CommandError(
+                f"{len(stale)} stale progress row(s), "
+                f"e.g. installation id(s) {stale[:10]}"
+            )
+
+        self.stdout.write(self.style.SUCCESS("Progress table verified"))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from installation.closure import rebuild_closure, verify_closure
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Rebuild the MilestoneClosure table from the P4/P8/P9 M2M "
+        "tables and verify it afterwards."
+    )
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            "--verify-only",
+            action="store_true",
+            help="Only compare the table against the M2M tables.",
+        )
+
+    def handle(self, *args, **options):
+
+        if not options["verify_only"]:
+
+            count = rebuild_closure()
+
+            self.stdout.write(f"Rebuilt {count} closure row(s)")
+
+        stale = verify_closure()
+
+        if stale:
+            raise CommandError(
+                f"{len(stale)} installation(s) with stale closure rows, "
+                f"e.g. id(s) {stale[:10]}"
+            )
+
+        self.stdout.write(self.style.SUCCESS("Closure table verified"))
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from installation.counters import KINDS, reconcile_counters, verify_counters
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Recount the dashboard counters from the Installation and "
+        "P4/P8/P9 tables, fix the buckets that drifted and verify them "
+        "afterwards."
+    )
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            "kinds",
+            nargs="*",
+            metavar="kind",
+            help=f"Counters to reconcile: {', '.join(KINDS)} (default all).",
+        )
+
+        parser.add_argument(
+            "--verify-only",
+            action="store_true",
+            help="Only compare the counters against the tables.",
+        )
+
+    def handle(self, *args, **options):
+
+        kinds = options["kinds"] or list(KINDS)
+        unknown = [kind for kind in kinds if kind not in KINDS]
+
+        if unknown:
+            raise CommandError(f"Unknown kind(s): {', '.join(unknown)}")
+
+        stale = {}
+
+        for kind in kinds:
+
+            if not options["verify_only"]:
+
+                fixed = reconcile_counters(kind)
+
+                self.stdout.write(f"{kind}: fixed {fixed} bucket(s)")
+
+            drift = verify_counters(kind)
+
+            if drift:
+                stale[kind] = drift
+
+        if stale:
+            raise CommandError("Counters still drift: " + "; ".join(
+                f"{kind} {len(drift)} bucket(s), e.g. {drift[:3]}"
+                for kind, drift in stale.items()
+            ))
+
+        self.stdout.write(self.style.SUCCESS("Dashboard counters verified"))
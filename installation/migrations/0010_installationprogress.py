@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-18 15:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('installation', '0009_installation_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InstallationProgress',
+            fields=[
+                ('installation', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='progress', serialize=False, to='installation.installation')),
+                ('f2_completed', models.BooleanField(default=False)),
+                ('p4_completed', models.BooleanField(default=False)),
+                ('p8_completed', models.BooleanField(default=False)),
+                ('p9_completed', models.BooleanField(default=False)),
+                ('p4_covering', models.JSONField(blank=True, default=list)),
+                ('p8_covering', models.JSONField(blank=True, default=list)),
+                ('p9_covering', models.JSONField(blank=True, default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
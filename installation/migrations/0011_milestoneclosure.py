@@ -0,0 +1,64 @@
+# Generated by Django 6.0 on 2026-10-18 15:24
+
+import django.db.models.deletion
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def populate_closure(apps, schema_editor):
+
+    P4ID = apps.get_model('installation', 'P4ID')
+    P8ID = apps.get_model('installation', 'P8ID')
+    P9ID = apps.get_model('installation', 'P9ID')
+    MilestoneClosure = apps.get_model('installation', 'MilestoneClosure')
+
+    p4_by_installation = defaultdict(set)
+    for installation_id, p4_pk in P4ID.ms_ids.through.objects.values_list('installation_id', 'p4id_id'):
+        p4_by_installation[installation_id].add(p4_pk)
+
+    p8_by_p4 = defaultdict(set)
+    for p4_pk, p8_pk in P8ID.p4_ids.through.objects.values_list('p4id_id', 'p8id_id'):
+        p8_by_p4[p4_pk].add(p8_pk)
+
+    p9_by_p8 = defaultdict(set)
+    for p8_pk, p9_pk in P9ID.p8_ids.through.objects.values_list('p8id_id', 'p9id_id'):
+        p9_by_p8[p8_pk].add(p9_pk)
+
+    rows = []
+
+    for installation_id, p4_pks in p4_by_installation.items():
+
+        p8_pks = set().union(*(p8_by_p4[pk] for pk in p4_pks))
+        p9_pks = set().union(*(p9_by_p8[pk] for pk in p8_pks))
+
+        rows += [MilestoneClosure(installation_id=installation_id, level='p4', p4_id=pk) for pk in p4_pks]
+        rows += [MilestoneClosure(installation_id=installation_id, level='p8', p8_id=pk) for pk in p8_pks]
+        rows += [MilestoneClosure(installation_id=installation_id, level='p9', p9_id=pk) for pk in p9_pks]
+
+    MilestoneClosure.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('installation', '0010_installationprogress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MilestoneClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(choices=[('p4', 'P4'), ('p8', 'P8'), ('p9', 'P9')], max_length=2)),
+                ('installation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='closure', to='installation.installation')),
+                ('p4', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='closure', to='installation.p4id')),
+                ('p8', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='closure', to='installation.p8id')),
+                ('p9', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='closure', to='installation.p9id')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['installation', 'level'], name='installatio_install_74c8c4_idx')],
+            },
+        ),
+        migrations.RunPython(populate_closure, migrations.RunPython.noop),
+    ]
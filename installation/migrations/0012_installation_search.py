@@ -0,0 +1,117 @@
+# Generated by Django 6.0 on 2026-10-18 16:02
+
+import logging
+
+from django.conf import settings
+from django.db import DatabaseError, migrations, transaction
+
+
+logger = logging.getLogger(__name__)
+
+
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    # icontains compiles to UPPER(col::text) LIKE UPPER(%s)
+    "CREATE INDEX IF NOT EXISTS installation_ms_id_trgm "
+    "ON installation_installation USING gin (UPPER(ms_id::text) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS installation_ms_id_full_trgm "
+    "ON installation_installation USING gin (UPPER(ms_id_full::text) gin_trgm_ops)",
+]
+
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS installation_ms_id_trgm",
+    "DROP INDEX IF EXISTS installation_ms_id_full_trgm",
+]
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE installation_search USING fts5("
+    "ms_id, ms_id_full, tokenize='trigram', "
+    "content='installation_installation', content_rowid='id')",
+
+    "CREATE TRIGGER installation_search_ai AFTER INSERT ON installation_installation BEGIN "
+    "INSERT INTO installation_search(rowid, ms_id, ms_id_full) "
+    "VALUES (new.id, new.ms_id, new.ms_id_full); END",
+
+    "CREATE TRIGGER installation_search_ad AFTER DELETE ON installation_installation BEGIN "
+    "INSERT INTO installation_search(installation_search, rowid, ms_id, ms_id_full) "
+    "VALUES ('delete', old.id, old.ms_id, old.ms_id_full); END",
+
+    "CREATE TRIGGER installation_search_au AFTER UPDATE ON installation_installation BEGIN "
+    "INSERT INTO installation_search(installation_search, rowid, ms_id, ms_id_full) "
+    "VALUES ('delete', old.id, old.ms_id, old.ms_id_full); "
+    "INSERT INTO installation_search(rowid, ms_id, ms_id_full) "
+    "VALUES (new.id, new.ms_id, new.ms_id_full); END",
+
+    "INSERT INTO installation_search(installation_search) VALUES ('rebuild')",
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS installation_search_ai",
+    "DROP TRIGGER IF EXISTS installation_search_ad",
+    "DROP TRIGGER IF EXISTS installation_search_au",
+    "DROP TABLE IF EXISTS installation_search",
+]
+
+
+def _run(schema_editor, statements):
+
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def create_search_index(apps, schema_editor):
+
+    vendor = schema_editor.connection.vendor
+
+    if vendor == "postgresql":
+
+        # without pg_trgm every search is a sequential scan; fail here
+        # rather than go unnoticed in production, unless the deployment
+        # opted out (the installation.W001 check keeps reporting it)
+        if not getattr(settings, "SEARCH_TRIGRAM_OPTIONAL", False):
+            _run(schema_editor, POSTGRES_FORWARD)
+            return
+
+        try:
+            with transaction.atomic(using=schema_editor.connection.alias):
+                _run(schema_editor, POSTGRES_FORWARD)
+        except DatabaseError:
+            logger.warning(
+                "pg_trgm unavailable: installation search falls back to "
+                "sequential scans",
+                exc_info=True
+            )
+
+    elif vendor == "sqlite":
+        try:
+            with transaction.atomic(using=schema_editor.connection.alias):
+                _run(schema_editor, SQLITE_FORWARD)
+        except DatabaseError:
+            # development databases only: search falls back to icontains
+            logger.warning(
+                "SQLite without the FTS5 trigram tokenizer: installation "
+                "search falls back to a full scan",
+                exc_info=True
+            )
+
+
+def drop_search_index(apps, schema_editor):
+
+    vendor = schema_editor.connection.vendor
+
+    if vendor == "postgresql":
+        _run(schema_editor, POSTGRES_REVERSE)
+
+    elif vendor == "sqlite":
+        _run(schema_editor, SQLITE_REVERSE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('installation', '0011_milestoneclosure'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
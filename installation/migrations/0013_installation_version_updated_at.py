@@ -0,0 +1,63 @@
+# Generated by Django 6.0 on 2026-10-18 18:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+# adding NOT NULL columns makes SQLite rebuild the table, which drops
+# the FTS sync triggers of 0012; the update trigger now only fires for
+# the indexed columns, so inline edits leave the FTS table alone
+SQLITE_TRIGGERS = [
+    "CREATE TRIGGER installation_search_ai AFTER INSERT ON installation_installation BEGIN "
+    "INSERT INTO installation_search(rowid, ms_id, ms_id_full) "
+    "VALUES (new.id, new.ms_id, new.ms_id_full); END",
+
+    "CREATE TRIGGER installation_search_ad AFTER DELETE ON installation_installation BEGIN "
+    "INSERT INTO installation_search(installation_search, rowid, ms_id, ms_id_full) "
+    "VALUES ('delete', old.id, old.ms_id, old.ms_id_full); END",
+
+    "CREATE TRIGGER installation_search_au AFTER UPDATE OF ms_id, ms_id_full ON installation_installation BEGIN "
+    "INSERT INTO installation_search(installation_search, rowid, ms_id, ms_id_full) "
+    "VALUES ('delete', old.id, old.ms_id, old.ms_id_full); "
+    "INSERT INTO installation_search(rowid, ms_id, ms_id_full) "
+    "VALUES (new.id, new.ms_id, new.ms_id_full); END",
+]
+
+
+def restore_search_triggers(apps, schema_editor):
+
+    connection = schema_editor.connection
+
+    if connection.vendor != "sqlite":
+        return
+
+    if "installation_search" not in connection.introspection.table_names():
+        return
+
+    for name in ("ai", "ad", "au"):
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS installation_search_{name}")
+
+    for sql in SQLITE_TRIGGERS:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('installation', '0012_installation_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='installation',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='installation',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 6.0 on 2026-10-18 19:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('installation', '0013_installation_version_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='installation',
+            index=models.Index(fields=['type', 'facility', 'system'], name='installation_type_fac_sys'),
+        ),
+        migrations.AddIndex(
+            model_name='installation',
+            index=models.Index(fields=['status', 'end_date'], name='installation_status_end'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 6.0 on 2026-10-18 19:50
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, Value
+from django.db.models.functions import Coalesce, ExtractYear
+
+
+def fill_counters(apps, schema_editor):
+
+    DashboardCounter = apps.get_model('installation', 'DashboardCounter')
+
+    year = Coalesce(ExtractYear('end_date'), Value(0), output_field=IntegerField())
+    counters = []
+
+    rows = apps.get_model('installation', 'Installation').objects.annotate(
+        year=year
+    ).values('facility', 'status', 'year').annotate(total=Count('id')).order_by()
+
+    for row in rows:
+        counters.append(DashboardCounter(kind='installation', **row))
+
+    for kind, model_name in (('p4', 'P4ID'), ('p8', 'P8ID'), ('p9', 'P9ID')):
+
+        rows = apps.get_model('installation', model_name).objects.annotate(
+            year=year
+        ).values('completed', 'year').annotate(total=Count('id')).order_by()
+
+        for row in rows:
+            counters.append(DashboardCounter(
+                kind=kind,
+                facility='',
+                status='Completed' if row['completed'] else 'Pending',
+                year=row['year'],
+                total=row['total'],
+            ))
+
+    DashboardCounter.objects.bulk_create(counters, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('installation', '0014_installation_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('installation', 'Installation'), ('p4', 'P4'), ('p8', 'P8'), ('p9', 'P9')], max_length=12)),
+                ('facility', models.CharField(blank=True, max_length=255)),
+                ('status', models.CharField(max_length=100)),
+                ('year', models.PositiveSmallIntegerField(default=0)),
+                ('total', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'facility', 'status', 'year'), name='dashboard_counter_bucket')],
+            },
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
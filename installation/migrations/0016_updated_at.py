@@ -0,0 +1,32 @@
+# Generated by Django 6.0 on 2026-10-18 20:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('installation', '0015_dashboardcounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='p4id',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='p8id',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='p9id',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name='installation',
+            index=models.Index(fields=['updated_at'], name='installation_updated_at'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+from collections import defaultdict
+
+from django.db import migrations
+
+
+def populate_paths(apps, schema_editor):
+
+    P4ID = apps.get_model('installation', 'P4ID')
+    P8ID = apps.get_model('installation', 'P8ID')
+    P9ID = apps.get_model('installation', 'P9ID')
+    MilestoneClosure = apps.get_model('installation', 'MilestoneClosure')
+
+    p8_by_p4 = defaultdict(list)
+    for p4_pk, p8_pk in P8ID.p4_ids.through.objects.values_list('p4id_id', 'p8id_id'):
+        p8_by_p4[p4_pk].append(p8_pk)
+
+    p9_by_p8 = defaultdict(list)
+    for p8_pk, p9_pk in P9ID.p8_ids.through.objects.values_list('p8id_id', 'p9id_id'):
+        p9_by_p8[p8_pk].append(p9_pk)
+
+    MilestoneClosure.objects.all().delete()
+
+    rows = []
+
+    for installation_id, p4_pk in P4ID.ms_ids.through.objects.values_list('installation_id', 'p4id_id'):
+
+        rows.append(MilestoneClosure(installation_id=installation_id, level='p4', p4_id=p4_pk))
+
+        for p8_pk in p8_by_p4[p4_pk]:
+
+            rows.append(MilestoneClosure(installation_id=installation_id, level='p8', p4_id=p4_pk, p8_id=p8_pk))
+
+            rows += [
+                MilestoneClosure(installation_id=installation_id, level='p9', p4_id=p4_pk, p8_id=p8_pk, p9_id=p9_pk)
+                for p9_pk in p9_by_p8[p8_pk]
+            ]
+
+    MilestoneClosure.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('installation', '0016_updated_at'),
+    ]
+
+    operations = [
+        # closure rows now keep the whole path, see MilestoneClosure
+        migrations.RunPython(populate_paths, migrations.RunPython.noop),
+    ]
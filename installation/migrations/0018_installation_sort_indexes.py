@@ -0,0 +1,25 @@
+# Generated by Django 6.0 on 2026-10-18 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('installation', '0017_closure_paths'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='installation',
+            index=models.Index(fields=['ms_id', 'id'], name='installation_ms_id_sort'),
+        ),
+        migrations.AddIndex(
+            model_name='installation',
+            index=models.Index(fields=['facility', 'system', 'id'], name='installation_fac_sys_sort'),
+        ),
+        migrations.AddIndex(
+            model_name='installation',
+            index=models.Index(fields=['status', 'id'], name='installation_status_sort'),
+        ),
+    ]
@@ -0,0 +1,184 @@
+# Generated by Django 6.0 on 2026-10-18 22:40
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+import installation.fields
+
+
+# text columns stored as InstallationLabel codes from here on
+ENCODED = {
+    "status": 100,
+    "type": 10,
+    "system": 255,
+    "facility": 255,
+    "saw_program": 255,
+    "unit": 100,
+    "stage": 100,
+}
+
+# indexes over encoded columns, rebuilt on the codes
+INDEXES = [
+    models.Index(fields=["type", "facility", "system"], name="installation_type_fac_sys"),
+    models.Index(fields=["status", "end_date"], name="installation_status_end"),
+    models.Index(fields=["facility", "system", "id"], name="installation_fac_sys_sort"),
+    models.Index(fields=["status", "id"], name="installation_status_sort"),
+]
+
+# the SQLite table rebuilds below drop the FTS triggers of migration 0012
+SQLITE_TRIGGERS = {
+    "installation_search_ai":
+        "CREATE TRIGGER installation_search_ai AFTER INSERT ON installation_installation BEGIN "
+        "INSERT INTO installation_search(rowid, ms_id, ms_id_full) "
+        "VALUES (new.id, new.ms_id, new.ms_id_full); END",
+
+    "installation_search_ad":
+        "CREATE TRIGGER installation_search_ad AFTER DELETE ON installation_installation BEGIN "
+        "INSERT INTO installation_search(installation_search, rowid, ms_id, ms_id_full) "
+        "VALUES ('delete', old.id, old.ms_id, old.ms_id_full); END",
+
+    "installation_search_au":
+        "CREATE TRIGGER installation_search_au AFTER UPDATE ON installation_installation BEGIN "
+        "INSERT INTO installation_search(installation_search, rowid, ms_id, ms_id_full) "
+        "VALUES ('delete', old.id, old.ms_id, old.ms_id_full); "
+        "INSERT INTO installation_search(rowid, ms_id, ms_id_full) "
+        "VALUES (new.id, new.ms_id, new.ms_id_full); END",
+}
+
+
+def encode_columns(apps, schema_editor):
+
+    Installation = apps.get_model("installation", "Installation")
+    InstallationLabel = apps.get_model("installation", "InstallationLabel")
+
+    db = schema_editor.connection.alias
+    installations = Installation.objects.using(db)
+
+    # stored in alphabetical order, so the existing values keep sorting
+    # by name when ordered by code
+    InstallationLabel.objects.using(db).bulk_create([
+        InstallationLabel(column=column, name=name)
+        for column in sorted(ENCODED)
+        for name in sorted(set(installations.values_list(column, flat=True)))
+    ], batch_size=500)
+
+    for column in ENCODED:
+        installations.update(**{
+            f"{column}_code": Subquery(
+                InstallationLabel.objects.using(db).filter(
+                    column=column, name=OuterRef(column)
+                ).values("id")[:1]
+            )
+        })
+
+
+def decode_columns(apps, schema_editor):
+
+    Installation = apps.get_model("installation", "Installation")
+    InstallationLabel = apps.get_model("installation", "InstallationLabel")
+
+    db = schema_editor.connection.alias
+
+    for column in ENCODED:
+        Installation.objects.using(db).update(**{
+            column: Subquery(
+                InstallationLabel.objects.using(db).filter(
+                    pk=OuterRef(f"{column}_code")
+                ).values("name")[:1]
+            )
+        })
+
+
+def restore_search_triggers(apps, schema_editor):
+
+    connection = schema_editor.connection
+
+    if connection.vendor != "sqlite":
+        return
+
+    with connection.cursor() as cursor:
+
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s",
+            ["installation_installation"]
+        )
+        existing = {name for name, in cursor.fetchall()}
+
+    # only where migration 0012 built the search table
+    if "installation_search" not in connection.introspection.table_names():
+        return
+
+    for name, sql in SQLITE_TRIGGERS.items():
+        if name not in existing:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('installation', '0018_installation_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InstallationLabel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('column', models.CharField(max_length=30)),
+                ('name', models.CharField(max_length=255)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('column', 'name'), name='installation_label_unique')],
+            },
+        ),
+        # unapplying, the rebuilds drop the triggers again; this runs last
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        *[
+            migrations.RemoveIndex(model_name='installation', name=index.name)
+            for index in INDEXES
+        ],
+        *[
+            migrations.AddField(
+                model_name='installation',
+                name=f'{column}_code',
+                field=models.IntegerField(null=True),
+            )
+            for column in ENCODED
+        ],
+        # nullable first: unapplying adds them back empty to a filled
+        # table, and they turn NOT NULL only after decode_columns ran
+        *[
+            migrations.AlterField(
+                model_name='installation',
+                name=column,
+                field=models.CharField(max_length=max_length, null=True),
+            )
+            for column, max_length in ENCODED.items()
+        ],
+        migrations.RunPython(encode_columns, decode_columns),
+        *[
+            migrations.RemoveField(model_name='installation', name=column)
+            for column in ENCODED
+        ],
+        *[
+            migrations.RenameField(
+                model_name='installation',
+                old_name=f'{column}_code',
+                new_name=column,
+            )
+            for column in ENCODED
+        ],
+        *[
+            migrations.AlterField(
+                model_name='installation',
+                name=column,
+                field=installation.fields.LabelField(max_length=max_length),
+            )
+            for column, max_length in ENCODED.items()
+        ],
+        *[
+            migrations.AddIndex(model_name='installation', index=index)
+            for index in INDEXES
+        ],
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
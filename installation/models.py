@@ -1,4 +1,22 @@
-from django.db import models
+from django.db import models, transaction
+
+from .fields import LabelField
+
+
+class InstallationLabel(models.Model):
+
+    # Installation column the text belongs to
+    column = models.CharField(max_length=30)
+    name = models.CharField(max_length=255)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["column", "name"], name="installation_label_unique"),
+        ]
+
+    def __str__(self):
+        return self.name
+
 
 class Installation(models.Model):
 
@@ -7,19 +25,54 @@ class Installation(models.Model):
     ms_id_full = models.CharField(max_length=255)
     ms_id = models.CharField(max_length=255)
 
-    status = models.CharField(max_length=100)
-    type = models.CharField(max_length=10)
+    # the repeated texts are stored as InstallationLabel codes
+    status = LabelField(max_length=100)
+    type = LabelField(max_length=10)
     abd_number = models.CharField(max_length=100)
 
     start_date = models.DateField(null=True, blank=True)
     end_date = models.DateField(null=True, blank=True)
-    system = models.CharField(max_length=255)
-    facility = models.CharField(max_length=255)
+    system = LabelField(max_length=255)
+    facility = LabelField(max_length=255)
+
+    saw_program = LabelField(max_length=255)
 
-    saw_program = models.CharField(max_length=255)
+    unit = LabelField(max_length=100)
+    stage = LabelField(max_length=100)
 
-    unit = models.CharField(max_length=100)
-    stage = models.CharField(max_length=100)
+    # bumped on every write; clients echo it back so stale edits are refused
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # dashboards: TB rows grouped facility -> system
+            models.Index(fields=["type", "facility", "system"], name="installation_type_fac_sys"),
+            # status filters and completions per period
+            models.Index(fields=["status", "end_date"], name="installation_status_end"),
+            # latest change, for conditional GETs
+            models.Index(fields=["updated_at"], name="installation_updated_at"),
+            # keyset pages of the ?sort= orderings on the installation list;
+            # facility and status pages follow the label codes
+            models.Index(fields=["ms_id", "id"], name="installation_ms_id_sort"),
+            models.Index(fields=["facility", "system", "id"], name="installation_fac_sys_sort"),
+            models.Index(fields=["status", "id"], name="installation_status_sort"),
+        ]
+
+    def save(self, *args, **kwargs):
+
+        if self.pk is not None and not self._state.adding:
+
+            self.version += 1
+
+            update_fields = kwargs.get("update_fields")
+
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "version", "updated_at"}
+
+        # the counter signals run inside the same transaction as the write
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return self.ms_id_full
@@ -41,6 +94,17 @@ class P4ID(models.Model):
     end_date = models.DateField(null=True, blank=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def save(self, *args, **kwargs):
+
+        update_fields = kwargs.get("update_fields")
+
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "updated_at"}
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return self.p4_id
@@ -64,6 +128,17 @@ class P8ID(models.Model):
     end_date = models.DateField(null=True, blank=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def save(self, *args, **kwargs):
+
+        update_fields = kwargs.get("update_fields")
+
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "updated_at"}
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return self.p8_id
@@ -96,5 +171,132 @@ class P9ID(models.Model):
         auto_now_add=True
     )
 
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        db_index=True
+    )
+
+    def save(self, *args, **kwargs):
+
+        update_fields = kwargs.get("update_fields")
+
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "updated_at"}
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def __str__(self):
+        return self.p9_id
+
+
+class InstallationProgress(models.Model):
+
+    installation = models.OneToOneField(
+        Installation,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="progress"
+    )
+
+    f2_completed = models.BooleanField(default=False)
+    p4_completed = models.BooleanField(default=False)
+    p8_completed = models.BooleanField(default=False)
+    p9_completed = models.BooleanField(default=False)
+
+    # primary keys of the completed P4/P8/P9 records covering the installation
+    p4_covering = models.JSONField(default=list, blank=True)
+    p8_covering = models.JSONField(default=list, blank=True)
+    p9_covering = models.JSONField(default=list, blank=True)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.installation_id} progress"
+
+
+
+class MilestoneClosure(models.Model):
+
+    LEVEL_CHOICES = [
+        ("p4", "P4"),
+        ("p8", "P8"),
+        ("p9", "P9"),
+    ]
+
+    installation = models.ForeignKey(
+        Installation,
+        on_delete=models.CASCADE,
+        related_name="closure"
+    )
+
+    level = models.CharField(max_length=2, choices=LEVEL_CHOICES)
+
+    # the path from the installation up to its ``level`` record: p4 is
+    # always set, p8 from level p8 on and p9 only on level p9
+    p4 = models.ForeignKey(
+        P4ID,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name="closure"
+    )
+
+    p8 = models.ForeignKey(
+        P8ID,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name="closure"
+    )
+
+    p9 = models.ForeignKey(
+        P9ID,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name="closure"
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["installation", "level"]),
+        ]
+
+    def __str__(self):
+        return f"{self.installation_id} -> {self.level}"
+
+
+
+class DashboardCounter(models.Model):
+
+    KIND_CHOICES = [
+        ("installation", "Installation"),
+        ("p4", "P4"),
+        ("p8", "P8"),
+        ("p9", "P9"),
+    ]
+
+    kind = models.CharField(max_length=12, choices=KIND_CHOICES)
+
+    # blank for P4/P8/P9, which are not tied to one facility
+    facility = models.CharField(max_length=255, blank=True)
+
+    # installation status, or Completed / Pending for P4/P8/P9
+    status = models.CharField(max_length=100)
+
+    # year of the end date, 0 without one
+    year = models.PositiveSmallIntegerField(default=0)
+
+    total = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["kind", "facility", "status", "year"],
+                name="dashboard_counter_bucket"
+            ),
+        ]
+
     def __str__(self):
-        return self.p9_id
\ No newline at end of file
+        return f"{self.kind} {self.facility} {self.status} {self.year}: {self.total}"
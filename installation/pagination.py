@@ -0,0 +1,270 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import F, Field, Func, Q, Value
+from django.db.models.lookups import GreaterThan, LessThan
+
+
+PER_PAGE = 50
+
+
+# ================= CURSOR TOKENS =================
+def encode_cursor(direction, values):
+
+    raw = json.dumps([direction, values], cls=DjangoJSONEncoder)
+
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """
+    ``(direction, values)`` or ``None`` for a missing or garbled cursor.
+    """
+
+    if not token:
+        return None
+
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        direction, values = json.loads(raw)
+    except (binascii.Error, ValueError, TypeError):
+        return None
+
+    if direction not in ("n", "p") or not isinstance(values, list):
+        return None
+
+    return direction, values
+
+
+def _column(queryset, name):
+
+    annotation = queryset.query.annotations.get(name)
+
+    if annotation is not None:
+        return annotation.output_field
+
+    return queryset.model._meta.get_field(name)
+
+
+def _cursor_values(queryset, ordering, values):
+    """
+    ``values`` converted to the types of the ``ordering`` columns, or
+    ``None`` when they cannot be the key of a row.
+    """
+
+    if len(values) != len(ordering):
+        return None
+
+    converted = []
+
+    for field, value in zip(ordering, values):
+
+        try:
+            value = _column(queryset, field.lstrip("-")).to_python(value)
+        except (ValidationError, TypeError, ValueError):
+            return None
+
+        # the ordering columns are never null
+        if value is None:
+            return None
+
+        converted.append(value)
+
+    return converted
+
+
+# ================= KEYSET FILTER =================
+def _flip(ordering):
+
+    return [
+        field[1:] if field.startswith("-") else f"-{field}"
+        for field in ordering
+    ]
+
+
+class _Row(Func):
+
+    # a row value, so Postgres and SQLite compare keys as a whole and
+    # walk the matching (sort, id) index
+    template = "(%(expressions)s)"
+    output_field = Field()
+
+
+def _after(queryset, ordering, values):
+    """
+    Rows strictly after ``values`` in ``ordering``: the row comparison
+    ``(a, b, c) > (x, y, z)`` when every column sorts the same way, its
+    expanded OR form for mixed directions.
+    """
+
+    names = [field.lstrip("-") for field in ordering]
+    descending = {field.startswith("-") for field in ordering}
+
+    if len(descending) == 1:
+
+        lookup = LessThan if descending.pop() else GreaterThan
+
+        if len(names) == 1:
+            return lookup(F(names[0]), values[0])
+
+        return lookup(
+            _Row(*[F(name) for name in names]),
+            _Row(*[
+                Value(value, output_field=_column(queryset, name))
+                for name, value in zip(names, values)
+            ]),
+        )
+
+    condition = Q()
+
+    for i, field in enumerate(ordering):
+
+        op = "lt" if field.startswith("-") else "gt"
+
+        step = Q(**{f"{names[i]}__{op}": values[i]})
+
+        for previous, value in zip(names[:i], values[:i]):
+            step &= Q(**{previous: value})
+
+        condition |= step
+
+    return condition
+
+
+# ================= APPROXIMATE TOTAL =================
+def approximate_count(queryset):
+    """
+    Planner row estimate on Postgres, ``None`` elsewhere.
+    """
+
+    if connection.vendor != "postgresql":
+        return None
+
+    plan = json.loads(queryset.order_by().explain(format="json"))
+
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+# ================= PAGE =================
+class CursorPage:
+
+    def __init__(self, object_list, ordering, has_next, has_previous, request=None):
+
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.approximate_total = None
+
+        self.next_cursor = None
+        self.previous_cursor = None
+
+        if object_list and has_next:
+            self.next_cursor = encode_cursor("n", self._key(object_list[-1], ordering))
+
+        if object_list and has_previous:
+            self.previous_cursor = encode_cursor("p", self._key(object_list[0], ordering))
+
+        self._request = request
+
+    @staticmethod
+    def _key(obj, ordering):
+
+        return [getattr(obj, field.lstrip("-")) for field in ordering]
+
+    def _query(self, cursor):
+
+        params = self._request.GET.copy()
+        params.pop("page", None)
+        params["cursor"] = cursor
+
+        # later pages show the estimate of the first one
+        if self.approximate_total is not None:
+            params["total"] = self.approximate_total
+
+        return params.urlencode()
+
+    @property
+    def next_query(self):
+
+        return self._query(self.next_cursor)
+
+    @property
+    def previous_query(self):
+
+        return self._query(self.previous_cursor)
+
+    @property
+    def has_other_pages(self):
+
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+
+        return iter(self.object_list)
+
+    def __len__(self):
+
+        return len(self.object_list)
+
+
+def cursor_paginate(request, queryset, ordering=("-id",), per_page=PER_PAGE, with_total=True):
+    """
+    Keyset page of ``queryset`` for the ``cursor`` query parameter.
+
+    ``ordering`` must end with a unique column (normally ``id``) and may
+    only name non-null columns or annotations. With an index on the
+    ordering columns, and all of them sorted the same way, every page is
+    one range scan of it, however deep; other orderings still skip the
+    OFFSET but are filtered row by row. The approximate total is
+    estimated for the first page and carried along by the page links.
+    """
+
+    ordering = list(ordering)
+
+    cursor = decode_cursor(request.GET.get("cursor"))
+
+    if cursor:
+
+        values = _cursor_values(queryset, ordering, cursor[1])
+        cursor = (cursor[0], values) if values is not None else None
+
+    if cursor and cursor[0] == "p":
+
+        rows = list(
+            queryset.filter(_after(queryset, _flip(ordering), cursor[1]))
+            .order_by(*_flip(ordering))[:per_page + 1]
+        )
+
+        has_previous = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        has_next = True
+
+    else:
+
+        page_qs = queryset.order_by(*ordering)
+
+        if cursor:
+            page_qs = page_qs.filter(_after(queryset, ordering, cursor[1]))
+
+        rows = list(page_qs[:per_page + 1])
+
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        has_previous = cursor is not None
+
+    page = CursorPage(rows, ordering, has_next, has_previous, request)
+
+    if with_total:
+
+        total = request.GET.get("total", "") if cursor else ""
+
+        if total.isdigit():
+            page.approximate_total = int(total)
+        else:
+            page.approximate_total = approximate_count(queryset)
+
+    return page
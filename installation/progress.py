@@ -0,0 +1,221 @@
+from operator import itemgetter
+
+from django.db import transaction
+
+from .models import Installation, InstallationProgress, P4ID, P8ID, P9ID
+from .rollup import resolve_chain, is_f2_completed
+
+
+PROGRESS_FIELDS = [
+    'f2_completed',
+    'p4_completed',
+    'p8_completed',
+    'p9_completed',
+    'p4_covering',
+    'p8_covering',
+    'p9_covering',
+]
+
+CHUNK_SIZE = 2000
+
+
+# ================= AFFECTED INSTALLATIONS =================
+def installations_for_p4(p4_pks):
+
+    return set(
+        P4ID.ms_ids.through.objects.filter(
+            p4id_id__in=p4_pks
+        ).values_list('installation_id', flat=True)
+    )
+
+
+def installations_for_p8(p8_pks):
+
+    return installations_for_p4(
+        P8ID.p4_ids.through.objects.filter(
+            p8id_id__in=p8_pks
+        ).values('p4id_id')
+    )
+
+
+def installations_for_p9(p9_pks):
+
+    return installations_for_p8(
+        P9ID.p8_ids.through.objects.filter(
+            p9id_id__in=p9_pks
+        ).values('p8id_id')
+    )
+
+
+# ================= BUILD =================
+def build_progress(installations):
+    """
+    Unsaved ``InstallationProgress`` rows for ``installations``,
+    computed live from the P4/P8/P9 tables.
+    """
+
+    coverage = resolve_chain(installations)
+
+    rows = []
+
+    for pk, status in installations.values_list('id', 'status'):
+
+        covered = coverage.get(pk, {})
+
+        p4 = sorted(covered.get('p4', ()))
+        p8 = sorted(covered.get('p8', ()))
+        p9 = sorted(covered.get('p9', ()))
+
+        rows.append(InstallationProgress(
+            installation_id=pk,
+            f2_completed=is_f2_completed(status),
+            p4_completed=bool(p4),
+            p8_completed=bool(p8),
+            p9_completed=bool(p9),
+            p4_covering=p4,
+            p8_covering=p8,
+            p9_covering=p9,
+        ))
+
+    return rows
+
+
+def refresh_progress(installation_ids):
+    """
+    Recompute and upsert the progress rows of the given installations.
+    """
+
+    installation_ids = set(installation_ids)
+
+    if not installation_ids:
+        return
+
+    ids = sorted(installation_ids)
+
+    for start in range(0, len(ids), CHUNK_SIZE):
+
+        rows = build_progress(
+            Installation.objects.filter(
+                id__in=ids[start:start + CHUNK_SIZE]
+            )
+        )
+
+        InstallationProgress.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['installation'],
+            update_fields=PROGRESS_FIELDS + ['updated_at'],
+        )
+
+
+def rebuild_progress():
+    """
+    Drop the whole table and rebuild it from the live data.
+    Returns the number of rows written.
+    """
+
+    ids = list(
+        Installation.objects.order_by('id').values_list('id', flat=True)
+    )
+
+    with transaction.atomic():
+
+        InstallationProgress.objects.all().delete()
+
+        refresh_progress(ids)
+
+    return len(ids)
+
+
+# ================= VERIFY =================
+def verify_progress():
+    """
+    Compare the stored rows against the live data.
+    Returns the ids of installations whose row is missing or stale.
+    """
+
+    ids = list(
+        Installation.objects.order_by('id').values_list('id', flat=True)
+    )
+
+    stale = []
+
+    for start in range(0, len(ids), CHUNK_SIZE):
+
+        chunk = ids[start:start + CHUNK_SIZE]
+
+        stored = {
+            row['installation_id']: row
+            for row in InstallationProgress.objects.filter(
+                installation_id__in=chunk
+            ).values('installation_id', *PROGRESS_FIELDS)
+        }
+
+        for live in build_progress(
+            Installation.objects.filter(id__in=chunk)
+        ):
+
+            row = stored.get(live.installation_id)
+
+            if row is None or any(
+                row[field] != getattr(live, field)
+                for field in PROGRESS_FIELDS
+            ):
+                stale.append(live.installation_id)
+
+    return stale
+
+
+# ================= READ =================
+def progress_rows(installations=None):
+    """
+    Same rows as ``rollup.installation_progress`` but read from the
+    materialized table in a single query. Installations that have no
+    progress row yet are materialized on the way.
+    """
+
+    if installations is None:
+        installations = Installation.objects.filter(type='TB')
+
+    installations = installations.order_by()
+
+    fields = (
+        'id',
+        'facility',
+        'system',
+        'ms_id',
+        'ms_id_full',
+        'progress__f2_completed',
+        'progress__p4_completed',
+        'progress__p8_completed',
+        'progress__p9_completed',
+    )
+
+    values = list(installations.values(*fields))
+
+    missing = [
+        v['id'] for v in values
+        if v['progress__f2_completed'] is None
+    ]
+
+    if missing:
+        refresh_progress(missing)
+        values = list(installations.values(*fields))
+
+    # facility and system are label codes in the table; sorted by name here
+    values.sort(key=itemgetter('facility', 'system'))
+
+    return [
+        {
+            "facility": v['facility'],
+            "system": v['system'],
+            "completed": bool(v['progress__f2_completed']),
+            "p4_completed": bool(v['progress__p4_completed']),
+            "p8_completed": bool(v['progress__p8_completed']),
+            "p9_completed": bool(v['progress__p9_completed']),
+            "installation_id": v['id'],
+            "ms_id": v['ms_id'],
+            "ms_id_full": v['ms_id_full'],
+        }
+        for v in values
+    ]
@@ -0,0 +1,169 @@
+from collections import defaultdict
+from operator import itemgetter
+
+from .models import Installation, P4ID, P8ID, P9ID
+
+
+F2_COMPLETED_STATUSES = ('complete', 'completed', 'done')
+
+
+# ================= F2 STATUS =================
+def is_f2_completed(status):
+
+    return bool(status) and status.lower() in F2_COMPLETED_STATUSES
+
+
+# ================= CHAIN RESOLUTION =================
+def walk_chain(installations, completed_only=False):
+    """
+    Walk P4 -> P8 -> P9 above every installation in ``installations``
+    with three queries, one per M2M table.
+
+    Returns ``{installation_id: {'p4': set, 'p8': set, 'p9': set}}`` of
+    primary keys. With ``completed_only`` the sets hold the completed
+    records that cover the installation:
+
+    * p4 - completed P4 linked to the installation
+    * p8 - completed P8 linked to any P4 of the installation
+    * p9 - completed P9 linked to any of those completed P8
+    """
+
+    ms_through = P4ID.ms_ids.through.objects.filter(
+        installation_id__in=installations.values('id')
+    )
+
+    p8_through = P8ID.p4_ids.through.objects.filter(
+        p4id_id__in=ms_through.values('p4id_id')
+    )
+
+    if completed_only:
+        p8_through = p8_through.filter(p8id__completed=True)
+
+    p9_through = P9ID.p8_ids.through.objects.filter(
+        p8id_id__in=p8_through.values('p8id_id')
+    )
+
+    if completed_only:
+        p9_through = p9_through.filter(p9id__completed=True)
+
+    # ================= P4 <- MS =================
+    p4_by_installation = defaultdict(set)
+    completed_p4 = set()
+
+    for installation_id, p4_pk, completed in ms_through.values_list(
+        'installation_id',
+        'p4id_id',
+        'p4id__completed'
+    ):
+
+        p4_by_installation[installation_id].add(p4_pk)
+
+        if completed:
+            completed_p4.add(p4_pk)
+
+    # ================= P8 <- P4 =================
+    p8_by_p4 = defaultdict(set)
+
+    for p4_pk, p8_pk in p8_through.values_list('p4id_id', 'p8id_id'):
+
+        p8_by_p4[p4_pk].add(p8_pk)
+
+    # ================= P9 <- P8 =================
+    p9_by_p8 = defaultdict(set)
+
+    for p8_pk, p9_pk in p9_through.values_list('p8id_id', 'p9id_id'):
+
+        p9_by_p8[p8_pk].add(p9_pk)
+
+    # ================= COMBINE =================
+    chain = {}
+
+    for installation_id, p4_pks in p4_by_installation.items():
+
+        p8_pks = set()
+
+        for p4_pk in p4_pks:
+            p8_pks |= p8_by_p4.get(p4_pk, set())
+
+        p9_pks = set()
+
+        for p8_pk in p8_pks:
+            p9_pks |= p9_by_p8.get(p8_pk, set())
+
+        chain[installation_id] = {
+            'p4': p4_pks & completed_p4 if completed_only else p4_pks,
+            'p8': p8_pks,
+            'p9': p9_pks,
+        }
+
+    return chain
+
+
+def resolve_chain(installations):
+    """
+    Completed P4/P8/P9 covering each installation, see ``walk_chain``.
+    """
+
+    return walk_chain(installations, completed_only=True)
+
+
+# ================= INSTALLATION ROWS =================
+def installation_progress(installations=None):
+    """
+    F2/P4/P8/P9 completion for every installation in ``installations``
+    (all TB installations by default), ordered by facility and system.
+    Runs a constant number of queries regardless of the row count.
+    """
+
+    if installations is None:
+        installations = Installation.objects.filter(type='TB')
+
+    installations = installations.order_by()
+
+    coverage = resolve_chain(installations)
+
+    empty = {'p4': set(), 'p8': set(), 'p9': set()}
+
+    rows = []
+
+    for ins in installations.values(
+        'id',
+        'facility',
+        'system',
+        'status',
+        'ms_id',
+        'ms_id_full'
+    ):
+
+        covered = coverage.get(ins['id'], empty)
+
+        rows.append({
+            "facility": ins['facility'],
+            "system": ins['system'],
+            "completed": is_f2_completed(ins['status']),
+            "p4_completed": bool(covered['p4']),
+            "p8_completed": bool(covered['p8']),
+            "p9_completed": bool(covered['p9']),
+            "installation_id": ins['id'],
+            "ms_id": ins['ms_id'],
+            "ms_id_full": ins['ms_id_full'],
+        })
+
+    # facility and system are label codes in the table; sorted by name here
+    rows.sort(key=itemgetter("facility", "system"))
+
+    return rows
+
+
+# ================= FACILITY GROUPING =================
+def facility_rollup(rows):
+    """
+    Group installation rows by facility, keeping the row order.
+    """
+
+    facility_data = {}
+
+    for row in rows:
+        facility_data.setdefault(row['facility'], []).append(row)
+
+    return facility_data
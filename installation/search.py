@@ -0,0 +1,190 @@
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Length
+
+from .models import Installation, P4ID, P8ID, P9ID
+
+
+# hard cap on rows a search can return
+SEARCH_LIMIT = 500
+
+# typeahead endpoints
+SUGGEST_LIMIT = 10
+
+# SQLite FTS5 side table kept in sync by triggers (migration 0012)
+FTS_TABLE = "installation_search"
+
+# Postgres pg_trgm GIN indexes behind icontains (migration 0012)
+TRIGRAM_INDEXES = ("installation_ms_id_trgm", "installation_ms_id_full_trgm")
+
+# the trigram tokenizer cannot match anything shorter
+FTS_MIN_LENGTH = 3
+
+SEARCH_FIELDS = ("ms_id", "ms_id_full")
+
+
+def _fts_available():
+
+    if not hasattr(connection, "_installation_fts"):
+        connection._installation_fts = (
+            FTS_TABLE in connection.introspection.table_names()
+        )
+
+    return connection._installation_fts
+
+
+def _fts_phrase(term):
+
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _match(term, field):
+    """
+    Case-insensitive substring filter on ``field``.
+
+    Postgres serves ``icontains`` from the pg_trgm GIN index on
+    ``UPPER(field)``; SQLite goes through the FTS5 trigram table.
+    """
+
+    if (
+        connection.vendor == "sqlite"
+        and len(term) >= FTS_MIN_LENGTH
+        and _fts_available()
+    ):
+        return Q(id__in=RawSQL(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+            [f"{{{field}}} : {_fts_phrase(term)}"]
+        ))
+
+    return Q(**{f"{field}__icontains": term})
+
+
+def _relevance(term, field):
+    """
+    0 = exact match, 1 = prefix match, 2 = anywhere.
+    """
+
+    return Case(
+        When(**{f"{field}__iexact": term}, then=Value(0)),
+        When(**{f"{field}__istartswith": term}, then=Value(1)),
+        default=Value(2),
+        output_field=IntegerField(),
+    )
+
+
+# relevance order of a ranked search; ends with a unique column so it
+# doubles as a keyset ordering
+SEARCH_ORDERING = ("relevance", "match_length", "-id")
+
+
+def ranked_installations(term, field="ms_id", queryset=None):
+    """
+    Installations whose ``field`` contains ``term``, annotated with
+    ``relevance`` and ``match_length`` but neither ordered nor sliced.
+    """
+
+    if field not in SEARCH_FIELDS:
+        raise ValueError(f"Cannot search on {field!r}")
+
+    if queryset is None:
+        queryset = Installation.objects.all()
+
+    return queryset.filter(
+        _match(term, field)
+    ).annotate(
+        relevance=_relevance(term, field),
+        match_length=Length(field),
+    )
+
+
+def search_installations(term, field="ms_id", limit=SEARCH_LIMIT, queryset=None):
+    """
+    Installations whose ``field`` contains ``term``, best matches first
+    (exact, prefix, then shortest), capped at ``limit`` rows.
+    """
+
+    return ranked_installations(
+        term, field, queryset
+    ).order_by(*SEARCH_ORDERING)[:limit]
+
+
+async def asearch_installations(term, field="ms_id", limit=SEARCH_LIMIT):
+    """
+    ``search_installations`` for async views, fetched through the async
+    ORM.
+    """
+
+    if connection.vendor == "sqlite":
+        # the FTS check may introspect the database, which async code cannot
+        queryset = await sync_to_async(search_installations)(term, field, limit)
+    else:
+        queryset = search_installations(term, field, limit)
+
+    return [row async for row in queryset]
+
+
+def suggest_codes(model, field, term, fields, limit=SUGGEST_LIMIT):
+    """
+    ``fields`` of the ``model`` rows whose ``field`` contains ``term``,
+    ranked like the typeahead index: exact, prefix, shortest, newest.
+    """
+
+    return list(
+        model.objects.filter(
+            **{f"{field}__icontains": term}
+        ).annotate(
+            relevance=_relevance(term, field),
+            match_length=Length(field),
+        ).order_by(
+            *SEARCH_ORDERING
+        ).values(*fields)[:limit]
+    )
+
+
+# ================= MILESTONE LISTS =================
+# code columns matched by the ?search= of a P4/P8/P9 list, and the
+# linked records whose code also counts as a hit
+MILESTONE_SEARCH = {
+    "p4": (P4ID, ("p4_id", "saw_programs", "associate_ms"), ("ms_ids", "ms_id")),
+    "p8": (P8ID, ("p8_id", "p2_id"), ("p4_ids", "p4_id")),
+    "p9": (P9ID, ("p9_id",), ("p8_ids", "p8_id")),
+}
+
+COMPLETED_FILTERS = {
+    "yes": True,
+    "no": False,
+}
+
+
+def filter_milestones(kind, term="", completed=""):
+    """
+    P4/P8/P9 records whose own or linked codes contain ``term``,
+    optionally only the completed (``"yes"``) or pending (``"no"``)
+    ones. Neither ordered nor sliced.
+    """
+
+    model, fields, (relation, linked_field) = MILESTONE_SEARCH[kind]
+
+    queryset = model.objects.all()
+
+    if term:
+
+        condition = Q()
+
+        for field in fields:
+            condition |= Q(**{f"{field}__icontains": term})
+
+        # a subquery rather than a join, so a record linked to several
+        # matches still comes back once
+        condition |= Q(id__in=model.objects.filter(
+            **{f"{relation}__{linked_field}__icontains": term}
+        ).values("id"))
+
+        queryset = queryset.filter(condition)
+
+    if completed in COMPLETED_FILTERS:
+        queryset = queryset.filter(completed=COMPLETED_FILTERS[completed])
+
+    return queryset
@@ -0,0 +1,372 @@
+"""
+Reading and parsing of installation sheets.
+
+Nothing here touches Django, so row ranges can be read and parsed in
+worker processes while the importer keeps the only database connection.
+"""
+import csv
+import datetime
+import hashlib
+import math
+import os
+
+import pandas as pd
+
+
+CHUNK_SIZE = 2000
+
+# most rows a worker reads in one go; it returns them all at once
+RANGE_SIZE = CHUNK_SIZE * 25
+
+# sheet line of the first data row, below the header
+FIRST_ROW = 2
+
+# sheet header -> Installation field
+COLUMNS = {
+    'MS ID Full': 'ms_id_full',
+    'MS_ID': 'ms_id',
+    'Status': 'status',
+    'ABD Number': 'abd_number',
+    'Start Date': 'start_date',
+    'End Date': 'end_date',
+    'System': 'system',
+    'Facility': 'facility',
+    'SAW Program': 'saw_program',
+    'Unit': 'unit',
+    'Stage': 'stage',
+}
+
+DATE_FIELDS = ('start_date', 'end_date')
+
+TEXT_FIELDS = tuple(
+    field for field in COLUMNS.values() if field not in DATE_FIELDS
+)
+
+# every field a sheet row sets, in hash order
+IMPORT_FIELDS = tuple(COLUMNS.values())
+
+# Excel serial day 0; anything at or below this is not a serial date
+EXCEL_ORIGIN = '1899-12-30'
+EXCEL_MIN_SERIAL = 1000
+
+
+# ================= READING =================
+def _clean_header(value):
+
+    return '' if value is None else str(value).strip()
+
+
+def read_rows(path, sheet=None, start=FIRST_ROW, stop=None):
+    """
+    Yield ``(line_number, {header: cell})`` for the rows of a CSV or
+    Excel file from line ``start`` up to, not including, ``stop``,
+    without loading the whole file.
+    """
+
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension == '.csv':
+
+        with open(path, newline='', encoding='utf-8-sig') as handle:
+
+            reader = csv.reader(handle)
+            header = [_clean_header(value) for value in next(reader, [])]
+
+            for number, values in enumerate(reader, start=FIRST_ROW):
+
+                if stop is not None and number >= stop:
+                    break
+
+                if number >= start:
+                    yield number, dict(zip(header, values))
+
+        return
+
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+
+    try:
+
+        worksheet = workbook[sheet] if sheet else workbook.active
+
+        header = [
+            _clean_header(value)
+            for value in next(worksheet.iter_rows(max_row=1, values_only=True), ())
+        ]
+
+        rows = worksheet.iter_rows(
+            min_row=start,
+            max_row=None if stop is None else stop - 1,
+            values_only=True
+        )
+
+        for number, values in enumerate(rows, start=start):
+            yield number, dict(zip(header, values))
+
+    finally:
+        workbook.close()
+
+
+def count_rows(path, sheet=None):
+    """
+    Rough number of data rows, without reading the cells; ``None`` when
+    the file does not say.
+    """
+
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension == '.csv':
+
+        lines = 0
+
+        with open(path, 'rb') as handle:
+            for block in iter(lambda: handle.read(1 << 20), b''):
+                lines += block.count(b'\n')
+
+        return max(lines - 1, 0)
+
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(path, read_only=True)
+
+    try:
+        worksheet = workbook[sheet] if sheet else workbook.active
+        last = worksheet.max_row
+    finally:
+        workbook.close()
+
+    return None if last is None else max(last - 1, 0)
+
+
+def row_ranges(path, sheet=None, parts=1, size=RANGE_SIZE):
+    """
+    ``(start, stop)`` line ranges covering the sheet, at least ``parts``
+    of them and none much longer than ``size``. The last one is open
+    ended, so an estimate that falls short loses nothing.
+    """
+
+    total = count_rows(path, sheet)
+
+    if not total:
+        return [(FIRST_ROW, None)]
+
+    count = max(parts, math.ceil(total / size))
+    length = math.ceil(total / count)
+
+    starts = range(FIRST_ROW, FIRST_ROW + total, length)
+
+    return [
+        (start, start + length) for start in starts[:-1]
+    ] + [(starts[-1], None)]
+
+
+def read_header(path, sheet=None):
+    """
+    Column names of the first row.
+    """
+
+    for number, row in read_rows(path, sheet):
+        return list(row)
+
+    return []
+
+
+def batched(rows, size=CHUNK_SIZE):
+
+    batch = []
+
+    for row in rows:
+
+        batch.append(row)
+
+        if len(batch) >= size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+# ================= PARSING =================
+def clean_text(value):
+
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return ''
+
+    return str(value).strip()
+
+
+def _cell_kind(value):
+
+    if isinstance(value, (datetime.date, pd.Timestamp)):
+        return 'date'
+
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return 'blank' if pd.isna(value) else 'number'
+
+    if clean_text(value) == '':
+        return 'blank'
+
+    return 'text'
+
+
+def parse_dates(values):
+    """
+    Parse one column of a batch in a few vectorized passes.
+
+    Returns ``(dates, invalid)``: a ``date`` or ``None`` per cell, and a
+    flag per cell that was filled in but could not be read as a date.
+    Excel serial numbers, date cells, ISO strings and day-first text
+    are understood.
+    """
+
+    cells = pd.Series(list(values), dtype=object)
+    kinds = cells.map(_cell_kind)
+
+    parsed = pd.Series(pd.NaT, index=cells.index, dtype='datetime64[us]')
+
+    dates = kinds == 'date'
+
+    if dates.any():
+        parsed[dates] = pd.to_datetime(cells[dates], errors='coerce')
+
+    numbers = kinds == 'number'
+
+    if numbers.any():
+
+        serial = pd.to_numeric(cells[numbers])
+
+        parsed[numbers] = pd.to_datetime(
+            serial.where(serial > EXCEL_MIN_SERIAL),
+            unit='D',
+            origin=EXCEL_ORIGIN,
+            errors='coerce'
+        )
+
+    text = kinds == 'text'
+
+    if text.any():
+
+        strings = cells[text].map(clean_text)
+
+        # ISO first, so 2024-01-05 is not read day-first as 1 May
+        found = pd.to_datetime(strings, format='ISO8601', errors='coerce')
+
+        rest = found.isna()
+
+        if rest.any():
+            found[rest] = pd.to_datetime(
+                strings[rest],
+                format='mixed',
+                dayfirst=True,
+                errors='coerce'
+            )
+
+        parsed[text] = found
+
+    invalid = (kinds.isin(['number', 'text']) & parsed.isna()).tolist()
+
+    result = [
+        None if pd.isna(value) else value.date()
+        for value in parsed
+    ]
+
+    return result, invalid
+
+
+def parse_batch(batch, max_lengths):
+    """
+    Turn ``(line_number, row)`` pairs into field dicts.
+
+    ``max_lengths`` maps text fields to their column lengths. Returns
+    ``(records, rejected)`` where ``records`` holds ``(line_number,
+    fields, row_hash)`` and ``rejected`` holds ``(line_number, row,
+    reason)``. Completely empty rows are skipped.
+    """
+
+    rows = [
+        (number, row) for number, row in batch
+        if any(clean_text(value) for value in row.values())
+    ]
+
+    headers = {field: header for header, field in COLUMNS.items()}
+
+    dates = {
+        field: parse_dates(row.get(headers[field]) for number, row in rows)
+        for field in DATE_FIELDS
+    }
+
+    records = []
+    rejected = []
+
+    for i, (number, row) in enumerate(rows):
+
+        fields = {
+            field: clean_text(row.get(headers[field]))
+            for field in TEXT_FIELDS
+        }
+
+        problems = []
+
+        if not fields['ms_id_full']:
+            problems.append('missing MS ID Full')
+
+        for field, limit in max_lengths.items():
+            if len(fields[field]) > limit:
+                problems.append(f'{headers[field]} longer than {limit} characters')
+
+        for field in DATE_FIELDS:
+
+            parsed, invalid = dates[field]
+
+            if invalid[i]:
+                problems.append(f'unreadable {headers[field]} {row.get(headers[field])!r}')
+
+            fields[field] = parsed[i]
+
+        if problems:
+            rejected.append((number, row, '; '.join(problems)))
+        else:
+            records.append((number, fields, row_hash(fields)))
+
+    return records, rejected
+
+
+def parse_range(path, sheet, start, stop, chunk_size, max_lengths):
+    """
+    ``parse_batch`` results for every chunk of one line range of a
+    sheet, read by the calling process itself.
+    """
+
+    return [
+        parse_batch(batch, max_lengths)
+        for batch in batched(read_rows(path, sheet, start, stop), chunk_size)
+    ]
+
+
+def row_hash(fields):
+    """
+    Digest of the imported fields of one row, as parsed from a sheet or
+    as stored on an ``Installation``.
+    """
+
+    parts = []
+
+    for field in IMPORT_FIELDS:
+
+        value = fields[field]
+
+        if value is None:
+            value = ''
+        elif isinstance(value, datetime.date):
+            value = value.isoformat()
+
+        parts.append(value)
+
+    return hashlib.sha256('\x1f'.join(parts).encode()).hexdigest()
+
+
+def as_row(fields):
+
+    return {header: fields[field] for header, field in COLUMNS.items()}
@@ -0,0 +1,460 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Installation, P4ID, P8ID, P9ID
+from .autocomplete import INDEXES
+from .caching import bump_facilities, bump_on_commit
+from .closure import refresh_closure
+from .live import publish, publish_rows, row_values
+from .counters import (
+    COUNTED_FIELDS,
+    MODEL_KINDS,
+    bucket,
+    count_changes,
+    reconcile_counters,
+    stored_bucket,
+)
+from .progress import (
+    installations_for_p4,
+    installations_for_p8,
+    installations_for_p9,
+    refresh_progress,
+)
+
+
+# ================= HELPERS =================
+def _installations_below(model, pks):
+
+    if model is Installation:
+        return set(pks)
+
+    if model is P4ID:
+        return installations_for_p4(pks)
+
+    return installations_for_p8(pks)
+
+
+def _facilities_of(installation_ids):
+
+    return Installation.objects.filter(
+        pk__in=installation_ids
+    ).values_list("facility", flat=True).distinct()
+
+
+INSTALLATIONS_FOR = {
+    P4ID: installations_for_p4,
+    P8ID: installations_for_p8,
+    P9ID: installations_for_p9,
+}
+
+
+RELATIONS = {
+    P4ID: "ms_ids",
+    P8ID: "p4_ids",
+    P9ID: "p8_ids",
+}
+
+
+def _relation_changed(upper, instance, action, reverse, pk_set, completed_only):
+    """
+    Refresh the installations below a changed M2M link.
+
+    ``upper`` is the model owning the M2M field. The lower side of the
+    link is untouched by the change, so its installations can still be
+    found by walking down from it. The closure always changes; with
+    ``completed_only`` progress only changes when the upper record is
+    completed.
+    """
+
+    field_name = RELATIONS[upper]
+    lower = upper._meta.get_field(field_name).related_model
+
+    if action == "pre_clear" and not reverse:
+        instance._progress_cleared = list(
+            getattr(instance, field_name).values_list('pk', flat=True)
+        )
+        return
+
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if reverse:
+
+        progress_changed = not completed_only or not pk_set or upper.objects.filter(
+            pk__in=pk_set,
+            completed=True
+        ).exists()
+
+        lower = type(instance)
+        lower_pks = [instance.pk]
+
+    else:
+
+        progress_changed = not completed_only or instance.completed
+
+        if action == "post_clear":
+            lower_pks = getattr(instance, "_progress_cleared", ())
+        else:
+            lower_pks = pk_set
+
+    affected = _installations_below(lower, lower_pks)
+
+    refresh_closure(affected)
+    bump_facilities(_facilities_of(affected))
+
+    if progress_changed:
+        refresh_progress(affected)
+
+
+# ================= M2M =================
+@receiver(m2m_changed, sender=P4ID.ms_ids.through)
+def p4_ms_ids_changed(sender, instance, action, reverse, pk_set, **kwargs):
+
+    # covering P8/P9 go through every P4, completed or not
+    _relation_changed(P4ID, instance, action, reverse, pk_set, False)
+
+
+@receiver(m2m_changed, sender=P8ID.p4_ids.through)
+def p8_p4_ids_changed(sender, instance, action, reverse, pk_set, **kwargs):
+
+    _relation_changed(P8ID, instance, action, reverse, pk_set, True)
+
+
+@receiver(m2m_changed, sender=P9ID.p8_ids.through)
+def p9_p8_ids_changed(sender, instance, action, reverse, pk_set, **kwargs):
+
+    _relation_changed(P9ID, instance, action, reverse, pk_set, True)
+
+
+# ================= SAVE =================
+def _completed_touched(kwargs):
+
+    update_fields = kwargs.get("update_fields")
+
+    return update_fields is None or "completed" in update_fields
+
+
+@receiver(post_save, sender=Installation)
+def installation_saved(sender, instance, raw=False, **kwargs):
+
+    if raw:
+        return
+
+    bump_on_commit("installation")
+    refresh_progress([instance.pk])
+
+
+@receiver(post_delete, sender=Installation)
+def installation_deleted(sender, instance, **kwargs):
+
+    bump_on_commit("installation")
+
+
+@receiver(post_save, sender=P4ID)
+def p4_saved(sender, instance, created, raw=False, **kwargs):
+
+    if raw or created or not _completed_touched(kwargs):
+        return
+
+    refresh_progress(installations_for_p4([instance.pk]))
+
+
+@receiver(post_save, sender=P8ID)
+def p8_saved(sender, instance, created, raw=False, **kwargs):
+
+    if raw or created or not _completed_touched(kwargs):
+        return
+
+    refresh_progress(installations_for_p8([instance.pk]))
+
+
+@receiver(post_save, sender=P9ID)
+def p9_saved(sender, instance, created, raw=False, **kwargs):
+
+    if raw or created or not _completed_touched(kwargs):
+        return
+
+    refresh_progress(installations_for_p9([instance.pk]))
+
+
+# ================= BULK WRITES =================
+def after_bulk_write(installation_ids, fields=None):
+    """
+    What the Installation receivers would have done for rows written by
+    ``bulk_create`` / ``bulk_update``, which send no signals. ``fields``
+    limits the work to what those columns feed; ``None`` means all.
+    """
+
+    bump_on_commit("installation")
+
+    if fields is None or set(fields) & set(INDEXES["ms"].fields):
+        bump_on_commit(INDEXES["ms"].namespace)
+
+    if fields is None or "status" in fields:
+        refresh_progress(installation_ids)
+
+    # callers changing counted columns of known rows move the counters
+    # themselves; whole imports are recounted and may move rows between
+    # facilities
+    if fields is None:
+        reconcile_counters("installation")
+        bump_on_commit("facilities")
+        publish("installation", "reload")
+    else:
+        bump_facilities(_facilities_of(installation_ids))
+        publish_rows("installation", installation_ids)
+
+
+# ================= DELETE =================
+@receiver(pre_delete, sender=P4ID)
+@receiver(pre_delete, sender=P8ID)
+@receiver(pre_delete, sender=P9ID)
+def milestone_deleting(sender, instance, **kwargs):
+
+    lookup = INSTALLATIONS_FOR[sender]
+
+    instance._progress_affected = lookup([instance.pk])
+
+
+@receiver(post_delete, sender=P4ID)
+@receiver(post_delete, sender=P8ID)
+@receiver(post_delete, sender=P9ID)
+def milestone_deleted(sender, instance, **kwargs):
+
+    affected = getattr(instance, "_progress_affected", ())
+
+    refresh_closure(affected)
+    refresh_progress(affected)
+    bump_facilities(_facilities_of(affected))
+
+
+# ================= DASHBOARD CACHE =================
+CACHE_LEVELS = {
+    P4ID: "p4",
+    P8ID: "p8",
+    P9ID: "p9",
+}
+
+# deleting a record drops its links to the level above
+PARENT_LEVELS = {
+    Installation: "p4",
+    P4ID: "p8",
+    P8ID: "p9",
+}
+
+LINK_LEVELS = {
+    P4ID.ms_ids.through: "p4",
+    P8ID.p4_ids.through: "p8",
+    P9ID.p8_ids.through: "p9",
+}
+
+
+@receiver(post_save, sender=P4ID)
+@receiver(post_save, sender=P8ID)
+@receiver(post_save, sender=P9ID)
+@receiver(post_delete, sender=P4ID)
+@receiver(post_delete, sender=P8ID)
+@receiver(post_delete, sender=P9ID)
+def milestone_stats_changed(sender, **kwargs):
+
+    bump_on_commit(CACHE_LEVELS[sender])
+
+
+@receiver(post_delete, sender=Installation)
+@receiver(post_delete, sender=P4ID)
+@receiver(post_delete, sender=P8ID)
+def milestone_child_deleted(sender, **kwargs):
+
+    bump_on_commit(PARENT_LEVELS[sender])
+
+
+@receiver(m2m_changed, sender=P4ID.ms_ids.through)
+@receiver(m2m_changed, sender=P8ID.p4_ids.through)
+@receiver(m2m_changed, sender=P9ID.p8_ids.through)
+def milestone_links_changed(sender, action, **kwargs):
+
+    if action.startswith("post_"):
+        bump_on_commit(LINK_LEVELS[sender])
+
+
+# ================= COUNTERS =================
+@receiver(pre_save, sender=Installation)
+@receiver(pre_save, sender=P4ID)
+@receiver(pre_save, sender=P8ID)
+@receiver(pre_save, sender=P9ID)
+def counter_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+
+    kind = MODEL_KINDS[sender]
+
+    instance._counter_bucket = None
+
+    if raw or instance._state.adding or instance.pk is None:
+        return
+
+    if update_fields is not None and not set(update_fields) & set(COUNTED_FIELDS[kind]):
+        instance._counter_bucket = False
+        return
+
+    instance._counter_bucket = stored_bucket(kind, instance.pk)
+
+
+@receiver(post_save, sender=Installation)
+@receiver(post_save, sender=P4ID)
+@receiver(post_save, sender=P8ID)
+@receiver(post_save, sender=P9ID)
+def counter_saved(sender, instance, created, raw=False, **kwargs):
+
+    old = getattr(instance, "_counter_bucket", None)
+
+    # raw fixture loads and saves not touching counted columns
+    if raw or old is False:
+        return
+
+    kind = MODEL_KINDS[sender]
+
+    count_changes(kind, [(old, bucket(kind, instance))])
+
+
+@receiver(post_delete, sender=Installation)
+@receiver(post_delete, sender=P4ID)
+@receiver(post_delete, sender=P8ID)
+@receiver(post_delete, sender=P9ID)
+def counter_deleted(sender, instance, **kwargs):
+
+    kind = MODEL_KINDS[sender]
+
+    count_changes(kind, [(bucket(kind, instance), None)])
+
+
+# ================= FACILITY VERSIONS =================
+@receiver(post_save, sender=Installation)
+@receiver(post_delete, sender=Installation)
+def facility_installation_changed(sender, instance, **kwargs):
+
+    facilities = {instance.facility}
+
+    # stored bucket remembered by counter_saving, holding the old facility
+    old = getattr(instance, "_counter_bucket", None)
+
+    if old:
+        facilities.add(old[0])
+
+    bump_facilities(facilities)
+
+
+@receiver(post_save, sender=P4ID)
+@receiver(post_save, sender=P8ID)
+@receiver(post_save, sender=P9ID)
+def facility_milestone_saved(sender, instance, created, raw=False, **kwargs):
+
+    # a new record has no links yet; adding them sends m2m_changed
+    if raw or created:
+        return
+
+    lookup = INSTALLATIONS_FOR[sender]
+
+    bump_facilities(_facilities_of(lookup([instance.pk])))
+
+
+# ================= MODIFICATION TIMES =================
+# a link change is a change of the record owning the M2M field, so
+# conditional GETs of pages showing its links see it
+LINK_OWNERS = {
+    P4ID.ms_ids.through: P4ID,
+    P8ID.p4_ids.through: P8ID,
+    P9ID.p8_ids.through: P9ID,
+}
+
+
+@receiver(m2m_changed, sender=P4ID.ms_ids.through)
+@receiver(m2m_changed, sender=P8ID.p4_ids.through)
+@receiver(m2m_changed, sender=P9ID.p8_ids.through)
+def milestone_links_touched(sender, instance, action, reverse, pk_set, **kwargs):
+
+    owner = LINK_OWNERS[sender]
+
+    if action == "pre_clear" and reverse:
+        instance._links_cleared = list(
+            owner.objects.filter(
+                **{RELATIONS[owner]: instance}
+            ).values_list("pk", flat=True)
+        )
+        return
+
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if not reverse:
+        pks = [instance.pk]
+    elif action == "post_clear":
+        pks = getattr(instance, "_links_cleared", ())
+    else:
+        pks = pk_set
+
+    owner.objects.filter(pk__in=pks).update(updated_at=timezone.now())
+
+
+# ================= LIVE EVENTS =================
+# open list pages patch the rows in place; see live.py
+@receiver(post_save, sender=Installation)
+@receiver(post_save, sender=P4ID)
+@receiver(post_save, sender=P8ID)
+@receiver(post_save, sender=P9ID)
+def live_row_saved(sender, instance, created, raw=False, **kwargs):
+
+    if raw:
+        return
+
+    kind = MODEL_KINDS[sender]
+
+    publish(kind, "create" if created else "change", [
+        {"id": instance.pk, "values": row_values(kind, instance)}
+    ])
+
+
+@receiver(post_delete, sender=Installation)
+@receiver(post_delete, sender=P4ID)
+@receiver(post_delete, sender=P8ID)
+@receiver(post_delete, sender=P9ID)
+def live_row_deleted(sender, instance, **kwargs):
+
+    publish(MODEL_KINDS[sender], "delete", [{"id": instance.pk, "values": {}}])
+
+
+# ================= AUTOCOMPLETE =================
+AUTOCOMPLETE = {
+    Installation: "ms",
+    P4ID: "p4",
+    P8ID: "p8",
+}
+
+
+@receiver(post_save, sender=Installation)
+@receiver(post_save, sender=P4ID)
+@receiver(post_save, sender=P8ID)
+def autocomplete_saved(sender, instance, raw=False, **kwargs):
+
+    if raw:
+        return
+
+    # patched after the commit, like the version bumps, so no other
+    # worker rebuilds from rows it cannot see yet
+    transaction.on_commit(partial(INDEXES[AUTOCOMPLETE[sender]].update, instance))
+
+
+@receiver(post_delete, sender=Installation)
+@receiver(post_delete, sender=P4ID)
+@receiver(post_delete, sender=P8ID)
+def autocomplete_deleted(sender, instance, **kwargs):
+
+    transaction.on_commit(partial(INDEXES[AUTOCOMPLETE[sender]].remove, instance.pk))
@@ -19,21 +19,98 @@ function getCookie(name) {
 
 const csrftoken = getCookie('csrftoken');
 
-function setupTableSearch(inputId, tableId) {
-    const searchInput = document.getElementById(inputId);
-    const table = document.getElementById(tableId);
+function setupServerFilter(formId, resultsId) {
+    const form = document.getElementById(formId);
+    const results = document.getElementById(resultsId);
 
-    if (!searchInput || !table) {
+    if (!form || !results) {
         return;
     }
 
-    searchInput.addEventListener("keyup", function () {
-        const value = this.value.toLowerCase();
-        const rows = table.querySelectorAll("tbody tr");
+    let timer = null;
+    let controller = null;
 
-        rows.forEach(row => {
-            row.style.display = row.innerText.toLowerCase().includes(value) ? "" : "none";
+    function filters() {
+        const params = new URLSearchParams();
+
+        new FormData(form).forEach((value, name) => {
+            if (value) {
+                params.append(name, value);
+            }
+        });
+
+        return params.toString();
+    }
+
+    function load(query) {
+        if (controller) {
+            controller.abort();
+        }
+
+        controller = new AbortController();
+
+        fetch(`${window.location.pathname}?${query}`, {
+            headers: {"X-Requested-With": "XMLHttpRequest"},
+            signal: controller.signal
+        })
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(response.status);
+            }
+
+            return response.text();
+        })
+        .then(html => {
+            results.innerHTML = html;
+
+            history.replaceState(null, "", query ? `?${query}` : window.location.pathname);
+
+            // exports follow the filters, not the page
+            const current = filters();
+
+            document.querySelectorAll("a[data-export]").forEach(link => {
+                link.href = link.href.split("?")[0] + (current ? `?${current}` : "");
+            });
+        })
+        .catch(error => {
+            if (error.name !== "AbortError") {
+                console.error("Error:", error);
+            }
         });
+    }
+
+    form.addEventListener("input", function (event) {
+        if (event.target.tagName !== "INPUT") {
+            return;
+        }
+
+        clearTimeout(timer);
+        timer = setTimeout(() => load(filters()), 300);
+    });
+
+    form.addEventListener("change", function (event) {
+        if (event.target.tagName === "SELECT") {
+            clearTimeout(timer);
+            load(filters());
+        }
+    });
+
+    form.addEventListener("submit", function (event) {
+        event.preventDefault();
+        clearTimeout(timer);
+        load(filters());
+    });
+
+    results.addEventListener("click", function (event) {
+        const link = event.target.closest("a.page-link");
+
+        if (!link) {
+            return;
+        }
+
+        event.preventDefault();
+        load(new URL(link.href).search.slice(1));
+        results.scrollIntoView({block: "start"});
     });
 }
 
@@ -76,4 +153,244 @@ function updateCompleted(url, checked) {
     .catch(error => {
         console.error("Error:", error);
     });
-}
\ No newline at end of file
+}
+
+// ================= QUEUED FIELD UPDATES =================
+// Cell edits are collected per endpoint and sent as one batch after a
+// short pause. A newer edit of the same cell replaces the queued one,
+// and only one batch per endpoint is in flight at a time. Each edit
+// carries the row version the page was rendered with (or the one the
+// last save returned), so the server can refuse edits of stale rows.
+const FIELD_QUEUE_DELAY = 500;
+const fieldQueues = {};
+
+function queueFieldUpdate(url, id, field, value, version) {
+    if (!fieldQueues[url]) {
+        fieldQueues[url] = { edits: new Map(), versions: {}, timer: null, sending: false };
+    }
+
+    const queue = fieldQueues[url];
+
+    if (!(id in queue.versions)) {
+        queue.versions[id] = version;
+    }
+
+    queue.edits.set(id + ":" + field, { id: id, field: field, value: value });
+    scheduleFieldUpdates(url);
+}
+
+function scheduleFieldUpdates(url) {
+    const queue = fieldQueues[url];
+
+    clearTimeout(queue.timer);
+    queue.timer = setTimeout(() => flushFieldUpdates(url), FIELD_QUEUE_DELAY);
+}
+
+function flushFieldUpdates(url, leavingPage) {
+    const queue = fieldQueues[url];
+
+    if (!queue || queue.edits.size === 0) {
+        return;
+    }
+
+    if (queue.sending && !leavingPage) {
+        scheduleFieldUpdates(url);
+        return;
+    }
+
+    const edits = Array.from(queue.edits.values());
+
+    queue.edits.clear();
+    clearTimeout(queue.timer);
+    queue.sending = true;
+
+    fetch(url, {
+        method: "POST",
+        keepalive: Boolean(leavingPage),
+        headers: {
+            "Content-Type": "application/json",
+            "X-CSRFToken": csrftoken
+        },
+        body: JSON.stringify({
+            edits: edits.map(edit => ({ ...edit, version: queue.versions[edit.id] }))
+        })
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (!data.results) {
+            console.error("Error:", data.error);
+            return;
+        }
+
+        let conflicts = 0;
+
+        data.results.forEach(result => {
+            if (result.success) {
+                queue.versions[result.id] = result.version;
+            } else {
+                console.error(`Update of ${result.field} on ${result.id} failed:`, result.error);
+
+                if (result.conflict) {
+                    conflicts += 1;
+                }
+            }
+        });
+
+        if (conflicts) {
+            alert(`${conflicts} change(s) were not saved because someone else edited those rows. Reload the page to see their changes.`);
+        }
+
+        console.log(`Updated ${data.results.length} field(s)`);
+    })
+    .catch(error => {
+        console.error("Error:", error);
+
+        // retry later unless the cell was edited again meanwhile
+        edits.forEach(edit => {
+            const key = edit.id + ":" + edit.field;
+
+            if (!queue.edits.has(key)) {
+                queue.edits.set(key, edit);
+            }
+        });
+
+        scheduleFieldUpdates(url);
+    })
+    .finally(() => {
+        queue.sending = false;
+    });
+}
+
+window.addEventListener("pagehide", () => {
+    Object.keys(fieldQueues).forEach(url => flushFieldUpdates(url, true));
+});
+
+// fills every element matching selector with the HTML at its data-src
+// once it comes within a screen of the viewport
+function setupLazySections(selector) {
+    const sections = document.querySelectorAll(selector);
+
+    function load(section) {
+        fetch(section.dataset.src, {
+            headers: {"X-Requested-With": "XMLHttpRequest"}
+        })
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(response.status);
+            }
+
+            return response.text();
+        })
+        .then(html => {
+            section.innerHTML = html;
+        })
+        .catch(error => {
+            console.error("Error:", error);
+            section.innerHTML = '<div class="text-center text-danger small py-3">Could not load</div>';
+        });
+    }
+
+    if (!("IntersectionObserver" in window)) {
+        sections.forEach(load);
+        return;
+    }
+
+    const observer = new IntersectionObserver(entries => {
+        entries.forEach(entry => {
+            if (entry.isIntersecting) {
+                observer.unobserve(entry.target);
+                load(entry.target);
+            }
+        });
+    }, {rootMargin: "100% 0px"});
+
+    sections.forEach(section => observer.observe(section));
+}
+
+function showLiveNotice(text) {
+    const notice = document.getElementById("liveNotice");
+
+    if (!notice) {
+        return;
+    }
+
+    notice.innerHTML = `${text} <a href="#" class="alert-link">Reload</a>`;
+    notice.querySelector("a").addEventListener("click", event => {
+        event.preventDefault();
+        window.location.reload();
+    });
+    notice.classList.remove("d-none");
+}
+
+function patchLiveRow(element, id, values) {
+    Object.entries(values).forEach(([field, value]) => {
+        if (field === "version") {
+            element.dataset.version = value;
+
+            // queued edits of this row start from the new version, unless
+            // some of ours are still waiting and must not overwrite theirs
+            Object.values(fieldQueues).forEach(queue => {
+                const waiting = Array.from(queue.edits.values()).some(edit => String(edit.id) === String(id));
+
+                if (id in queue.versions && !waiting && !queue.sending) {
+                    queue.versions[id] = value;
+                }
+            });
+
+            return;
+        }
+
+        element.querySelectorAll(`[data-live-field="${field}"]`).forEach(control => {
+            // never pull a value out from under the user's cursor
+            if (control === document.activeElement) {
+                return;
+            }
+
+            if (control.type === "checkbox") {
+                control.checked = Boolean(value);
+            } else {
+                control.value = value === null ? "" : value;
+            }
+        });
+    });
+}
+
+function setupLiveRows(url) {
+    if (!("EventSource" in window)) {
+        return;
+    }
+
+    const source = new EventSource(url);
+
+    source.addEventListener("rows", function (message) {
+        const event = JSON.parse(message.data);
+
+        if (event.action === "create") {
+            showLiveNotice("New records were added.");
+            return;
+        }
+
+        if (event.action === "reload") {
+            showLiveNotice("Records were imported or changed in bulk.");
+            return;
+        }
+
+        event.rows.forEach(row => {
+            document.querySelectorAll(`[data-live-row="${event.kind}:${row.id}"]`).forEach(element => {
+                if (event.action === "delete") {
+                    element.classList.add("opacity-50");
+                    element.querySelectorAll("input, select, button").forEach(control => {
+                        control.disabled = true;
+                    });
+                    return;
+                }
+
+                patchLiveRow(element, row.id, row.values);
+            });
+        });
+    });
+
+    source.addEventListener("reload", function () {
+        showLiveNotice("Some changes could not be shown live.");
+    });
+}
@@ -0,0 +1,119 @@
+from django.db.models import Count, Q
+
+from .caching import cached
+from .counters import counter_summary
+from .models import Installation, P4ID, P8ID, P9ID
+
+
+# ================= INSTALLATION DASHBOARD =================
+def _installation_totals():
+    """
+    Distinct values behind the dashboard cards; counters cannot hold
+    these, so they come from one aggregate.
+    """
+
+    return Installation.objects.aggregate(
+        facility=Count("facility", distinct=True),
+        system=Count("system", distinct=True),
+        ms_id=Count("ms_id", distinct=True),
+        saw_program=Count("saw_program", distinct=True),
+    )
+
+
+def installation_stats():
+    """
+    Everything the installation dashboard shows. The status split and
+    yearly completions are read from the counters; the distinct totals
+    are cached until the next Installation write.
+    """
+
+    counts = counter_summary("installation")
+
+    return {
+        "totals": cached("installation", "totals", _installation_totals),
+        "status": counts["status"],
+        "yearly": counts["yearly"],
+    }
+
+
+# ================= P4 / P8 / P9 DASHBOARDS =================
+MILESTONES = {
+    "p4": {"model": P4ID, "children": "ms_ids", "child_type": "ms"},
+    "p8": {"model": P8ID, "children": "p4_ids", "child_type": "p4"},
+    "p9": {"model": P9ID, "children": "p8_ids", "child_type": "p8"},
+}
+
+COMPLETED = Q(completed=True)
+PENDING = Q(completed=False)
+
+
+def _completed_in(year):
+
+    return COMPLETED & Q(end_date__year=year)
+
+
+def _milestone_children(level):
+    """
+    Distinct records linked below ``level``, from its M2M table.
+    """
+
+    spec = MILESTONES[level]
+    model = spec["model"]
+
+    through = getattr(model, spec["children"]).through
+    child_column = getattr(model, spec["children"]).field.m2m_reverse_field_name()
+
+    return through.objects.aggregate(
+        total=Count(child_column, distinct=True)
+    )["total"]
+
+
+def milestone_stats(level):
+    """
+    Cards and charts of the P4/P8/P9 dashboards. Totals and the yearly
+    series are read from the counters; the linked-children count is
+    cached until the next write to that level or to its M2M links.
+    """
+
+    counts = counter_summary(level)
+
+    return {
+        "total": counts["total"],
+        "completed": counts["completed"],
+        "pending": counts["pending"],
+        "children": cached(level, "children", lambda: _milestone_children(level)),
+        "yearly": counts["yearly"],
+    }
+
+
+def milestone_records(level, filter_type=None, chart=None, value=None):
+    """
+    ``(title, queryset)`` behind a click on a P4/P8/P9 dashboard card or
+    chart, using the same buckets ``milestone_stats`` counts.
+    """
+
+    spec = MILESTONES[level]
+    records = spec["model"].objects.all()
+    name = level.upper()
+
+    if chart == "status":
+        if value == "Completed":
+            return f"Completed {name}", records.filter(COMPLETED)
+        if value == "Pending":
+            return f"Pending {name}", records.filter(PENDING)
+        return f"All {name}", records
+
+    if chart == "year":
+        return f"Completed {name} in {value}", records.filter(_completed_in(value))
+
+    if filter_type == "completed":
+        return f"Completed {name}", records.filter(COMPLETED)
+
+    if filter_type == "pending":
+        return f"Pending {name}", records.filter(PENDING)
+
+    if filter_type == spec["child_type"]:
+        title = f"{spec['child_type'].upper()} Linked {name}"
+        return title, records.prefetch_related(spec["children"])
+
+    return f"All {name}", records
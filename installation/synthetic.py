@@ -0,0 +1,764 @@
+import datetime
+import io
+import itertools
+import random
+import string
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from camera_app.models import CameraImage
+from entry.models import (
+    ABDEntry,
+    EquipmentDocument,
+    EquipmentEntry,
+    Facility,
+    MSIncoActEntry,
+    System,
+    SystemEquipmentQuantity,
+    SystemFacilityAssignment,
+)
+from ittask.models import Ticket
+
+from .autocomplete import INDEXES
+from .caching import bump_facilities, bump_on_commit
+from .closure import refresh_closure
+from .counters import reconcile_counters
+from .forms import InstallationForm
+from .live import publish
+from .models import Installation, P4ID, P8ID, P9ID
+from .signals import after_bulk_write
+
+
+BATCH_SIZE = 5000
+
+# the system codes the installation form offers, without the "0" placeholder
+SYSTEM_CODES = [code for code, label in InstallationForm.SYSTEM_CHOICES if code != "0"]
+
+UNITS = [code for code, label in InstallationForm.UNIT_CHOICES]
+STAGES = [code for code, label in InstallationForm.STAGE_CHOICES]
+
+# (value, weight) pairs
+STATUSES = [("Completed", 50), ("Ongoing", 30), ("Not Started Yet", 20)]
+TYPES = [("TB", 80), ("MB", 20)]
+FACILITY_TYPES = [("Core", 3), ("Terminal", 5), ("Associate", 2)]
+TICKET_STATUSES = [("closed", 55), ("in_progress", 20), ("open", 25)]
+USER_ROLES = [("manager", 10), ("staff", 60), ("viewer", 30)]
+
+# milestone fan-out: (children per record, weight), and the share of
+# children no record covers yet
+P4_FAN_OUT = [(1, 25), (2, 30), (3, 20), (4, 12), (5, 8), (6, 5)]
+P8_FAN_OUT = [(2, 30), (3, 25), (4, 20), (5, 12), (6, 8), (8, 5)]
+P9_FAN_OUT = [(2, 40), (3, 30), (4, 20), (5, 10)]
+UNCOVERED = {"p4": 0.15, "p8": 0.10, "p9": 0.20}
+
+# chance that a record is completed when all of its children are, and
+# when some are not
+COMPLETED_IF_DONE = {"p4": 0.85, "p8": 0.80, "p9": 0.75}
+COMPLETED_IF_OPEN = 0.04
+
+BUILDINGS = [
+    "Reactor building",
+    "Turbine building",
+    "Switchgear building",
+    "Control building",
+    "Diesel generator building",
+    "Auxiliary building",
+    "Pump station",
+    "Administration building",
+    "Training center",
+    "Warehouse",
+]
+
+ROOMS = [
+    "Cable room",
+    "Equipment room",
+    "Corridor",
+    "Control room",
+    "Battery room",
+    "Ventilation room",
+    "Office",
+    "Stair case",
+]
+
+EQUIPMENT = [
+    "Control and Image Recording Rack",
+    "Operator Workplace",
+    "IP Telephone",
+    "Loudspeaker",
+    "Video Camera",
+    "Network Switch",
+    "Patch Panel",
+    "UPS",
+    "Intercom Station",
+    "Media Converter",
+    "Server Cabinet",
+    "Power Supply Unit",
+    "Radio Base Station",
+    "Antenna",
+    "Monitor",
+]
+
+BRANDS = ["SU-19", "RMO ZPUPD", "Cisco", "Siemens", "Axis", "Bosch", "Hytera", "APC"]
+
+ISSUES = [
+    "Telephone not working",
+    "Camera offline",
+    "Network outage",
+    "Loudspeaker noise",
+    "Card reader fault",
+    "Monitor flickering",
+    "Radio has no signal",
+    "Recorder disk full",
+]
+
+# systems whose devices have a telephone number
+TELEPHONE_SYSTEMS = {"CYA", "CYB", "CYC"}
+
+
+def _weighted(rnd, pairs, k=None):
+
+    values, weights = zip(*pairs)
+
+    if k is None:
+        return rnd.choices(values, weights)[0]
+
+    return rnd.choices(values, weights, k=k)
+
+
+class SyntheticData:
+    """
+    Writes a realistic, reproducible data set through ``bulk_create``:
+    facilities and their systems, installations spread unevenly over the
+    facilities, P4/P8/P9 chains over them, rooms and devices, equipment
+    with quantities, tickets and images. Derived tables (progress,
+    closure, dashboard counters) and caches are brought up to date at the
+    end, as ``after_bulk_write`` does for imports.
+
+    Only new facilities are created, so running it again adds a second
+    batch next to the first instead of touching it.
+    """
+
+    def __init__(self, seed=0, batch_size=BATCH_SIZE, log=None):
+
+        self.rnd = random.Random(seed)
+        self.batch_size = batch_size
+        self.log = log or (lambda message: None)
+        self.today = timezone.localdate()
+        self.counts = {}
+
+        self.facilities = []         # facility codes
+        self.weights = []            # share of the installations, per facility
+        self.assigned = {}           # facility code -> system codes
+        self.ms_ids = {}             # facility code -> installation ms_ids
+        self.images = []             # stored image names
+
+    def _create(self, model, objs, **kwargs):
+
+        objs = model.objects.bulk_create(objs, batch_size=self.batch_size, **kwargs)
+        label = model._meta.label
+
+        self.counts[label] = self.counts.get(label, 0) + len(objs)
+
+        return objs
+
+    def _date(self, days_back):
+
+        return self.today - datetime.timedelta(days=self.rnd.randint(0, days_back))
+
+    # ================= FACILITIES / SYSTEMS =================
+    def _free_codes(self, count):
+        """
+        ``count`` unused KKS-like building codes, e.g. ``10UBA``.
+        """
+
+        taken = set(Facility.objects.values_list("code", flat=True))
+
+        if apps.is_installed("roomwise"):
+            from roomwise.models import Facility as RoomFacility
+
+            taken |= set(RoomFacility.objects.values_list("facility", flat=True))
+
+        codes = [
+            f"{unit}U{first}{second}"
+            for unit in ("00", "10", "20", "30", "40", "50")
+            for first, second in itertools.product(string.ascii_uppercase, repeat=2)
+            if f"{unit}U{first}{second}" not in taken
+        ]
+
+        if len(codes) < count:
+            raise ValueError(f"Only {len(codes)} unused facility codes left")
+
+        return sorted(self.rnd.sample(codes, count))
+
+    def create_facilities(self, count):
+
+        self.facilities = self._free_codes(count)
+
+        # a few large sites and a long tail of small ones
+        ranks = list(range(1, count + 1))
+        self.rnd.shuffle(ranks)
+        self.weights = [1 / rank ** 0.7 for rank in ranks]
+
+        titles = {
+            code: f"{self.rnd.choice(BUILDINGS)} ({code})"
+            for code in self.facilities
+        }
+
+        facilities = self._create(Facility, [
+            Facility(code=code, title=titles[code], type=_weighted(self.rnd, FACILITY_TYPES))
+            for code in self.facilities
+        ])
+
+        System.objects.bulk_create(
+            [System(code=code, title=f"{code} communication system") for code in SYSTEM_CODES],
+            ignore_conflicts=True,
+        )
+        systems = {system.code: system for system in System.objects.filter(code__in=SYSTEM_CODES)}
+
+        assignments = []
+
+        for facility in facilities:
+
+            codes = sorted(self.rnd.sample(SYSTEM_CODES, self.rnd.randint(3, 8)))
+            self.assigned[facility.code] = codes
+
+            assignments += [
+                SystemFacilityAssignment(system=systems[code], facility=facility)
+                for code in codes
+            ]
+
+        self._create(SystemFacilityAssignment, assignments)
+
+        self.log(f"{count} facilities, {len(assignments)} system assignments")
+
+        return facilities, systems
+
+    # ================= INSTALLATIONS =================
+    def _installation(self, seq, facility):
+
+        system = self.rnd.choice(self.assigned[facility])
+        status = _weighted(self.rnd, STATUSES)
+        ms_id = f"MS{seq:06d}"
+
+        start_date = end_date = None
+        abd_number = ""
+
+        if status == "Completed":
+            end_date = self._date(4 * 365)
+            start_date = end_date - datetime.timedelta(days=self.rnd.randint(7, 180))
+            abd_number = f"ABD-{end_date.year}-{seq:06d}"
+
+        elif status == "Ongoing":
+            start_date = self._date(365)
+
+        return Installation(
+            ms_id_full=f"{facility}.{system}.{ms_id}",
+            ms_id=ms_id,
+            status=status,
+            type=_weighted(self.rnd, TYPES),
+            abd_number=abd_number,
+            start_date=start_date,
+            end_date=end_date,
+            system=system,
+            facility=facility,
+            saw_program=f"SAW-{facility}-{self.rnd.randint(1, 40):02d}",
+            unit=self.rnd.choice(UNITS),
+            stage=self.rnd.choice(STAGES),
+        )
+
+    def create_installations(self, count):
+        """
+        ``[(pk, facility, system, completed), ...]`` of the new rows.
+        """
+
+        first = Installation.objects.count() + 1
+        facilities = self.rnd.choices(self.facilities, self.weights, k=count)
+        rows = []
+
+        for start in range(0, count, self.batch_size):
+
+            created = self._create(Installation, [
+                self._installation(first + start + offset, facility)
+                for offset, facility in enumerate(facilities[start:start + self.batch_size])
+            ])
+
+            for installation in created:
+
+                rows.append((
+                    installation.pk,
+                    installation.facility,
+                    installation.system,
+                    installation.status == "Completed",
+                ))
+                self.ms_ids.setdefault(installation.facility, []).append(installation.ms_id)
+
+        self.log(f"{count} installations")
+
+        return rows
+
+    # ================= P4 / P8 / P9 =================
+    def _groups(self, level, children, fan_out):
+        """
+        Split ``{group: [(pk, completed), ...]}`` into the children of
+        new records, ``[(group, [(pk, completed), ...]), ...]``.
+        """
+
+        groups = []
+
+        for key, members in children.items():
+
+            members = list(members)
+            self.rnd.shuffle(members)
+
+            while members:
+
+                size = _weighted(self.rnd, fan_out)
+                chunk, members = members[:size], members[size:]
+
+                if self.rnd.random() >= UNCOVERED[level]:
+                    groups.append((key, chunk))
+
+        return groups
+
+    def _completion(self, level, chunk):
+
+        done = all(completed for pk, completed in chunk)
+        chance = COMPLETED_IF_DONE[level] if done else COMPLETED_IF_OPEN
+
+        if self.rnd.random() >= chance:
+            return False, self._date(365) if self.rnd.random() < 0.6 else None, None
+
+        end_date = self._date(3 * 365)
+
+        return True, end_date - datetime.timedelta(days=self.rnd.randint(7, 120)), end_date
+
+    def _milestones(self, level, model, through, column, groups, build):
+        """
+        Create one ``model`` record per group and link it to the group's
+        children. Returns ``[(pk, facility, completed), ...]``.
+        """
+
+        first = model.objects.count() + 1
+        rows = []
+
+        for start in range(0, len(groups), self.batch_size):
+
+            batch = groups[start:start + self.batch_size]
+            records = []
+
+            for offset, (facility, chunk) in enumerate(batch):
+
+                completed, start_date, end_date = self._completion(level, chunk)
+
+                records.append(build(
+                    first + start + offset, facility, chunk,
+                    completed=completed, start_date=start_date, end_date=end_date,
+                ))
+
+            records = self._create(model, records)
+
+            self._create(through, [
+                through(**{f"{model._meta.model_name}_id": record.pk, column: pk})
+                for record, (facility, chunk) in zip(records, batch)
+                for pk, completed in chunk
+            ])
+
+            rows += [
+                (record.pk, facility, record.completed)
+                for record, (facility, chunk) in zip(records, batch)
+            ]
+
+        self.log(f"{len(rows)} {level.upper()} records")
+
+        return rows
+
+    def create_milestones(self, installations):
+
+        by_system = {}
+
+        for pk, facility, system, completed in installations:
+            by_system.setdefault((facility, system), []).append((pk, completed))
+
+        p4_groups = [
+            (facility, chunk)
+            for (facility, system), chunk in self._groups("p4", by_system, P4_FAN_OUT)
+        ]
+
+        # now and then a P4 also covers a row of a neighbouring system
+        for facility, chunk in p4_groups:
+
+            if self.rnd.random() < 0.05:
+
+                system = self.rnd.choice(self.assigned[facility])
+                extra = self.rnd.choice(by_system.get((facility, system)) or chunk)
+
+                if extra not in chunk:
+                    chunk.append(extra)
+
+        p4 = self._milestones(
+            "p4", P4ID, P4ID.ms_ids.through, "installation_id", p4_groups,
+            lambda seq, facility, chunk, **values: P4ID(
+                p4_id=f"P4-{facility}-{seq:06d}",
+                saw_programs=f"SAW-{facility}-{self.rnd.randint(1, 40):02d}",
+                associate_ms=f"{len(chunk)} MS",
+                **values,
+            ),
+        )
+
+        p8 = self._milestones(
+            "p8", P8ID, P8ID.p4_ids.through, "p4id_id",
+            self._groups("p8", self._by_facility(p4), P8_FAN_OUT),
+            lambda seq, facility, chunk, **values: P8ID(
+                p8_id=f"P8-{facility}-{seq:05d}",
+                p2_id=f"P2-{facility}-{seq:05d}",
+                **values,
+            ),
+        )
+
+        self._milestones(
+            "p9", P9ID, P9ID.p8_ids.through, "p8id_id",
+            self._groups("p9", self._by_facility(p8), P9_FAN_OUT),
+            lambda seq, facility, chunk, **values: P9ID(
+                p9_id=f"P9-{facility}-{seq:05d}",
+                **values,
+            ),
+        )
+
+    @staticmethod
+    def _by_facility(rows):
+
+        children = {}
+
+        for pk, facility, completed in rows:
+            children.setdefault(facility, []).append((pk, completed))
+
+        return children
+
+    # ================= EQUIPMENT =================
+    def create_equipment(self, facilities, systems):
+
+        equipment = {}
+
+        for entry in EquipmentEntry.objects.filter(system__in=systems.values()).select_related("system"):
+            equipment.setdefault(entry.system.code, []).append(entry)
+
+        missing = [code for code in SYSTEM_CODES if code not in equipment]
+
+        created = self._create(EquipmentEntry, [
+            EquipmentEntry(
+                system=systems[code],
+                equipment_name=name,
+                equipment_brand=self.rnd.choice(BRANDS),
+                type=_weighted(self.rnd, FACILITY_TYPES),
+            )
+            for code in missing
+            for name in self.rnd.sample(EQUIPMENT, self.rnd.randint(5, 12))
+        ])
+
+        for entry in created:
+            equipment.setdefault(entry.system.code, []).append(entry)
+
+        self._create(EquipmentDocument, [
+            EquipmentDocument(
+                equipment=entry,
+                code=f"RPR.{entry.system.code}.SS.TB{self.rnd.randint(1, 9999):04d}",
+                title=f"{entry.equipment_name} datasheet",
+                description=f"{entry.equipment_brand} {entry.equipment_name}",
+                image=self.rnd.choice(self.images) if self.images else None,
+            )
+            for entry in created
+            for number in range(self.rnd.randint(0, 2))
+        ])
+
+        self._create(SystemEquipmentQuantity, [
+            SystemEquipmentQuantity(
+                system=systems[code],
+                facility=facility,
+                equipment_name=entry.equipment_name,
+                equipment_entry=entry,
+                quantity=self.rnd.randint(1, 40),
+                doc_reference_code=f"RPR.{facility.code}.{code}.SS.TB{self.rnd.randint(1, 9999):04d}",
+                doc_version=f"C0{self.rnd.randint(1, 4)}",
+            )
+            for facility in facilities
+            for code in self.assigned[facility.code]
+            for entry in equipment[code]
+        ])
+
+        self.log(f"{len(created)} equipment entries and their quantities")
+
+    # ================= ROOMS / DEVICES =================
+    def create_rooms(self):
+        """
+        The roomwise side of the same facilities: rooms sized to the
+        facility and devices tied to its installations.
+        """
+
+        from roomwise.models import (
+            Equipment,
+            Facility as RoomFacility,
+            FacilitySystem,
+            Room,
+            RoomWiseDevice,
+            System as RoomSystem,
+        )
+
+        facilities = self._create(RoomFacility, [
+            RoomFacility(facility=code, facility_title=f"{self.rnd.choice(BUILDINGS)} ({code})")
+            for code in self.facilities
+        ])
+
+        RoomSystem.objects.bulk_create(
+            [RoomSystem(system_code=code, system_title=f"{code} communication system") for code in SYSTEM_CODES],
+            ignore_conflicts=True,
+        )
+        systems = {
+            system.system_code: system
+            for system in RoomSystem.objects.filter(system_code__in=SYSTEM_CODES)
+        }
+
+        self._create(FacilitySystem, [
+            FacilitySystem(facility=facility, system=systems[code])
+            for facility in facilities
+            for code in self.assigned[facility.facility]
+        ])
+
+        names = {
+            system.pk: [equipment.equipment_name for equipment in system.equipments.all()]
+            for system in RoomSystem.objects.prefetch_related("equipments")
+        }
+
+        self._create(Equipment, [
+            Equipment(system=system, equipment_name=name)
+            for system in systems.values()
+            if not names[system.pk]
+            for name in self.rnd.sample(EQUIPMENT, self.rnd.randint(5, 12))
+        ])
+
+        rooms = self._create(Room, [
+            Room(
+                facility=facility,
+                room_kks=f"{facility.facility}{number:03d}",
+                room_title=self.rnd.choice(ROOMS),
+            )
+            for facility in facilities
+            for number in range(1, min(3 + len(self.ms_ids.get(facility.facility, ())) // 40, 120) + 1)
+        ])
+
+        devices = []
+
+        for room in rooms:
+
+            code = room.facility.facility
+            ms_ids = self.ms_ids.get(code) or [""]
+
+            for number in range(1, self.rnd.randint(2, 18) + 1):
+
+                system = self.rnd.choice(self.assigned[code])
+
+                devices.append(RoomWiseDevice(
+                    room=room,
+                    system=systems[system],
+                    device_kks=f"{room.room_kks}-{system}{number:02d}",
+                    device_title=self.rnd.choice(EQUIPMENT),
+                    ms_id=self.rnd.choice(ms_ids),
+                    telephone_number=(
+                        str(self.rnd.randint(1000, 9999)) if system in TELEPHONE_SYSTEMS else None
+                    ),
+                ))
+
+        self._create(RoomWiseDevice, devices)
+
+        self.log(f"{len(rooms)} rooms, {len(devices)} devices")
+
+    # ================= ACTS =================
+    def create_acts(self, count):
+
+        codes = [
+            (facility, ms_id)
+            for facility, ms_ids in self.ms_ids.items()
+            for ms_id in ms_ids
+        ]
+
+        if not codes:
+            return
+
+        self._create(MSIncoActEntry, [
+            MSIncoActEntry(
+                ms_id=ms_id,
+                incoming_act=f"ACT-{facility}-{number:05d}",
+            )
+            for number, (facility, ms_id) in enumerate(self.rnd.choices(codes, k=count), 1)
+        ])
+
+        abd = []
+
+        for facility, ms_id in self.rnd.choices(codes, k=count):
+
+            end_date = self._date(3 * 365)
+
+            abd.append(ABDEntry(
+                ms_id=ms_id,
+                status=self.rnd.choice(["YES", "NO"]),
+                abd_number=f"ABD-{end_date.year}-{self.rnd.randint(1, 999999):06d}",
+                start_date=end_date - datetime.timedelta(days=self.rnd.randint(7, 180)),
+                end_date=end_date,
+            ))
+
+        self._create(ABDEntry, abd)
+
+        self.log(f"{count} incoming acts, {count} ABD entries")
+
+    # ================= USERS / TICKETS =================
+    def create_users(self, count):
+        """
+        One admin plus ``count - 1`` users of the other roles, none of
+        them able to log in with a password.
+        """
+
+        User = get_user_model()
+
+        taken = set(User.objects.filter(username__startswith="synthetic_").values_list("username", flat=True))
+        first = len(taken) + 1
+        password = make_password(None)
+
+        users = []
+
+        for number in range(first, first + count):
+
+            role = "admin" if number == first else _weighted(self.rnd, USER_ROLES)
+            username = f"synthetic_{role}{number:03d}"
+
+            if username not in taken:
+                users.append(User(username=username, role=role, password=password))
+
+        users = self._create(User, users)
+
+        self.log(f"{len(users)} users")
+
+        return users
+
+    def create_tickets(self, count, users):
+
+        if not users:
+            return
+
+        now = timezone.now()
+        staff = [user for user in users if user.role in ("admin", "manager", "staff")] or users
+        tickets = []
+
+        for number in range(count):
+
+            status = _weighted(self.rnd, TICKET_STATUSES)
+            created_at = now - datetime.timedelta(minutes=self.rnd.randint(60, 2 * 365 * 24 * 60))
+            assigned = status != "open" or self.rnd.random() < 0.5
+            assigned_at = created_at + datetime.timedelta(minutes=self.rnd.randint(5, 48 * 60)) if assigned else None
+            facility = self.rnd.choice(self.facilities)
+
+            ticket = Ticket(
+                title=f"{self.rnd.choice(ISSUES)} in {facility}",
+                description=f"Reported for {facility}, {self.rnd.choice(ROOMS).lower()}.",
+                created_by=self.rnd.choice(users),
+                assigned_to=self.rnd.choice(staff) if assigned else None,
+                assigned_at=assigned_at,
+                status=status,
+                closed_at=(
+                    assigned_at + datetime.timedelta(minutes=self.rnd.randint(30, 14 * 24 * 60))
+                    if status == "closed" else None
+                ),
+            )
+            # created_at is overwritten on insert; set again below
+            ticket.backdated = created_at
+            tickets.append(ticket)
+
+        tickets = self._create(Ticket, tickets)
+
+        for ticket in tickets:
+            ticket.created_at = ticket.backdated
+
+        Ticket.objects.bulk_update(tickets, ["created_at"], batch_size=self.batch_size)
+
+        self.log(f"{count} tickets")
+
+    # ================= IMAGES =================
+    def create_images(self, count):
+        """
+        Small generated PNGs stored as camera captures; equipment
+        documents reuse them.
+        """
+
+        images = []
+
+        for number in range(1, count + 1):
+
+            buffer = io.BytesIO()
+            color = tuple(self.rnd.randint(0, 255) for channel in range(3))
+            Image.new("RGB", (64, 48), color).save(buffer, format="PNG")
+
+            image = CameraImage(
+                title=f"{self.rnd.choice(ISSUES)} #{number}",
+                capture_date=self._date(365),
+            )
+            image.image.save(f"synthetic_{number:05d}.png", ContentFile(buffer.getvalue()), save=False)
+            images.append(image)
+
+        self._create(CameraImage, images)
+        self.images = [image.image.name for image in images]
+
+        self.log(f"{count} images")
+
+    # ================= DERIVED DATA =================
+    def refresh_derived(self, installation_ids):
+        """
+        What the signals would have done for every row written above.
+        """
+
+        after_bulk_write(installation_ids)
+        refresh_closure(installation_ids)
+
+        for kind in ("p4", "p8", "p9"):
+            reconcile_counters(kind)
+            bump_on_commit(kind)
+            publish(kind, "reload")
+
+        for index in INDEXES.values():
+            bump_on_commit(index.namespace)
+
+        bump_facilities(self.facilities)
+
+        self.log("progress, closure and counters refreshed")
+
+
+def generate(installations, facilities, users, tickets, images, seed=0,
+             batch_size=BATCH_SIZE, log=None):
+    """
+    Write one synthetic data set; returns ``{model label: rows created}``.
+    """
+
+    data = SyntheticData(seed=seed, batch_size=batch_size, log=log)
+
+    # files first: a rolled back transaction leaves unused files behind,
+    # never rows pointing at missing ones
+    data.create_images(images)
+
+    with transaction.atomic():
+
+        entry_facilities, systems = data.create_facilities(facilities)
+        rows = data.create_installations(installations)
+        data.create_milestones(rows)
+        data.create_equipment(entry_facilities, systems)
+
+        if apps.is_installed("roomwise"):
+            data.create_rooms()
+
+        data.create_acts(max(installations // 20, 1))
+        data.create_tickets(tickets, data.create_users(users))
+        data.refresh_derived([pk for pk, facility, system, completed in rows])
+
+    return data.counts
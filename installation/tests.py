@@ -1,3 +1,1315 @@
-from django.test import TestCase
+import csv
+import json
+from inspect import iscoroutinefunction
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import openpyxl
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import views
+from .autocomplete import INDEX_RECHECK, INDEXES, VERSION_RECHECK, AutocompleteIndex
+from .caching import _log_key, bump_version, get_version
+from .checks import check_search_index
+from .closure import ancestors_of, installations_under, verify_closure
+from .counters import KINDS, reconcile_counters, verify_counters
+from .edits import apply_edits
+from .hierarchy import facility_counts, facility_hierarchy
+from .live import publish, publish_rows
+from .models import DashboardCounter, Installation, InstallationLabel, InstallationProgress, P4ID, P8ID, P9ID
+from .pagination import cursor_paginate, encode_cursor
+from .progress import progress_rows, verify_progress
+from .rollup import installation_progress
+from .sheets import read_rows, row_ranges
+
+
+def make_installation(ms_id, facility="FAC1", system="CYA", status="Ongoing", type="TB"):
+
+    return Installation.objects.create(
+        ms_id_full=f"{facility}.{system}.{ms_id}",
+        ms_id=ms_id,
+        status=status,
+        type=type,
+        abd_number="",
+        system=system,
+        facility=facility,
+        saw_program="SAW",
+        unit="U1",
+        stage="ST01",
+    )
+
+
+def make_user(role="admin"):
+
+    return get_user_model().objects.create_user(username=role, password="secret", role=role)
+
+
+def make_p4(p4_id, installations=(), completed=False):
+
+    p4 = P4ID.objects.create(p4_id=p4_id, saw_programs="", associate_ms="", completed=completed)
+    p4.ms_ids.set(installations)
+
+    return p4
+
+
+def make_p8(p8_id, p4s=(), completed=False):
+
+    p8 = P8ID.objects.create(p8_id=p8_id, p2_id="", completed=completed)
+    p8.p4_ids.set(p4s)
+
+    return p8
+
+
+def make_p9(p9_id, p8s=(), completed=False):
+
+    p9 = P9ID.objects.create(p9_id=p9_id, completed=completed)
+    p9.p8_ids.set(p8s)
+
+    return p9
+
+
+def walked_progress():
+    """
+    The per-installation walk the facility dashboard used to do, a few
+    queries per row.
+    """
+
+    rows = []
+
+    for ins in Installation.objects.filter(type="TB").order_by("facility", "system"):
+
+        p4s = ins.p4_entries.all()
+        p8s = P8ID.objects.filter(p4_ids__in=p4s, completed=True).distinct()
+        p9s = P9ID.objects.filter(p8_ids__in=p8s, completed=True).distinct()
+
+        rows.append((
+            ins.id,
+            bool(ins.status) and ins.status.lower() in ["complete", "completed", "done"],
+            p4s.filter(completed=True).exists(),
+            p8s.exists(),
+            p9s.exists(),
+        ))
+
+    return rows
+
+
+def rollup_rows(rows):
+
+    return [
+        (row["installation_id"], row["completed"], row["p4_completed"],
+         row["p8_completed"], row["p9_completed"])
+        for row in rows
+    ]
+
+
+class ChainDataMixin:
+    """
+    Two facilities with chains that are complete, broken at P8 (the P4
+    is open but its P8 is done) and missing, plus an MB row the
+    dashboards leave out.
+    """
+
+    def setUp(self):
+
+        self.done = make_installation("MS1", status="Completed")
+        self.open = make_installation("MS2", status="Ongoing")
+        self.other = make_installation("MS3", facility="FAC2", status="done")
+        self.bare = make_installation("MS4", facility="FAC2", system="CYB")
+        self.mb = make_installation("MS5", type="MB", status="Completed")
+
+        self.p4_done = make_p4("P4-1", [self.done, self.open], completed=True)
+        self.p4_open = make_p4("P4-2", [self.other])
+
+        self.p8_done = make_p8("P8-1", [self.p4_done], completed=True)
+        self.p8_other = make_p8("P8-2", [self.p4_open], completed=True)
+
+        self.p9 = make_p9("P9-1", [self.p8_done], completed=True)
+
+    def progress(self, installation):
+
+        return InstallationProgress.objects.get(installation=installation)
+
+
+# ================= ROLLUP =================
+class RollupTests(ChainDataMixin, TestCase):
+
+    def test_matches_per_installation_walk(self):
+
+        self.assertEqual(rollup_rows(installation_progress()), walked_progress())
+
+    def test_chain_flags(self):
+
+        rows = {row[0]: row[1:] for row in rollup_rows(installation_progress())}
+
+        self.assertEqual(rows[self.done.id], (True, True, True, True))
+        self.assertEqual(rows[self.open.id], (False, True, True, True))
+        # an open P4 still passes its completed P8 on
+        self.assertEqual(rows[self.other.id], (True, False, True, False))
+        self.assertEqual(rows[self.bare.id], (False, False, False, False))
+        self.assertNotIn(self.mb.id, rows)
+
+    def test_query_count_does_not_grow_with_rows(self):
+
+        with CaptureQueriesContext(connection) as before:
+            installation_progress()
+
+        for number in range(20):
+            make_p4(f"P4-extra-{number}", [make_installation(f"X{number}")], completed=True)
+
+        with CaptureQueriesContext(connection) as after:
+            installation_progress()
+
+        self.assertEqual(len(before), len(after))
+
+    def test_progress_table_matches_rollup(self):
+
+        self.assertEqual(verify_progress(), [])
+        self.assertEqual(progress_rows(), installation_progress())
+
+    def test_missing_progress_rows_are_materialized(self):
+
+        InstallationProgress.objects.all().delete()
+
+        self.assertEqual(progress_rows(), installation_progress())
+        self.assertEqual(InstallationProgress.objects.filter(installation__type="TB").count(), 4)
+
+
+# ================= PROGRESS REFRESH =================
+class ProgressRefreshTests(ChainDataMixin, TestCase):
+
+    def assertCurrent(self):
+
+        self.assertEqual(verify_progress(), [])
+
+    def test_installation_status_saved(self):
+
+        self.open.status = "Completed"
+        self.open.save()
+
+        self.assertTrue(self.progress(self.open).f2_completed)
+        self.assertCurrent()
+
+    def test_milestone_completed_toggled(self):
+
+        self.p8_done.completed = False
+        self.p8_done.save()
+
+        self.assertFalse(self.progress(self.done).p8_completed)
+        self.assertFalse(self.progress(self.done).p9_completed)
+        self.assertCurrent()
+
+    def test_m2m_add(self):
+
+        self.p4_done.ms_ids.add(self.bare)
+
+        progress = self.progress(self.bare)
+        self.assertEqual(progress.p4_covering, [self.p4_done.id])
+        self.assertTrue(progress.p9_completed)
+        self.assertCurrent()
+
+    def test_m2m_add_from_the_reverse_side(self):
+
+        self.bare.p4_entries.add(self.p4_done)
+
+        self.assertTrue(self.progress(self.bare).p4_completed)
+        self.assertCurrent()
+
+    def test_m2m_remove(self):
+
+        self.p9.p8_ids.remove(self.p8_done)
+
+        self.assertFalse(self.progress(self.done).p9_completed)
+        self.assertTrue(self.progress(self.done).p8_completed)
+        self.assertCurrent()
+
+    def test_m2m_clear(self):
+
+        self.p8_done.p4_ids.clear()
+
+        self.assertFalse(self.progress(self.open).p8_completed)
+        self.assertFalse(self.progress(self.open).p9_completed)
+        self.assertCurrent()
+
+    def test_m2m_clear_from_the_reverse_side(self):
+
+        self.p4_done.p8_entries.clear()
+
+        self.assertFalse(self.progress(self.done).p8_completed)
+        self.assertCurrent()
+
+    def test_milestone_deleted(self):
+
+        self.p4_done.delete()
+
+        progress = self.progress(self.done)
+        self.assertEqual(progress.p4_covering, [])
+        self.assertFalse(progress.p9_completed)
+        self.assertCurrent()
+
+    def test_installation_deleted(self):
+
+        pk = self.done.pk
+        self.done.delete()
+
+        self.assertFalse(InstallationProgress.objects.filter(installation_id=pk).exists())
+        self.assertCurrent()
+
+
+# ================= CLOSURE / FACILITY HIERARCHY =================
+def walked_paths(level):
+    """
+    ``{facility: sorted cards}`` of the P4/P8/P9 facility dashboards,
+    walked record by record.
+    """
+
+    cards = {}
+
+    for p9 in P9ID.objects.all() if level == "p9" else [None]:
+        for p8 in (p9.p8_ids.all() if p9 else P8ID.objects.all()) if level != "p4" else [None]:
+            for p4 in p8.p4_ids.all() if p8 else P4ID.objects.all():
+                for ms in p4.ms_ids.filter(type__iexact="TB"):
+
+                    top = p9 or p8 or p4
+                    labels = [record.pk for record in (p9, p8, p4) if record]
+
+                    cards.setdefault(ms.facility, []).append(
+                        (*labels, ms.system, ms.ms_id, top.completed)
+                    )
+
+    return {facility: sorted(rows) for facility, rows in cards.items()}
+
+
+def hierarchy_paths(level):
+
+    keys = {
+        "p4": ("p4_db_id", "p4_id"),
+        "p8": ("p8_db_id", "p8_id", "p4_id"),
+        "p9": ("p9_db_id", "p9_id", "p8_id", "p4_id"),
+    }[level]
+
+    codes = {
+        **{("p4_id", p4.p4_id): p4.pk for p4 in P4ID.objects.all()},
+        **{("p8_id", p8.p8_id): p8.pk for p8 in P8ID.objects.all()},
+        **{("p9_id", p9.p9_id): p9.pk for p9 in P9ID.objects.all()},
+    }
+
+    return {
+        facility: sorted(
+            (*[codes[(key, card[key])] for key in keys[1:]], card["system"], card["ms_id"], card["completed"])
+            for card in cards
+        )
+        for facility, cards in facility_hierarchy(level).items()
+    }
+
+
+class ClosureTests(ChainDataMixin, TestCase):
+
+    def setUp(self):
+
+        super().setUp()
+
+        # a second route from the same installations up to P8-1
+        self.p4_extra = make_p4("P4-3", [self.done])
+        self.p8_done.p4_ids.add(self.p4_extra)
+
+    def test_facility_hierarchy_matches_walk(self):
+
+        for level in ("p4", "p8", "p9"):
+            self.assertEqual(hierarchy_paths(level), walked_paths(level), level)
+
+    def test_facility_counts_count_paths(self):
+
+        for level in ("p4", "p8", "p9"):
+            self.assertEqual(
+                dict(facility_counts(level)),
+                {facility: len(rows) for facility, rows in walked_paths(level).items()},
+                level,
+            )
+
+    def test_ancestors_listed_once(self):
+
+        ancestors = ancestors_of(self.done.id)
+
+        self.assertEqual(sorted(row["id"] for row in ancestors["p4"]), [self.p4_done.id, self.p4_extra.id])
+        self.assertEqual([row["id"] for row in ancestors["p8"]], [self.p8_done.id])
+        self.assertEqual([row["id"] for row in ancestors["p9"]], [self.p9.id])
+
+    def test_installations_under_listed_once(self):
+
+        self.assertEqual(
+            sorted(installations_under("p9", self.p9.id).values_list("id", flat=True)),
+            [self.done.id, self.open.id],
+        )
+
+    def test_follows_m2m_changes_and_deletes(self):
+
+        self.p9.p8_ids.add(self.p8_other)
+        self.assertEqual(verify_closure(), [])
+
+        self.p8_done.p4_ids.remove(self.p4_done)
+        self.assertEqual(verify_closure(), [])
+
+        self.p4_extra.delete()
+        self.assertEqual(verify_closure(), [])
+        self.assertEqual(ancestors_of(self.done.id)["p8"], [])
+
+
+# ================= AUTOCOMPLETE =================
+def ms_ids(rows):
+
+    return [row["ms_id"] for row in rows]
+
+
+class AutocompleteTests(TestCase):
+
+    def setUp(self):
+
+        for ms_id in ("MS10", "MS1", "XMS1", "MS2", "ms3"):
+            make_installation(ms_id)
+
+        self.index = AutocompleteIndex("tests", Installation, "ms_id", ("id", "ms_id", "system"))
+        self.index.build()
+
+    def test_ranks_like_the_database_query(self):
+
+        for term in ("", "m", "MS1", "s1", "ms3", "zz"):
+            self.assertEqual(self.index.search(term, 3), self.index.query(term, 3), term)
+
+        self.assertEqual(ms_ids(self.index.search("ms1", 10)), ["MS1", "MS10", "XMS1"])
+
+    def worker(self):
+
+        index = AutocompleteIndex("tests", Installation, "ms_id", ("id", "ms_id", "system"))
+        index.build()
+
+        return index
+
+    def rename(self, old, new):
+
+        installation = Installation.objects.get(ms_id=old)
+        installation.ms_id = new
+        installation.save()
+
+        return installation
+
+    def test_rebuilds_when_another_worker_bumps(self):
+
+        Installation.objects.filter(ms_id="MS2").update(ms_id="MS22")
+        bump_version(self.index.namespace)
+
+        self.index._checked -= VERSION_RECHECK
+
+        self.assertEqual(ms_ids(self.index.search("ms22", 10)), ["MS22"])
+
+    def test_recent_check_skips_the_cache(self):
+
+        with self.assertNumQueries(0):
+            self.index.search("ms", 10)
+
+    def test_other_workers_replay_the_change(self):
+
+        other = self.worker()
+
+        # the receivers run these after the commit
+        self.index.update(self.rename("MS2", "MS22"))
+        removed = Installation.objects.get(ms_id="ms3")
+        pk = removed.pk
+        removed.delete()
+        self.index.remove(pk)
+
+        self.assertEqual(ms_ids(self.index.search("ms22", 10)), ["MS22"])
+
+        other._checked -= VERSION_RECHECK
+
+        with mock.patch.object(other, "build") as build:
+            self.assertEqual(other.search("ms", 10), other.query("ms", 10))
+
+        build.assert_not_called()
+
+        # the replayed change carries the row's updated_at
+        other._stamped -= INDEX_RECHECK
+
+        with mock.patch.object(other, "build") as build:
+            other.search("ms", 10)
+
+        build.assert_not_called()
+
+    def test_rebuilds_when_a_change_went_missing(self):
+
+        other = self.worker()
+
+        self.index.update(self.rename("MS2", "MS22"))
+        self.index.update(self.rename("MS1", "MS11"))
+
+        cache.delete(_log_key(self.index.namespace, self.index._version, 1))
+        other._checked -= VERSION_RECHECK
+
+        self.assertEqual(other.search("ms", 10), other.query("ms", 10))
+        self.assertEqual(other._seq, 2)
+
+    def test_rebuilds_when_a_bump_went_missing(self):
+
+        Installation.objects.filter(ms_id="MS2").update(ms_id="MS22", updated_at=timezone.now())
+
+        self.assertEqual(ms_ids(self.index.search("ms22", 10)), [])
+
+        self.index._stamped -= INDEX_RECHECK
+
+        self.assertEqual(ms_ids(self.index.search("ms22", 10)), ["MS22"])
+
+    def test_stale_index_is_not_patched_into_current(self):
+
+        Installation.objects.filter(ms_id="MS2").update(ms_id="MS22")
+        bump_version(self.index.namespace)
+
+        self.index._checked -= VERSION_RECHECK
+        self.index.update(self.rename("MS1", "MS11"))
+
+        self.assertNotIn("ms11", [key for key, pk in self.index._sorted])
+        self.assertEqual(self.index.search("ms", 10), self.index.query("ms", 10))
+
+    def test_falls_back_to_the_database(self):
+
+        self.index._checked -= VERSION_RECHECK
+
+        with mock.patch("installation.autocomplete.read_log", side_effect=DatabaseError):
+            with self.assertLogs("installation.autocomplete", "WARNING"):
+                rows = self.index.search("ms", 10)
+
+        self.assertEqual(rows, self.index.query("ms", 10))
+
+
+# ================= CURSOR PAGINATION =================
+class CursorPaginationTests(TestCase):
+
+    def setUp(self):
+
+        for number in range(7):
+            make_installation(f"MS{number % 3}", system=f"S{number}")
+
+        self.queryset = Installation.objects.all()
+
+    def page(self, cursor=None, ordering=("-id",)):
+
+        params = {"cursor": cursor} if cursor is not None else {}
+        request = RequestFactory().get("/", params)
+
+        return cursor_paginate(request, self.queryset, ordering, per_page=3, with_total=False)
+
+    def test_bad_cursors_give_the_first_page(self):
+
+        first = [row.id for row in self.page()]
+
+        tokens = [
+            "not a cursor",
+            encode_cursor("x", [1]),
+            encode_cursor("n", []),
+            encode_cursor("n", ["abc"]),
+            encode_cursor("n", [{"x": 1}]),
+            encode_cursor("n", [None]),
+            encode_cursor("n", [[1]]),
+            encode_cursor("p", [1, 2]),
+        ]
+
+        for token in tokens:
+
+            page = self.page(token)
+
+            self.assertEqual([row.id for row in page], first, token)
+            self.assertFalse(page.has_previous, token)
+
+    def walk(self, ordering):
+
+        pages = [self.page(ordering=ordering)]
+
+        while pages[-1].has_next:
+            pages.append(self.page(pages[-1].next_cursor, ordering))
+
+        back = [pages[-1]]
+
+        while back[-1].has_previous:
+            back.append(self.page(back[-1].previous_cursor, ordering))
+
+        return (
+            [[row.id for row in page] for page in pages],
+            [[row.id for row in page] for page in back[::-1]],
+        )
+
+    def test_next_and_previous_round_trip(self):
+
+        # row comparisons both ways, and the expanded form for mixed ones
+        for ordering in (("-id",), ("ms_id", "id"), ("-ms_id", "-id"), ("ms_id", "-id")):
+
+            forward, backward = self.walk(ordering)
+
+            self.assertEqual(
+                sum(forward, []),
+                list(self.queryset.order_by(*ordering).values_list("id", flat=True)),
+                ordering,
+            )
+            self.assertEqual(backward, forward, ordering)
+            self.assertEqual([len(page) for page in forward], [3, 3, 1], ordering)
+
+    def test_cursor_values_take_the_column_type(self):
+
+        ids = sorted(self.queryset.values_list("id", flat=True), reverse=True)
+
+        page = self.page(encode_cursor("n", [str(ids[2])]))
+
+        self.assertEqual([row.id for row in page], ids[3:6])
+
+    def test_total_is_estimated_on_the_first_page_only(self):
+
+        request = RequestFactory().get("/", {"search": "ms"})
+
+        with mock.patch("installation.pagination.approximate_count", return_value=7) as count:
+
+            first = cursor_paginate(request, self.queryset, per_page=3)
+
+            request = RequestFactory().get("/?" + first.next_query)
+            second = cursor_paginate(request, self.queryset, per_page=3)
+
+        self.assertEqual(count.call_count, 1)
+        self.assertEqual(second.approximate_total, 7)
+        self.assertIn("search=ms", first.next_query)
+
+    def test_search_keeps_the_chosen_sort(self):
+
+        exact = make_installation("MS")
+
+        for sort in ("id", "-id", "ms_id", "facility"):
+
+            request = RequestFactory().get("/", {"search": "ms", "sort": sort})
+            search, chosen, queryset, ordering = views.installation_filters(request)
+
+            self.assertEqual(chosen, sort)
+
+            ids = []
+            page = cursor_paginate(request, queryset, ordering, per_page=3, with_total=False)
+            ids += [row.id for row in page]
+
+            while page.has_next:
+                request = RequestFactory().get("/", {"search": "ms", "sort": sort, "cursor": page.next_cursor})
+                page = cursor_paginate(request, queryset, ordering, per_page=3, with_total=False)
+                ids += [row.id for row in page]
+
+            # the exact match leads, the prefix matches follow in ?sort= order
+            self.assertEqual(ids[0], exact.id, sort)
+            self.assertEqual(
+                ids[1:],
+                list(self.queryset.exclude(pk=exact.pk).order_by(
+                    *views.INSTALLATION_SORTS[sort]
+                ).values_list("id", flat=True)),
+                sort,
+            )
+
+
+# ================= VERSION BUMPS =================
+class BumpOnCommitTests(ChainDataMixin, TestCase):
+
+    def test_versions_move_when_the_write_commits(self):
+
+        before = get_version("p4")
+
+        with self.captureOnCommitCallbacks(execute=True):
+
+            self.p4_open.completed = True
+            self.p4_open.save()
+
+            self.assertEqual(get_version("p4"), before)
+
+        self.assertNotEqual(get_version("p4"), before)
+
+    def test_rolled_back_writes_bump_nothing(self):
+
+        before = get_version("installation")
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    make_installation("MS9")
+                    raise DatabaseError
+            except DatabaseError:
+                pass
+
+        self.assertEqual(callbacks, [])
+        self.assertEqual(get_version("installation"), before)
+
+    def test_index_patched_when_the_write_commits(self):
+
+        index = INDEXES["p4"]
+        index.build()
+
+        with self.captureOnCommitCallbacks(execute=True):
+
+            self.p4_open.p4_id = "P4-renamed"
+            self.p4_open.save()
+
+            self.assertEqual(index._entries[self.p4_open.pk][0], "p4-2")
+
+        self.assertEqual(index._entries[self.p4_open.pk][0], "p4-renamed")
+        self.assertEqual(index._version, get_version(index.namespace))
+
+
+# ================= COUNTERS =================
+class CounterTests(ChainDataMixin, TestCase):
+
+    def assertCounted(self):
+
+        for kind in KINDS:
+            self.assertEqual(verify_counters(kind), [], kind)
+
+    def test_writes_move_the_counters(self):
+
+        self.assertCounted()
+
+        self.open.status = "Completed"
+        self.open.end_date = timezone.now().date()
+        self.open.save()
+
+        self.bare.facility = "FAC3"
+        self.bare.save(update_fields=["facility"])
+
+        self.p4_open.completed = True
+        self.p4_open.save()
+
+        self.other.delete()
+        self.p9.delete()
+
+        self.assertCounted()
+
+    def test_reconcile_rewrites_drifted_buckets(self):
+
+        DashboardCounter.objects.filter(kind="installation").update(total=F("total") + 2)
+        DashboardCounter.objects.create(kind="p8", facility="", status="Bogus", year=0, total=3)
+        DashboardCounter.objects.filter(kind="p9").delete()
+
+        drift = {kind: len(verify_counters(kind)) for kind in KINDS}
+
+        self.assertEqual(drift["installation"], DashboardCounter.objects.filter(kind="installation").count())
+        self.assertEqual((drift["p4"], drift["p8"], drift["p9"]), (0, 1, 1))
+
+        for kind in KINDS:
+            self.assertEqual(reconcile_counters(kind), drift[kind], kind)
+
+        self.assertCounted()
+
+    def test_reconcile_command(self):
+
+        DashboardCounter.objects.filter(kind="p4", status="Completed").update(total=F("total") + 1)
+
+        with self.assertRaisesMessage(CommandError, "Counters still drift: p4"):
+            call_command("reconcile_dashboard_counters", "--verify-only", stdout=StringIO())
+
+        out = StringIO()
+        call_command("reconcile_dashboard_counters", "p4", stdout=out)
+
+        self.assertIn("p4: fixed 1 bucket(s)", out.getvalue())
+        self.assertCounted()
+
+        with self.assertRaisesMessage(CommandError, "Unknown kind(s): p5"):
+            call_command("reconcile_dashboard_counters", "p5")
+
+
+# ================= IMPORT =================
+HEADER = ["MS ID Full", "MS_ID", "Status", "Start Date", "Facility", "System"]
+
+
+class ImportCommandTests(TestCase):
+
+    def setUp(self):
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def sheet(self, rows, name="sheet.csv"):
+
+        path = os.path.join(self.directory, name)
+
+        with open(path, "w", newline="", encoding="utf-8") as handle:
+            writer = csv.writer(handle)
+            writer.writerow(HEADER)
+            writer.writerows(rows)
+
+        return path
+
+    def run_import(self, path, *args):
+
+        out = StringIO()
+        call_command("import_installations", path, *args, stdout=out, stderr=StringIO())
+
+        return out.getvalue()
+
+    def stored(self):
+
+        return dict(Installation.objects.values_list("ms_id_full", "status"))
+
+    def test_rejected_rows_go_to_the_rejects_file(self):
+
+        path = self.sheet([
+            ["F.S.1", "1", "Ongoing", "2024-01-05", "F", "S"],
+            ["", "2", "Ongoing", "", "F", "S"],
+            ["F.S.3", "3", "Ongoing", "not a date", "F", "S"],
+        ])
+
+        out = self.run_import(path)
+
+        self.assertIn("Imported 1 row(s)", out)
+        self.assertEqual(self.stored(), {"F.S.1": "Ongoing"})
+
+        with open(os.path.join(self.directory, "sheet.rejected.csv"), encoding="utf-8") as handle:
+            rejects = list(csv.DictReader(handle))
+
+        self.assertEqual([row["Row"] for row in rejects], ["3", "4"])
+        self.assertEqual(rejects[0]["Reason"], "missing MS ID Full")
+        self.assertIn("unreadable Start Date", rejects[1]["Reason"])
+
+    def test_upsert_writes_only_new_and_changed_rows(self):
+
+        self.run_import(self.sheet([
+            ["F.S.1", "1", "Ongoing", "", "F", "S"],
+            ["F.S.2", "2", "Ongoing", "", "F", "S"],
+        ]))
+
+        unchanged = Installation.objects.get(ms_id_full="F.S.2")
+
+        out = self.run_import(self.sheet([
+            ["F.S.1", "1", "Completed", "", "F", "S"],
+            ["F.S.2", "2", "Ongoing", "", "F", "S"],
+            ["F.S.3", "3", "Ongoing", "", "F", "S"],
+            ["F.S.3", "3", "Completed", "", "F", "S"],
+        ], "again.csv"), "--upsert")
+
+        self.assertIn("Inserted 1, updated 1, unchanged 1 row(s)", out)
+        self.assertIn("Rejected 1 row(s)", out)
+        self.assertEqual(self.stored(), {"F.S.1": "Completed", "F.S.2": "Ongoing", "F.S.3": "Ongoing"})
+        self.assertEqual(Installation.objects.get(ms_id_full="F.S.1").version, 1)
+        self.assertEqual(Installation.objects.get(ms_id_full="F.S.2").updated_at, unchanged.updated_at)
+        self.assertEqual(verify_counters("installation"), [])
+
+    def test_upsert_does_not_count_rejected_rows_as_vanished(self):
+
+        self.run_import(self.sheet([
+            ["F.S.1", "1", "Ongoing", "", "F", "S"],
+            ["F.S.2", "2", "Ongoing", "", "F", "S"],
+            ["F.S.3", "3", "Ongoing", "", "F", "S"],
+        ]))
+
+        out = self.run_import(self.sheet([
+            ["F.S.1", "1", "Ongoing", "", "F", "S"],
+            ["F.S.2", "2", "Ongoing", "not a date", "F", "S"],
+        ], "again.csv"), "--upsert")
+
+        self.assertIn("Rejected 1 row(s)", out)
+        self.assertIn("1 stored MS ID Full value(s) are not in the sheet", out)
+
+    def test_workers_read_their_own_ranges(self):
+
+        rows = [[f"F.S.{number}", str(number), "Ongoing", "", "F", "S"] for number in range(9)]
+        rows[4][3] = "not a date"
+
+        csv_path = self.sheet(rows)
+
+        workbook = openpyxl.Workbook()
+        workbook.active.append(HEADER)
+
+        for row in rows:
+            workbook.active.append([f"X{row[0]}", *row[1:]])
+
+        xlsx_path = os.path.join(self.directory, "sheet.xlsx")
+        workbook.save(xlsx_path)
+
+        for path in (csv_path, xlsx_path):
+
+            ranges = row_ranges(path, parts=3)
+
+            self.assertEqual(len(ranges), 3, path)
+            self.assertEqual(
+                [number for start, stop in ranges for number, row in read_rows(path, None, start, stop)],
+                list(range(2, 11)),
+                path,
+            )
+
+        out = self.run_import(csv_path, "--workers", "2", "--chunk-size", "2")
+
+        self.assertIn("Imported 8 row(s)", out)
+
+        with open(os.path.join(self.directory, "sheet.rejected.csv"), encoding="utf-8") as handle:
+            self.assertEqual([row["Row"] for row in csv.DictReader(handle)], ["6"])
+
+        out = self.run_import(xlsx_path, "--workers", "2")
+
+        self.assertIn("Imported 8 row(s)", out)
+        self.assertEqual(len(self.stored()), 16)
+
+    def test_failed_import_writes_nothing(self):
+
+        path = self.sheet([
+            ["F.S.1", "1", "Ongoing", "", "F", "S"],
+            ["F.S.2", "2", "Ongoing", "", "F", "S"],
+        ])
+
+        bulk_create = Installation.objects.bulk_create
+        calls = []
+
+        def fail_second_chunk(objs, **kwargs):
+
+            calls.append(objs)
+
+            if len(calls) > 1:
+                raise DatabaseError("disk full")
+
+            return bulk_create(objs, **kwargs)
+
+        with mock.patch.object(Installation.objects, "bulk_create", fail_second_chunk):
+            with self.assertRaisesMessage(DatabaseError, "disk full"):
+                self.run_import(path, "--chunk-size", "1")
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.stored(), {})
+
+
+# ================= INLINE EDITS =================
+class InlineEditTests(TestCase):
+
+    def setUp(self):
+
+        self.client.force_login(make_user())
+        self.installation = make_installation("MS1")
+
+    def post(self, name, data, *args):
+
+        return self.client.post(
+            reverse(name, args=args),
+            json.dumps(data),
+            content_type="application/json",
+        )
+
+    def test_stale_version_is_refused_with_409(self):
+
+        pk = self.installation.pk
+
+        response = self.post("update_entry", {"field": "status", "value": "Completed", "version": 0}, pk)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["version"], 1)
+
+        response = self.post("update_entry", {"field": "status", "value": "Ongoing", "version": 0}, pk)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["version"], 1)
+        self.assertTrue(response.json()["conflict"])
+
+        response = self.post("f2_tb_save", {"id": pk, "status": "Ongoing", "version": 0})
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Installation.objects.get(pk=pk).status, "Completed")
+
+    def test_row_save_keeps_omitted_fields(self):
+
+        Installation.objects.filter(pk=self.installation.pk).update(abd_number="ABD-1")
+
+        response = self.post("f2_tb_save", {"id": self.installation.pk, "status": "Completed"})
+
+        self.assertTrue(response.json()["success"])
+
+        stored = Installation.objects.get(pk=self.installation.pk)
+        self.assertEqual((stored.status, stored.abd_number), ("Completed", "ABD-1"))
+
+    def test_row_save_refuses_bad_bodies_with_400(self):
+
+        for body in ("{not json", "[1, 2]", '"text"'):
+
+            response = self.client.post(reverse("f2_tb_save"), body, content_type="application/json")
+
+            self.assertEqual(response.status_code, 400, body)
+            self.assertFalse(response.json()["success"], body)
+
+    def test_batch_edits(self):
+
+        pk = self.installation.pk
+
+        results = apply_edits([
+            {"id": pk, "field": "status", "value": "Completed", "version": 0},
+            {"id": pk, "field": "abd_number", "value": "ABD-1", "version": 0},
+            {"id": pk, "field": "status", "value": "Done", "version": 0},
+            {"id": pk, "field": "unit", "value": "U2"},
+            {"id": pk + 1, "field": "status", "value": "Done"},
+        ])
+
+        self.assertEqual([result["success"] for result in results], [True, True, True, False, False])
+        self.assertEqual(results[0]["value"], "Done")
+        self.assertEqual({result.get("version") for result in results[:3]}, {1})
+
+        stored = Installation.objects.get(pk=pk)
+        self.assertEqual((stored.status, stored.abd_number, stored.version), ("Done", "ABD-1", 1))
+
+        results = apply_edits([{"id": pk, "field": "status", "value": "Ongoing", "version": 0}])
+
+        self.assertTrue(results[0]["conflict"])
+        self.assertEqual(verify_counters("installation"), [])
+
+    def test_batch_over_max_edits_is_refused(self):
+
+        edits = [
+            {"id": self.installation.pk, "field": "abd_number", "value": str(number)}
+            for number in range(3)
+        ]
+
+        with mock.patch("installation.views.MAX_EDITS", 2):
+
+            response = self.post("update_entries", {"edits": edits})
+
+            self.assertEqual(response.json(), {"success": False, "error": "At most 2 edits per request"})
+            self.assertEqual(Installation.objects.get().abd_number, "")
+
+            response = self.post("update_entries", {"edits": edits[:2]})
+
+            self.assertTrue(response.json()["success"])
+            self.assertEqual(Installation.objects.get().abd_number, "1")
+
+
+# ================= CONDITIONAL GET =================
+class ConditionalPageTests(TestCase):
+
+    def setUp(self):
+
+        self.client.force_login(make_user())
+        self.installation = make_installation("MS1")
+        self.url = reverse("installation_list")
+
+    def test_unchanged_page_is_304(self):
+
+        first = self.client.get(self.url)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertIn("ETag", first)
+        self.assertIn("no-cache", first["Cache-Control"])
+
+        again = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+
+        self.assertEqual(again.status_code, 304)
+
+        fragment = self.client.get(
+            self.url,
+            HTTP_IF_NONE_MATCH=first["ETag"],
+            HTTP_X_REQUESTED_WITH="XMLHttpRequest",
+        )
+
+        self.assertEqual(fragment.status_code, 200)
+
+    def test_writes_change_the_etag(self):
+
+        etag = self.client.get(self.url)["ETag"]
+
+        self.installation.status = "Completed"
+        self.installation.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+        etag = response["ETag"]
+        make_installation("MS2").delete()
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.installation.delete()
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+# ================= QUERY BUDGET =================
+class QueryBudgetTests(TestCase):
+
+    def setUp(self):
+
+        self.client.force_login(make_user())
+        self.url = reverse("installation_list")
+
+    @override_settings(DEBUG=True)
+    def test_debug_adds_query_headers(self):
+
+        response = self.client.get(self.url)
+
+        self.assertGreater(int(response["X-Query-Count"]), 0)
+        self.assertGreaterEqual(float(response["X-Query-Time"]), 0)
+        self.assertEqual(response["X-Query-Budget"], "15")
+        self.assertGreaterEqual(int(response["X-Query-Repeats"]), 1)
+
+    @override_settings(DEBUG=True, QUERY_BUDGETS={"installation_list": 1})
+    def test_over_budget_is_logged(self):
+
+        with self.assertLogs("common.queries", "WARNING") as logs:
+            response = self.client.get(self.url)
+
+        self.assertEqual(response["X-Query-Budget"], "1")
+        self.assertIn("installation_list ran", logs.output[0])
+        self.assertIn("(budget 1)", logs.output[0])
+
+    def test_no_headers_without_debug(self):
+
+        response = self.client.get(self.url)
+
+        self.assertNotIn("X-Query-Count", response)
+
+
+# ================= FACILITY CARDS =================
+class FacilityCardTests(TestCase):
+
+    def setUp(self):
+
+        self.client.force_login(make_user())
+        self.installation = make_installation("MS1")
+        self.neighbour = make_installation("MS2", facility="FAC2")
+
+    def card(self, facility="FAC1"):
+
+        response = self.client.get(reverse("facility_card", args=["systems"]), {"facility": facility})
+
+        return response.content.decode()
+
+    def test_card_changes_when_the_write_commits(self):
+
+        self.assertIn("bg-primary", self.card())
+
+        with self.captureOnCommitCallbacks(execute=True):
+
+            self.installation.status = "Completed"
+            self.installation.save()
+
+            # uncommitted: other workers still see the old rows
+            self.assertIn("bg-primary", self.card())
+
+        self.assertIn("bg-success", self.card())
+
+    def test_other_facilities_keep_their_cards(self):
+
+        self.assertIn("bg-primary", self.card())
+
+        # written behind the signals' back, so only a re-render shows it
+        Installation.objects.filter(pk=self.installation.pk).update(status="Completed")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.neighbour.status = "Completed"
+            self.neighbour.save()
+
+        self.assertIn("bg-primary", self.card())
+        self.assertIn("bg-success", self.card("FAC2"))
+
+
+# ================= LIVE EVENTS =================
+class LiveEventsTests(TestCase):
+
+    def setUp(self):
+
+        self.client.force_login(make_user())
+
+    def test_refused_unless_served_over_asgi(self):
+
+        response = self.client.get(reverse("live_events"))
+
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(response.streaming)
+
+    def test_pages_open_the_stream_only_over_asgi(self):
+
+        pages = ["installation_list", "p4_display_list", "p8_display_list", "p9_display_list", "f2_tb"]
+
+        for name in pages:
+            self.assertNotContains(self.client.get(reverse(name)), "setupLiveRows(", msg_prefix=name)
+
+        with override_settings(SERVED_OVER_ASGI=True):
+            for name in pages:
+                self.assertContains(self.client.get(reverse(name)), "setupLiveRows(", msg_prefix=name)
+
+    def test_writes_publish_nothing_unless_served_over_asgi(self):
+
+        installation = make_installation("MS1")
+
+        with self.captureOnCommitCallbacks() as callbacks, self.assertNumQueries(0):
+            publish("installation", "reload")
+            publish_rows("installation", [installation.pk])
+
+        self.assertEqual(callbacks, [])
+
+        with CaptureQueriesContext(connection) as queries:
+            installation.status = "Completed"
+            installation.save()
+
+        self.assertFalse([query for query in queries if "pg_notify" in query["sql"]])
+
+        # Postgres sends NOTIFY right away, the others deliver on commit
+        notify = connection.vendor == "postgresql"
+
+        with override_settings(SERVED_OVER_ASGI=True), self.captureOnCommitCallbacks() as callbacks:
+            with self.assertNumQueries(3 if notify else 1):
+                publish("installation", "reload")
+                publish_rows("installation", [installation.pk])
+
+        self.assertEqual(len(callbacks), 0 if notify else 2)
+
+
+# ================= SEARCH ENDPOINTS =================
+class SearchEndpointTests(TestCase):
+
+    def setUp(self):
+
+        self.client.force_login(make_user())
+
+        make_installation("MS1", system="CYA")
+        make_installation("MS10", system="CYB")
+        make_p4("P4-1")
+
+    def test_sync_under_wsgi(self):
+
+        for view in (views.f2_tb_search, views.search_ms, views.search_p4, views.search_p8):
+            self.assertFalse(iscoroutinefunction(view), view.__name__)
+
+        response = self.client.get(reverse("search_ms"), {"q": "ms1"})
+
+        self.assertEqual([row["ms_id"] for row in response.json()], ["MS1", "MS10"])
+        self.assertEqual(self.client.get(reverse("search_p4"), {"q": "p4"}).json()[0]["p4_id"], "P4-1")
+
+    def test_async_index_endpoints_over_asgi(self):
+
+        with override_settings(SERVED_OVER_ASGI=True):
+            view = views.index_search_view("ms")
+
+        self.assertTrue(iscoroutinefunction(view))
+        self.assertEqual(view.__name__, "search_ms")
+
+
+# ================= SEARCH INDEX CHECK =================
+class SearchIndexCheckTests(TestCase):
+
+    def test_migrated_database_passes(self):
+
+        if connection.vendor == "postgresql" and settings.SEARCH_TRIGRAM_OPTIONAL:
+            self.skipTest("migrated without pg_trgm")
+
+        self.assertEqual(check_search_index(databases=["default"]), [])
+
+    def test_missing_index_is_reported(self):
+
+        with mock.patch("installation.checks.TRIGRAM_INDEXES", ("missing_trgm",)), \
+                mock.patch("installation.checks.FTS_TABLE", "missing_search"):
+            errors = check_search_index(databases=["default"])
+
+        self.assertEqual(
+            [error.id for error in errors],
+            ["installation.W001" if connection.vendor == "postgresql" else "installation.W002"],
+        )
+
+
+# ================= LABEL COLUMNS =================
+class LabelColumnTests(TestCase):
+
+    def stored(self, installation, column):
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT {column} FROM installation_installation WHERE id = %s",
+                [installation.pk]
+            )
+            return cursor.fetchone()[0]
+
+    def test_texts_are_stored_as_shared_codes(self):
+
+        first = make_installation("MS1")
+        second = make_installation("MS2")
+
+        code = self.stored(first, "facility")
+
+        self.assertIsInstance(code, int)
+        self.assertEqual(self.stored(second, "facility"), code)
+        self.assertEqual(InstallationLabel.objects.get(pk=code).name, "FAC1")
+        self.assertEqual(InstallationLabel.objects.filter(column="facility").count(), 1)
+
+        self.assertEqual(Installation.objects.get(pk=first.pk).facility, "FAC1")
+        self.assertEqual(
+            list(Installation.objects.values_list("facility", "system").distinct()),
+            [("FAC1", "CYA")],
+        )
+
+    def test_filters_match_the_names(self):
+
+        make_installation("MS1", type="TB")
+        make_installation("MS2", facility="OTHER", type="MB")
+
+        self.assertEqual(Installation.objects.get(facility="FAC1").ms_id, "MS1")
+        self.assertEqual(Installation.objects.filter(facility__in=["FAC1", "OTHER"]).count(), 2)
+        self.assertEqual(Installation.objects.get(type__iexact="tb").ms_id, "MS1")
+        self.assertEqual(Installation.objects.get(facility__icontains="th").ms_id, "MS2")
+
+        # unknown names match nothing and store no label
+        self.assertFalse(Installation.objects.filter(facility="NOPE").exists())
+        self.assertFalse(InstallationLabel.objects.filter(name="NOPE").exists())
+
+    def test_updates_store_new_labels(self):
+
+        installation = make_installation("MS1")
+
+        Installation.objects.filter(pk=installation.pk).update(status="Blocked")
+
+        installation.refresh_from_db()
+        installation.facility = "FAC9"
+
+        Installation.objects.bulk_update([installation], ["facility"])
+
+        installation.refresh_from_db()
+
+        self.assertEqual((installation.status, installation.facility), ("Blocked", "FAC9"))
+
+    def test_rolled_back_labels_are_forgotten(self):
+
+        try:
+            with transaction.atomic():
+                make_installation("MS1", facility="GONE")
+                raise DatabaseError
+        except DatabaseError:
+            pass
+
+        self.assertFalse(InstallationLabel.objects.filter(name="GONE").exists())
+
+        # stored again rather than reusing the rolled back code
+        installation = make_installation("MS2", facility="GONE")
+
+        self.assertEqual(
+            InstallationLabel.objects.get(pk=self.stored(installation, "facility")).name,
+            "GONE",
+        )
+
+    def test_dashboards_sort_by_name(self):
+
+        # codes follow first use, so the names sort differently
+        make_installation("MS1", facility="B", system="CYB")
+        make_installation("MS2", facility="A", system="CYA")
+        make_installation("MS3", facility="A", system="ACY")
+
+        self.assertEqual(
+            views.installation_facility_counts(Installation.objects.all()),
+            [("A", 2), ("B", 1)],
+        )
+        self.assertEqual(
+            [(row["facility"], row["system"]) for row in installation_progress()],
+            [("A", "ACY"), ("A", "CYA"), ("B", "CYB")],
+        )
+        self.assertEqual(progress_rows(), installation_progress())
+        self.assertEqual(
+            [card["system"] for card in views.facility_systems()["A"]],
+            ["ACY", "CYA"],
+        )
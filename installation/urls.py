@@ -39,6 +39,15 @@ urlpatterns = [
         name='delete_installation'
     ),
 
+    # =========================
+    # EXPORT (installations / p4 / p8 / p9, csv / xlsx)
+    # =========================
+    path(
+        'export/<slug:dataset>/<slug:fmt>/',
+        views.export_data,
+        name='export_data'
+    ),
+
     # =========================
     # INLINE UPDATE (AJAX FIELD UPDATE)
     # =========================
@@ -48,6 +57,24 @@ urlpatterns = [
         name='update_entry'
     ),
 
+    # =========================
+    # BATCH INLINE UPDATE (QUEUED FIELD UPDATES)
+    # =========================
+    path(
+        'update-entries/',
+        views.update_entries,
+        name='update_entries'
+    ),
+
+    # =========================
+    # LIVE ROW EVENTS (ASGI)
+    # =========================
+    path(
+        'live/',
+        views.live_events,
+        name='live_events'
+    ),
+
     # =========================
     # F2 TB PAGE (SEARCH + FORM UI)
     # =========================
@@ -100,6 +127,8 @@ urlpatterns = [
     path('p9_facility_dashboard/',views.p9_facility_dashboard,name='p9_facility_dashboard'),
 
     path('facility_dashboard_all/', views.facility_dashboard_all, name='facility_dashboard_all'),
+    path('facility_dashboard_all/json/', views.facility_dashboard_all_json, name='facility_dashboard_all_json'),
+    path('facility_card/<slug:dashboard>/', views.facility_card, name='facility_card'),
     path("p4/dashboard/", views.p4_dashboard, name="p4_dashboard"),
     path("p4/dashboard/filter/", views.p4_dashboard_filter, name="p4_dashboard_filter"),
 
@@ -108,4 +137,9 @@ urlpatterns = [
 
     path("p9/dashboard/", views.p9_dashboard, name="p9_dashboard"),
     path("p9/dashboard/filter/", views.p9_dashboard_filter, name="p9_dashboard_filter"),
+
+    path("ms/<int:pk>/ancestors/", views.installation_ancestors, name="installation_ancestors"),
+    path("p4/<int:id>/installations/", views.milestone_installations, {"level": "p4"}, name="p4_installations"),
+    path("p8/<int:id>/installations/", views.milestone_installations, {"level": "p8"}, name="p8_installations"),
+    path("p9/<int:id>/installations/", views.milestone_installations, {"level": "p9"}, name="p9_installations"),
 ]
\ No newline at end of file
@@ -1,44 +1,175 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
 from django.core.paginator import Paginator
 from .models import Installation
 from .forms import InstallationForm
+import functools
 import json
 from django.contrib.auth.decorators import login_required
 from common.decorators import role_required
 from django.core.paginator import Paginator
-from django.db.models import Q
 from django.contrib import messages
+from .search import search_installations, ranked_installations, filter_milestones, SUGGEST_LIMIT
+from .autocomplete import INDEXES
+from .pagination import cursor_paginate
+from .edits import apply_edits, save_installation, EDITABLE_FIELDS, MAX_EDITS
+from .export import EXPORTS, FORMATS, export_response
+from .freshness import conditional_page
+from .live import LIVE_FIELDS, event_stream, live_enabled
+
+# keyset orderings offered by ?sort= on the installation list; each one
+# ends with the primary key so the cursor is unambiguous. facility and
+# status order by label code: alphabetical for the values migration 0019
+# encoded, in order of first use for later ones
+INSTALLATION_SORTS = {
+    'id': ('id',),
+    '-id': ('-id',),
+    'ms_id': ('ms_id', 'id'),
+    'facility': ('facility', 'system', 'id'),
+    'status': ('status', 'id'),
+}
+
+def installation_filters(request):
+    """
+    ``(search, sort, queryset, ordering)`` for the ?search= and ?sort=
+    parameters of the installation list. Search hits come best match
+    first (exact, prefix, shortest), ties in the ?sort= order.
+    """
+
+    search = request.GET.get('search', '')
+    sort = request.GET.get('sort', 'id')
+
+    if sort not in INSTALLATION_SORTS:
+        sort = 'id'
+
+    if search:
+        return (
+            search,
+            sort,
+            ranked_installations(search, "ms_id"),
+            ('relevance', 'match_length', *INSTALLATION_SORTS[sort]),
+        )
+
+    return search, sort, Installation.objects.all(), INSTALLATION_SORTS[sort]
+
+
+def milestone_filters(request, kind):
+    """
+    ``(search, completed, queryset)`` for the ?search= and ?completed=
+    parameters of a P4/P8/P9 list.
+    """
+
+    search = request.GET.get('search', '').strip()
+    completed = request.GET.get('completed', '')
+
+    return search, completed, filter_milestones(kind, search, completed)
+
+
+def list_response(request, page_template, rows_template, context):
+    """
+    The whole list page, or only its rows and pagination when the filter
+    script asks for them (``X-Requested-With: XMLHttpRequest``).
+    """
+
+    partial = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+
+    context = {**context, 'live_events': live_enabled()}
+
+    response = render(request, rows_template if partial else page_template, context)
+
+    # the page and its fragment share a URL; keep them apart in caches
+    patch_vary_headers(response, ['X-Requested-With'])
+
+    return response
+
 
 # =========================
 # INSTALLATION LIST (PAGINATION)
 # =========================
 @login_required
 @role_required(['admin', 'manager', 'staff', 'viewer'])
+@conditional_page(("installation",))
 
 
 def installation_list(request):
-    search = request.GET.get('search', '')
-
-    entries = Installation.objects.all()
-
-    if search:
-        entries = entries.filter(
-            Q(ms_id__icontains=search)
-        )
+    search, sort, entries, ordering = installation_filters(request)
 
-    paginator = Paginator(entries, 50)
-    page_number = request.GET.get('page')
-    entries = paginator.get_page(page_number)
+    entries = cursor_paginate(request, entries, ordering)
 
-    return render(
+    return list_response(
         request,
         'installation/installation_list.html',
+        'installation/installation_rows.html',
         {
             'entries': entries,
             'search': search,
+            'sort': sort,
         }
     )
+# =========================
+# EXPORT (STREAMING CSV / XLSX)
+# =========================
+@login_required
+@role_required(['admin', 'manager', 'staff', 'viewer'])
+def export_data(request, dataset, fmt):
+
+    if dataset not in EXPORTS or fmt not in FORMATS:
+        raise Http404("Unknown export")
+
+    queryset = None
+
+    if dataset == "installations":
+        # same rows and order as the installation list
+        search, sort, queryset, ordering = installation_filters(request)
+        queryset = queryset.order_by(*ordering)
+
+    else:
+        # same rows as the filtered P4/P8/P9 list
+        search, completed, queryset = milestone_filters(request, dataset)
+        queryset = queryset.order_by('-id')
+
+    return export_response(dataset, fmt, queryset)
+
+
+# =========================
+# LIVE ROW EVENTS (SERVER-SENT EVENTS)
+# =========================
+async def live_events(request):
+    """
+    Stream of row change events of the ?kinds= tables (default: all).
+    Served through forhad/asgi.py; the response stays open.
+    """
+
+    # under WSGI the stream would hold a worker thread for good; a 204
+    # tells an EventSource to stop reconnecting
+    if not live_enabled():
+        return HttpResponse(status=204)
+
+    user = await request.auser()
+
+    # an EventSource cannot follow the login redirect; refuse instead
+    if getattr(user, 'role', None) not in ['admin', 'manager', 'staff', 'viewer']:
+        return HttpResponseForbidden()
+
+    kinds = {
+        kind for kind in request.GET.get('kinds', '').split(',')
+        if kind in LIVE_FIELDS
+    } or set(LIVE_FIELDS)
+
+    response = StreamingHttpResponse(
+        event_stream(kinds),
+        content_type='text/event-stream'
+    )
+
+    response['Cache-Control'] = 'no-cache'
+    # nginx would otherwise hold the events back in its buffer
+    response['X-Accel-Buffering'] = 'no'
+
+    return response
+
+
 # =========================
 # ADD
 # =========================
@@ -106,50 +237,80 @@ def update_entry(request, pk):
 
         try:
             data = json.loads(request.body)
+        except ValueError:
+            data = None
 
-            field = data.get("field")
-            value = data.get("value")
-
-            obj = get_object_or_404(Installation, pk=pk)
-
-            allowed_fields = [
-                "status",
-                "abd_number",
-                "start_date",
-                "end_date"
-            ]
-
-            if field not in allowed_fields:
-                return JsonResponse({
-                    "success": False,
-                    "error": "Invalid field"
-                })
-
-            # handle empty dates safely
-            if field in ["start_date", "end_date"] and not value:
-                value = None
-
-            setattr(obj, field, value)
-            obj.save()
-
+        if not isinstance(data, dict):
             return JsonResponse({
-                "success": True,
-                "field": field,
-                "value": value
+                "success": False,
+                "error": "Invalid request"
             })
 
-        except Exception as e:
+        field = data.get("field")
+        value = data.get("value")
+
+        if field not in EDITABLE_FIELDS:
             return JsonResponse({
                 "success": False,
-                "error": str(e)
+                "error": "Invalid field"
             })
 
+        result = save_installation(pk, {field: value}, data.get("version"))
+
+        if not result["success"]:
+            return JsonResponse(result, status=409 if result.get("conflict") else 200)
+
+        return JsonResponse({
+            "success": True,
+            "field": field,
+            "value": value,
+            "version": result["version"]
+        })
+
     return JsonResponse({
         "success": False,
         "error": "Invalid request"
     })
 
 
+# =========================
+# BATCH INLINE UPDATE (AJAX)
+# =========================
+@login_required
+@role_required(['admin', 'manager', 'staff', 'viewer'])
+def update_entries(request):
+
+    if request.method != "POST":
+        return JsonResponse({
+            "success": False,
+            "error": "Invalid request"
+        })
+
+    try:
+        edits = json.loads(request.body).get("edits")
+    except (ValueError, AttributeError):
+        edits = None
+
+    if not isinstance(edits, list):
+        return JsonResponse({
+            "success": False,
+            "error": "Expected a list of edits"
+        })
+
+    if len(edits) > MAX_EDITS:
+        return JsonResponse({
+            "success": False,
+            "error": f"At most {MAX_EDITS} edits per request"
+        })
+
+    results = apply_edits(edits)
+
+    return JsonResponse({
+        "success": all(result["success"] for result in results),
+        "results": results
+    })
+
+
 # =========================
 # F2 TB PAGE (SEARCH BY ms_id_full)
 # =========================
@@ -164,12 +325,12 @@ def f2_tb(request):
 
     if ms_id_full:
 
-        entries = Installation.objects.filter(
-            ms_id_full__icontains=ms_id_full
-        ).order_by('-id')
+        entries = list(
+            search_installations(ms_id_full, "ms_id_full")
+        )
 
-        if entries.exists():
-            message = f"{entries.count()} record(s) found"
+        if entries:
+            message = f"{len(entries)} record(s) found"
         else:
             message = "No data found"
 
@@ -177,7 +338,8 @@ def f2_tb(request):
 
         "ms_id_full": ms_id_full,
         "entries": entries,
-        "message": message
+        "message": message,
+        "live_events": live_enabled()
 
     })
 
@@ -191,38 +353,44 @@ def f2_tb_save(request):
 
     if request.method == "POST":
 
-        data = json.loads(request.body)
-
-        obj = Installation.objects.filter(
-            id=data.get("id")
-        ).first()
-
-        if not obj:
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            data = None
 
+        if not isinstance(data, dict):
             return JsonResponse({
                 "success": False,
-                "message": "Record not found"
-            })
+                "message": "Invalid request"
+            }, status=400)
 
         # ================= UPDATE ONLY THIS UNIQUE ROW =================
-        obj.status = data.get("status")
-
-        obj.abd_number = data.get("abd_number")
-
-        obj.start_date = (
-            data.get("start_date") or None
+        # fields left out of the payload keep their stored value
+        result = save_installation(
+            data.get("id"),
+            {field: data[field] for field in EDITABLE_FIELDS if field in data},
+            data.get("version")
         )
 
-        obj.end_date = (
-            data.get("end_date") or None
-        )
+        if not result["success"]:
 
-        obj.save()
+            return JsonResponse({
+                "success": False,
+                "conflict": result.get("conflict", False),
+                "version": result.get("version"),
+                "message": result["error"]
+            }, status=409 if result.get("conflict") else 200)
+
+        if result["changed"]:
+            message = "Updated " + ", ".join(result["changed"])
+        else:
+            message = "Nothing changed"
 
         return JsonResponse({
 
             "success": True,
-            "message": f"{obj.ms_id_full} updated successfully"
+            "version": result["version"],
+            "message": message
 
         })
 
@@ -251,11 +419,11 @@ def f2_tb_search(request):
             "results": []
         })
 
-    qs = Installation.objects.filter(
-
-        ms_id_full__icontains=ms_id_full
-
-    ).order_by('-id')
+    qs = search_installations(
+        ms_id_full,
+        "ms_id_full",
+        limit=SUGGEST_LIMIT
+    )
 
     results = []
 
@@ -298,42 +466,34 @@ from django.shortcuts import render
 from django.db.models import Count
 from django.db.models.functions import ExtractYear
 from .models import Installation
+from .stats import installation_stats
 
 @login_required
 @role_required(['admin', 'manager', 'staff', 'viewer'])
+@conditional_page(("installation",))
 def dashboard(request):
 
-    qs = Installation.objects.all()
-
     # =========================
-    # TOTAL COUNTS (UNIQUE)
+    # SINGLE PASS + CACHED
     # =========================
-    total_facility = qs.values('facility').distinct().count()
-    total_system = qs.values('system').distinct().count()
-    total_ms_id = qs.values('ms_id').distinct().count()
-    total_saw_program = qs.values('saw_program').distinct().count()
+    stats = installation_stats()
+
+    total_facility = stats["totals"]["facility"]
+    total_system = stats["totals"]["system"]
+    total_ms_id = stats["totals"]["ms_id"]
+    total_saw_program = stats["totals"]["saw_program"]
 
     # =========================
     # STATUS PIE CHART
     # =========================
-    status_qs = qs.values('status').annotate(total=Count('id'))
-
-    status_labels = [i['status'] for i in status_qs]
-    status_values = [i['total'] for i in status_qs]
+    status_labels = [status for status, total in stats["status"]]
+    status_values = [total for status, total in stats["status"]]
 
     # =========================
     # YEARLY COMPLETED (END DATE)
     # =========================
-    yearly_qs = (
-        qs.filter(status="Completed", end_date__isnull=False)
-        .annotate(year=ExtractYear('end_date'))
-        .values('year')
-        .annotate(total=Count('id'))
-        .order_by('year')
-    )
-
-    year_labels = [str(i['year']) for i in yearly_qs]
-    year_values = [i['total'] for i in yearly_qs]
+    year_labels = [str(year) for year, total in stats["yearly"]]
+    year_values = [total for year, total in stats["yearly"]]
 
     return render(request, "installation/dashboard.html", {
         "total_facility": total_facility,
@@ -366,12 +526,12 @@ def dashboard_filter(request):
 
         qs = (
             Installation.objects
-            .values('facility')
+            .values_list('facility', flat=True)
             .distinct()
-            .order_by('facility')
+            .order_by()
         )
 
-        records = [{'name': r['facility']} for r in qs]
+        records = [{'name': name} for name in sorted(qs)]
 
     elif filter_type == "system":
 
@@ -379,12 +539,12 @@ def dashboard_filter(request):
 
         qs = (
             Installation.objects
-            .values('system')
+            .values_list('system', flat=True)
             .distinct()
-            .order_by('system')
+            .order_by()
         )
 
-        records = [{'name': r['system']} for r in qs]
+        records = [{'name': name} for name in sorted(qs)]
 
     elif filter_type == "ms":
 
@@ -405,19 +565,19 @@ def dashboard_filter(request):
 
         qs = (
             Installation.objects
-            .values('saw_program')
+            .values_list('saw_program', flat=True)
             .distinct()
-            .order_by('saw_program')
+            .order_by()
         )
 
-        records = [{'name': r['saw_program']} for r in qs]
+        records = [{'name': name} for name in sorted(qs)]
 
     # PIE CHART CLICK
     if chart == "status":
 
         title = f"Status : {value}"
 
-        records = (
+        records = sorted(
             Installation.objects
             .filter(status=value)
             .values(
@@ -425,8 +585,8 @@ def dashboard_filter(request):
                 'system',
                 'ms_id',
                 'status'
-            )
-            .order_by('facility')
+            ),
+            key=itemgetter('facility')
         )
 
     # BAR CHART CLICK
@@ -461,23 +621,39 @@ def dashboard_filter(request):
 # views.py
 
 from collections import defaultdict
+from operator import attrgetter, itemgetter
 from django.shortcuts import render
 from .models import Installation
+from .caching import CACHE_TIMEOUT, facility_versions
 
-@login_required
-@role_required(['admin', 'manager', 'staff', 'viewer'])
-def facility_dashboard(request):
+# tables each facility dashboard and its cards are built from
+FACILITY_KINDS = {
+    "systems": ("installation",),
+    "all": ("installation", "p4", "p8", "p9"),
+    "p4": ("p4", "installation"),
+    "p8": ("p8", "p4", "installation"),
+    "p9": ("p9", "p8", "p4", "installation"),
+}
 
-    selected_type = request.GET.get("type", "").strip()
 
-    data = Installation.objects.all().order_by('facility', 'system')
+def facility_systems(selected_type="", facility=None):
+    """
+    ``{facility: [system card, ...]}`` for the facility dashboard,
+    optionally for one ``facility`` only.
+    """
+
+    data = Installation.objects.all()
 
     if selected_type:
         data = data.filter(type=selected_type)
 
+    if facility is not None:
+        data = data.filter(facility=facility)
+
     facility_data = defaultdict(list)
 
-    for item in data:
+    # facility and system are label codes in the table, so sorted by name here
+    for item in sorted(data, key=attrgetter('facility', 'system')):
 
         if item.status.lower() == "completed":
             color = "success"
@@ -492,8 +668,37 @@ def facility_dashboard(request):
             'abd_number': item.abd_number,
         })
 
+    return facility_data
+
+
+def installation_facility_counts(installations):
+    """
+    ``[(facility, installations), ...]`` in facility order, for the
+    headers of the facility dashboards.
+    """
+
+    return sorted(
+        installations.values_list('facility').annotate(
+            total=Count('id')
+        ).order_by()
+    )
+
+
+@login_required
+@role_required(['admin', 'manager', 'staff', 'viewer'])
+@conditional_page(FACILITY_KINDS["systems"])
+def facility_dashboard(request):
+
+    selected_type = request.GET.get("type", "").strip()
+
+    data = Installation.objects.all()
+
+    if selected_type:
+        data = data.filter(type=selected_type)
+
+    # only the headers; the cards are loaded by facility_card
     context = {
-        'facility_data': dict(facility_data),
+        'facilities': installation_facility_counts(data),
         'selected_type': selected_type,
     }
 
@@ -576,40 +781,61 @@ def p4_create(request):
     # ================= DISPLAY =================
 @login_required
 @role_required(['admin', 'manager', 'staff', 'viewer'])
+@conditional_page(("p4", "installation"))
 def p4_list(request):
 
-    data = P4ID.objects.prefetch_related(
-        'ms_ids'
-    ).order_by('-id')
+    search, completed, rows = milestone_filters(request, 'p4')
+
+    data = cursor_paginate(
+        request,
+        rows.prefetch_related('ms_ids'),
+        ('-id',)
+    )
 
-    return render(request,
+    return list_response(request,
                   'installation/p4_display_list.html',
+                  'installation/p4_display_rows.html',
                   {
-                      'data': data
+                      'data': data,
+                      'search': search,
+                      'completed': completed,
                   })
 
 
 # ================= SEARCH =================
-@login_required
-@role_required(['admin', 'manager', 'staff', 'viewer'])
-def search_ms(request):
+def index_search_view(name):
+    """
+    Typeahead endpoint over ``INDEXES[name]``. Async when served over
+    ASGI, so a current index answers on the event loop; sync under WSGI,
+    where an async view only adds an event loop per request.
+    """
 
-    q = request.GET.get('q', '').strip()
+    if getattr(settings, 'SERVED_OVER_ASGI', False):
 
-    results = Installation.objects.filter(
-        ms_id__icontains=q
-    )[:10]
+        async def view(request):
 
-    data = [
-        {
-            "id": item.id,
-            "ms_id": item.ms_id,
-            "system": item.system
-        }
-        for item in results
-    ]
+            q = request.GET.get('q', '').strip()
 
-    return JsonResponse(data, safe=False)
+            data = await INDEXES[name].asearch(q, SUGGEST_LIMIT)
+
+            return JsonResponse(data, safe=False)
+
+    else:
+
+        def view(request):
+
+            q = request.GET.get('q', '').strip()
+
+            data = INDEXES[name].search(q, SUGGEST_LIMIT)
+
+            return JsonResponse(data, safe=False)
+
+    view.__name__ = view.__qualname__ = f'search_{name}'
+
+    return login_required(role_required(['admin', 'manager', 'staff', 'viewer'])(view))
+
+
+search_ms = index_search_view('ms')
 
 
 
@@ -787,41 +1013,33 @@ def p8_create(request):
 
 @login_required
 @role_required(['admin', 'manager', 'staff', 'viewer'])
+@conditional_page(("p8", "p4"))
 # ================= DISPLAY =================
 def p8_list(request):
 
-    data = P8ID.objects.prefetch_related(
-        'p4_ids'
-    ).order_by('-id')
+    search, completed, rows = milestone_filters(request, 'p8')
 
-    return render(
+    data = cursor_paginate(
+        request,
+        rows.prefetch_related('p4_ids'),
+        ('-id',)
+    )
+
+    return list_response(
         request,
         'installation/p8_display_list.html',
+        'installation/p8_display_rows.html',
         {
-            'data': data
+            'data': data,
+            'search': search,
+            'completed': completed,
         }
     )
 
-@login_required
-@role_required(['admin', 'manager', 'staff', 'viewer'])
 # ================= SEARCH P4 =================
-def search_p4(request):
-
-    q = request.GET.get('q', '').strip()
+search_p4 = index_search_view('p4')
 
-    results = P4ID.objects.filter(
-        p4_id__icontains=q
-    )[:10]
 
-    data = [
-        {
-            "id": item.id,
-            "p4_id": item.p4_id
-        }
-        for item in results
-    ]
-
-    return JsonResponse(data, safe=False)
 @login_required
 @role_required(['admin', 'manager', 'staff', 'viewer'])
 def p8_edit(request, id):
@@ -980,41 +1198,31 @@ def p9_create(request):
 
 @login_required
 @role_required(['admin', 'manager', 'staff', 'viewer'])
+@conditional_page(("p9", "p8"))
 # ================= DISPLAY =================
 def p9_list(request):
 
-    data = P9ID.objects.prefetch_related(
-        'p8_ids'
-    ).order_by('-id')
+    search, completed, rows = milestone_filters(request, 'p9')
 
-    return render(
+    data = cursor_paginate(
+        request,
+        rows.prefetch_related('p8_ids'),
+        ('-id',)
+    )
+
+    return list_response(
         request,
         'installation/p9_display_list.html',
+        'installation/p9_display_rows.html',
         {
-            'data': data
+            'data': data,
+            'search': search,
+            'completed': completed,
         }
     )
 
-@login_required
-@role_required(['admin', 'manager', 'staff', 'viewer'])
 # ================= SEARCH P8 =================
-def search_p8(request):
-
-    q = request.GET.get('q', '').strip()
-
-    results = P8ID.objects.filter(
-        p8_id__icontains=q
-    )[:10]
-
-    data = [
-        {
-            "id": item.id,
-            "p8_id": item.p8_id
-        }
-        for item in results
-    ]
-
-    return JsonResponse(data, safe=False)
+search_p8 = index_search_view('p8')
 
 
 # ================= EDIT =================
@@ -1111,98 +1319,15 @@ from .models import (
     P8ID,
     P9ID
 )
+from .progress import progress_rows
+from .rollup import facility_rollup
 
 @login_required
 @role_required(['admin', 'manager', 'staff', 'viewer'])
+@conditional_page(FACILITY_KINDS["all"])
 def facility_dashboard_all(request):
 
-    facility_data = {}
-
-    # ================= INSTALLATIONS =================
-    installations = Installation.objects.filter(
-        type='TB'
-    ).order_by(
-        'facility',
-        'system'
-    )
-
-    for ins in installations:
-
-        facility = ins.facility
-        system = ins.system
-
-        # ================= DEFAULT STATUS =================
-        f2_completed = False
-        p4_completed = False
-        p8_completed = False
-        p9_completed = False
-
-        # ================= F2 STATUS =================
-        if ins.status:
-
-            if ins.status.lower() in [
-                'complete',
-                'completed',
-                'done'
-            ]:
-
-                f2_completed = True
-
-        # ================= P4 =================
-        p4_queryset = ins.p4_entries.all()
-
-        if p4_queryset.filter(
-            completed=True
-        ).exists():
-
-            p4_completed = True
-
-        # ================= P8 =================
-        p8_queryset = P8ID.objects.filter(
-            p4_ids__in=p4_queryset,
-            completed=True
-        ).distinct()
-
-        if p8_queryset.exists():
-
-            p8_completed = True
-
-        # ================= P9 =================
-        p9_queryset = P9ID.objects.filter(
-            p8_ids__in=p8_queryset,
-            completed=True
-        ).distinct()
-
-        if p9_queryset.exists():
-
-            p9_completed = True
-
-        # ================= CREATE FACILITY =================
-        if facility not in facility_data:
-
-            facility_data[facility] = []
-
-        # ================= APPEND SYSTEM =================
-        facility_data[facility].append({
-
-            "system": system,
-
-            "completed": f2_completed,
-
-            "p4_completed": p4_completed,
-
-            "p8_completed": p8_completed,
-
-            "p9_completed": p9_completed,
-
-            "installation_id": ins.id,
-
-            "ms_id": ins.ms_id,
-
-            "ms_id_full": ins.ms_id_full,
-        })
-
-    # ================= RENDER =================
+    # ================= RENDER (HEADERS ONLY) =================
     return render(
 
         request,
@@ -1210,11 +1335,25 @@ def facility_dashboard_all(request):
         'installation/facility_dashboard_all.html',
 
         {
-            'facility_data': facility_data
+            'facilities': installation_facility_counts(
+                Installation.objects.filter(type='TB')
+            )
         }
     )
 
 
+@login_required
+@role_required(['admin', 'manager', 'staff', 'viewer'])
+@conditional_page(FACILITY_KINDS["all"])
+def facility_dashboard_all_json(request):
+
+    return JsonResponse({
+        "facility_data": facility_rollup(
+            progress_rows()
+        )
+    })
+
+
 from django.shortcuts import render
 from django.db.models import Count
 from django.db.models.functions import ExtractYear
@@ -1228,41 +1367,25 @@ from django.db.models.functions import ExtractYear
 
 from .models import P4ID
 
+from .stats import milestone_records, milestone_stats
+
 @login_required
 @role_required(['admin', 'manager', 'staff', 'viewer'])
+@conditional_page(("p4", "installation"))
 def p4_dashboard(request):
-    total_p4 = P4ID.objects.count()
-    completed_p4 = P4ID.objects.filter(completed=True).count()
-    pending_p4 = P4ID.objects.filter(completed=False).count()
-
-    total_ms = (
-        P4ID.objects
-        .values("ms_ids")
-        .exclude(ms_ids=None)
-        .distinct()
-        .count()
-    )
-
-    yearly = (
-        P4ID.objects
-        .filter(completed=True, end_date__isnull=False)
-        .annotate(year=ExtractYear("end_date"))
-        .values("year")
-        .annotate(total=Count("id"))
-        .order_by("year")
-    )
+    stats = milestone_stats("p4")
 
     status_labels = ["Completed", "Pending"]
-    status_values = [completed_p4, pending_p4]
+    status_values = [stats["completed"], stats["pending"]]
 
-    year_labels = [item["year"] for item in yearly]
-    year_values = [item["total"] for item in yearly]
+    year_labels = [year for year, total in stats["yearly"]]
+    year_values = [total for year, total in stats["yearly"]]
 
     return render(request, "installation/p4_dashboard.html", {
-        "total_p4": total_p4,
-        "completed_p4": completed_p4,
-        "pending_p4": pending_p4,
-        "total_ms": total_ms,
+        "total_p4": stats["total"],
+        "completed_p4": stats["completed"],
+        "pending_p4": stats["pending"],
+        "total_ms": stats["children"],
 
         "status_labels": json.dumps(status_labels),
         "status_values": json.dumps(status_values),
@@ -1271,306 +1394,198 @@ def p4_dashboard(request):
     })
 @login_required
 @role_required(['admin', 'manager', 'staff', 'viewer'])
+@conditional_page(("p8", "p4"))
 def p8_dashboard(request):
-    total_p8 = P8ID.objects.count()
-    completed_p8 = P8ID.objects.filter(completed=True).count()
-    pending_p8 = P8ID.objects.filter(completed=False).count()
-    total_p4 = P8ID.objects.values("p4_ids").distinct().count()
-
-    yearly = (
-        P8ID.objects
-        .filter(completed=True, end_date__isnull=False)
-        .annotate(year=ExtractYear("end_date"))
-        .values("year")
-        .annotate(total=Count("id"))
-        .order_by("year")
-    )
+    stats = milestone_stats("p8")
 
     return render(request, "installation/p8_dashboard.html", {
-        "total_p8": total_p8,
-        "completed_p8": completed_p8,
-        "pending_p8": pending_p8,
-        "total_p4": total_p4,
+        "total_p8": stats["total"],
+        "completed_p8": stats["completed"],
+        "pending_p8": stats["pending"],
+        "total_p4": stats["children"],
         "status_labels": ["Completed", "Pending"],
-        "status_values": [completed_p8, pending_p8],
-        "year_labels": [x["year"] for x in yearly],
-        "year_values": [x["total"] for x in yearly],
+        "status_values": [stats["completed"], stats["pending"]],
+        "year_labels": [year for year, total in stats["yearly"]],
+        "year_values": [total for year, total in stats["yearly"]],
     })
 
 @login_required
 @role_required(['admin', 'manager', 'staff', 'viewer'])
+@conditional_page(("p9", "p8"))
 def p9_dashboard(request):
-    total_p9 = P9ID.objects.count()
-    completed_p9 = P9ID.objects.filter(completed=True).count()
-    pending_p9 = P9ID.objects.filter(completed=False).count()
-    total_p8 = P9ID.objects.values("p8_ids").distinct().count()
-
-    yearly = (
-        P9ID.objects
-        .filter(completed=True, end_date__isnull=False)
-        .annotate(year=ExtractYear("end_date"))
-        .values("year")
-        .annotate(total=Count("id"))
-        .order_by("year")
-    )
+    stats = milestone_stats("p9")
 
     return render(request, "installation/p9_dashboard.html", {
-        "total_p9": total_p9,
-        "completed_p9": completed_p9,
-        "pending_p9": pending_p9,
-        "total_p8": total_p8,
+        "total_p9": stats["total"],
+        "completed_p9": stats["completed"],
+        "pending_p9": stats["pending"],
+        "total_p8": stats["children"],
         "status_labels": ["Completed", "Pending"],
-        "status_values": [completed_p9, pending_p9],
-        "year_labels": [x["year"] for x in yearly],
-        "year_values": [x["total"] for x in yearly],
+        "status_values": [stats["completed"], stats["pending"]],
+        "year_labels": [year for year, total in stats["yearly"]],
+        "year_values": [total for year, total in stats["yearly"]],
     })
 
-@login_required
-@role_required(['admin', 'manager', 'staff', 'viewer'])
-def p4_dashboard_filter(request):
-    filter_type = request.GET.get("type")
-    chart = request.GET.get("chart")
-    value = request.GET.get("value")
-
-    if chart == "status":
-        if value == "Completed":
-            records = P4ID.objects.filter(completed=True)
-            title = "Completed P4"
-        elif value == "Pending":
-            records = P4ID.objects.filter(completed=False)
-            title = "Pending P4"
-        else:
-            records = P4ID.objects.all()
-            title = "All P4"
-
-    elif chart == "year":
-        records = P4ID.objects.filter(
-            completed=True,
-            end_date__year=value
-        )
-        title = f"Completed P4 in {value}"
-
-    elif filter_type == "completed":
-        records = P4ID.objects.filter(completed=True)
-        title = "Completed P4"
-
-    elif filter_type == "pending":
-        records = P4ID.objects.filter(completed=False)
-        title = "Pending P4"
-
-    elif filter_type == "ms":
-        records = P4ID.objects.prefetch_related("ms_ids").all()
-        title = "MS Linked P4"
-
-    else:
-        records = P4ID.objects.all()
-        title = "All P4"
+def _milestone_filter(request, level):
+    title, records = milestone_records(
+        level,
+        filter_type=request.GET.get("type"),
+        chart=request.GET.get("chart"),
+        value=request.GET.get("value"),
+    )
 
     return render(request, "installation/filter_page.html", {
         "title": title,
         "records": records,
     })
 
-
 @login_required
 @role_required(['admin', 'manager', 'staff', 'viewer'])
-def p8_dashboard_filter(request):
-    filter_type = request.GET.get("type")
-    chart = request.GET.get("chart")
-    value = request.GET.get("value")
-
-    if chart == "status":
-        if value == "Completed":
-            records = P8ID.objects.filter(completed=True)
-            title = "Completed P8"
-        elif value == "Pending":
-            records = P8ID.objects.filter(completed=False)
-            title = "Pending P8"
-        else:
-            records = P8ID.objects.all()
-            title = "All P8"
-
-    elif chart == "year":
-        records = P8ID.objects.filter(
-            completed=True,
-            end_date__year=value
-        )
-        title = f"Completed P8 in {value}"
-
-    elif filter_type == "completed":
-        records = P8ID.objects.filter(completed=True)
-        title = "Completed P8"
-
-    elif filter_type == "pending":
-        records = P8ID.objects.filter(completed=False)
-        title = "Pending P8"
+def p4_dashboard_filter(request):
+    return _milestone_filter(request, "p4")
 
-    elif filter_type == "p4":
-        records = P8ID.objects.prefetch_related("p4_ids").all()
-        title = "P4 Linked P8"
 
-    else:
-        records = P8ID.objects.all()
-        title = "All P8"
-
-    return render(request, "installation/filter_page.html", {
-        "title": title,
-        "records": records,
-    })
+@login_required
+@role_required(['admin', 'manager', 'staff', 'viewer'])
+def p8_dashboard_filter(request):
+    return _milestone_filter(request, "p8")
 
 @login_required
 @role_required(['admin', 'manager', 'staff', 'viewer'])
 def p9_dashboard_filter(request):
-    filter_type = request.GET.get("type")
-    chart = request.GET.get("chart")
-    value = request.GET.get("value")
-
-    if chart == "status":
-        if value == "Completed":
-            records = P9ID.objects.filter(completed=True)
-            title = "Completed P9"
-        elif value == "Pending":
-            records = P9ID.objects.filter(completed=False)
-            title = "Pending P9"
-        else:
-            records = P9ID.objects.all()
-            title = "All P9"
+    return _milestone_filter(request, "p9")
 
-    elif chart == "year":
-        records = P9ID.objects.filter(
-            completed=True,
-            end_date__year=value
-        )
-        title = f"Completed P9 in {value}"
 
-    elif filter_type == "completed":
-        records = P9ID.objects.filter(completed=True)
-        title = "Completed P9"
 
-    elif filter_type == "pending":
-        records = P9ID.objects.filter(completed=False)
-        title = "Pending P9"
 
-    elif filter_type == "p8":
-        records = P9ID.objects.prefetch_related("p8_ids").all()
-        title = "P8 Linked P9"
+from .hierarchy import facility_counts, facility_hierarchy
 
-    else:
-        records = P9ID.objects.all()
-        title = "All P9"
+@login_required
+@role_required(['admin', 'manager', 'staff', 'viewer'])
+@conditional_page(FACILITY_KINDS["p4"])
+def p4_facility_dashboard(request):
 
-    return render(request, "installation/filter_page.html", {
-        "title": title,
-        "records": records,
+    return render(request, "installation/p4_facility_dashboard.html", {
+        "facilities": facility_counts("p4"),
     })
 
 
+@login_required
+@role_required(['admin', 'manager', 'staff', 'viewer'])
+@conditional_page(FACILITY_KINDS["p8"])
+def p8_facility_dashboard(request):
 
+    return render(request, "installation/p8_facility_dashboard.html", {
+        "facilities": facility_counts("p8"),
+    })
 
-from collections import defaultdict
-from django.shortcuts import render
 
 @login_required
 @role_required(['admin', 'manager', 'staff', 'viewer'])
-def p4_facility_dashboard(request):
+@conditional_page(FACILITY_KINDS["p9"])
+def p9_facility_dashboard(request):
 
-    p4_data = P4ID.objects.prefetch_related("ms_ids").all().order_by("p4_id")
+    return render(request, "installation/p9_facility_dashboard.html", {
+        "facilities": facility_counts("p9"),
+    })
 
-    facility_data = defaultdict(list)
 
-    for p4 in p4_data:
+# ================= FACILITY CARDS (LAZY) =================
+def _facility_card_rows(dashboard, facility, selected_type):
 
-        for ms in p4.ms_ids.filter(type__iexact="TB"):
+    if dashboard == "systems":
+        return facility_systems(selected_type, facility).get(facility, [])
 
-            color = "success" if p4.completed else "primary"
+    if dashboard == "all":
+        return progress_rows(
+            Installation.objects.filter(type='TB', facility=facility)
+        )
 
-            facility_data[ms.facility].append({
-                "p4_id": p4.p4_id,
-                "system": ms.system,
-                "ms_id": ms.ms_id,
-                "completed": p4.completed,
-                "color": color,
-                "p4_db_id": p4.id,
-            })
+    return facility_hierarchy(dashboard, facility).get(facility, [])
 
-    return render(request, "installation/p4_facility_dashboard.html", {
-        "facility_data": dict(facility_data),
-        
-    })
 
+FACILITY_CARD_TEMPLATES = {
+    "systems": "installation/facility_card.html",
+    "all": "installation/facility_card_all.html",
+    "p4": "installation/p4_facility_card.html",
+    "p8": "installation/p8_facility_card.html",
+    "p9": "installation/p9_facility_card.html",
+}
 
-from collections import defaultdict
-from django.shortcuts import render
 
 @login_required
 @role_required(['admin', 'manager', 'staff', 'viewer'])
-def p8_facility_dashboard(request):
-
-    p8_data = P8ID.objects.prefetch_related(
-        "p4_ids",
-        "p4_ids__ms_ids"
-    ).all().order_by("p8_id")
-
-    facility_data = defaultdict(list)
+@conditional_page(lambda request, dashboard: FACILITY_KINDS.get(dashboard, ()))
+def facility_card(request, dashboard):
+    """
+    Body of one facility card of a facility dashboard, fetched when the
+    card scrolls into view. The fragment is cached per facility version;
+    the rows are only read on a cache miss.
+    """
+
+    facility = request.GET.get("facility")
+    selected_type = request.GET.get("type", "").strip()
 
-    for p8 in p8_data:
+    if dashboard not in FACILITY_CARD_TEMPLATES or facility is None:
+        raise Http404("Unknown facility card")
+
+    # read before the rows; versions only move once a write has
+    # committed (bump_on_commit), so the rows are never older than the
+    # version the fragment is cached under
+    version = facility_versions([facility])[facility]
+
+    return render(request, FACILITY_CARD_TEMPLATES[dashboard], {
+        "facility": facility,
+        "version": version,
+        "timeout": CACHE_TIMEOUT,
+        "selected_type": selected_type,
+        "systems": functools.partial(
+            _facility_card_rows,
+            dashboard,
+            facility,
+            selected_type
+        ),
+    })
 
-        for p4 in p8.p4_ids.all():
 
-            for ms in p4.ms_ids.filter(type__iexact="TB"):
+from .closure import ancestors_of, installations_under
 
-                color = "success" if p8.completed else "primary"
+# ================= DRILL-DOWN (CLOSURE TABLE) =================
+@login_required
+@role_required(['admin', 'manager', 'staff', 'viewer'])
+def installation_ancestors(request, pk):
 
-                facility_data[ms.facility].append({
-                    "p8_id": p8.p8_id,
-                    "p4_id": p4.p4_id,
-                    "system": ms.system,
-                    "ms_id": ms.ms_id,
-                    "completed": p8.completed,
-                    "color": color,
-                    "p8_db_id": p8.id,
-                })
+    installation = get_object_or_404(Installation, pk=pk)
 
-    return render(request, "installation/p8_facility_dashboard.html", {
-        "facility_data": dict(facility_data),
+    return JsonResponse({
+        "id": installation.id,
+        "ms_id": installation.ms_id,
+        "ms_id_full": installation.ms_id_full,
+        **ancestors_of(installation.id),
     })
 
-from collections import defaultdict
-from django.shortcuts import render
 
 @login_required
 @role_required(['admin', 'manager', 'staff', 'viewer'])
-def p9_facility_dashboard(request):
+def milestone_installations(request, level, id):
 
-    p9_data = P9ID.objects.prefetch_related(
-        "p8_ids",
-        "p8_ids__p4_ids",
-        "p8_ids__p4_ids__ms_ids"
-    ).all().order_by("p9_id")
-
-    facility_data = defaultdict(list)
+    model = {
+        "p4": P4ID,
+        "p8": P8ID,
+        "p9": P9ID,
+    }[level]
 
-    for p9 in p9_data:
+    get_object_or_404(model, id=id)
 
-        for p8 in p9.p8_ids.all():
-
-            for p4 in p8.p4_ids.all():
-
-                for ms in p4.ms_ids.filter(type__iexact="TB"):
-
-                    color = "success" if p9.completed else "primary"
-
-                    facility_data[ms.facility].append({
-                        "p9_id": p9.p9_id,
-                        "p8_id": p8.p8_id,
-                        "p4_id": p4.p4_id,
-                        "system": ms.system,
-                        "ms_id": ms.ms_id,
-                        "completed": p9.completed,
-                        "color": color,
-                        "p9_db_id": p9.id,
-                    })
+    results = installations_under(level, id).values(
+        "id",
+        "ms_id",
+        "ms_id_full",
+        "facility",
+        "system",
+        "status",
+    )
 
-    return render(request, "installation/p9_facility_dashboard.html", {
-        "facility_data": dict(facility_data),
-    })
\ No newline at end of file
+    return JsonResponse({
+        "results": sorted(results, key=itemgetter("facility", "system"))
+    })